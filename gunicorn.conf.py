@@ -41,6 +41,16 @@ pythonpath = "/app/src"
 def post_fork(server, worker):
     """Called just after a worker has been forked."""
     server.log.info("Worker spawned (pid: %s)", worker.pid)
+    # Clients inherited from the master (preload_app) are dropped; the worker
+    # creates its own Milvus/OpenAI/Redis clients on first use
+    from resources.resource_manager import resource_manager
+    resource_manager.after_fork()
+
+    # Local embedding model: never loaded in the master, since torch's thread pools and
+    # OpenMP state do not survive fork and can deadlock the workers. Each worker loads its
+    # own copy in the background warm-up (RESOURCE_WARM_UP, FAQ_EMBEDDING_PRELOAD), after
+    # it starts accepting requests, so a host holds one copy per worker: WORKERS x the
+    # model's RSS (~0.5 GB float32 for the default MiniLM, ~0.15 GB with onnx-int8)
 
 def pre_fork(server, worker):
     """Called before forking a worker."""
@@ -0,0 +1,64 @@
+-- Converte conversation_history em tabela particionada por mês (RANGE em "timestamp")
+-- Para bancos criados antes do particionamento; bancos novos já nascem particionados
+-- (create_all + database.history_partitions.create_partitions no boot).
+--
+-- Rodar com a aplicação parada (os workers gravam no histórico):
+--   psql "$DATABASE_URL" -f migrations/001_partition_conversation_history.sql
+-- A tabela antiga fica como conversation_history_legacy; remova depois de conferir.
+
+BEGIN;
+
+ALTER TABLE conversation_history RENAME TO conversation_history_legacy;
+ALTER INDEX conversation_history_pkey RENAME TO conversation_history_legacy_pkey;
+ALTER SEQUENCE conversation_history_id_seq RENAME TO conversation_history_legacy_id_seq;
+
+CREATE TABLE conversation_history (
+    id BIGSERIAL NOT NULL,
+    whatsapp_number VARCHAR(20),
+    message_type VARCHAR(20),
+    content TEXT,
+    "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp");
+
+CREATE INDEX ix_conversation_history_number_timestamp
+    ON conversation_history (whatsapp_number, "timestamp" DESC);
+
+CREATE TABLE conversation_history_default PARTITION OF conversation_history DEFAULT;
+
+-- Uma partição por mês, do mês da mensagem mais antiga até 3 meses à frente
+DO $$
+DECLARE
+    month DATE;
+    last_month DATE := date_trunc('month', now())::date + INTERVAL '3 months';
+BEGIN
+    SELECT COALESCE(date_trunc('month', min("timestamp")), date_trunc('month', now()))::date
+      INTO month
+      FROM conversation_history_legacy;
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF conversation_history FOR VALUES FROM (%L) TO (%L)',
+            'conversation_history_p' || to_char(month, 'YYYY_MM'),
+            month,
+            (month + INTERVAL '1 month')::date
+        );
+        month := (month + INTERVAL '1 month')::date;
+    END LOOP;
+END $$;
+
+INSERT INTO conversation_history (id, whatsapp_number, message_type, content, "timestamp")
+SELECT id, whatsapp_number, message_type, content, COALESCE("timestamp", now())
+FROM conversation_history_legacy;
+
+SELECT setval(
+    pg_get_serial_sequence('conversation_history', 'id'),
+    (SELECT COALESCE(max(id), 0) + 1 FROM conversation_history),
+    false
+);
+
+COMMIT;
+
+ANALYZE conversation_history;
+
+-- Depois de conferir:
+-- DROP TABLE conversation_history_legacy;
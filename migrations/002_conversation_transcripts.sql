@@ -0,0 +1,41 @@
+-- Cria conversation_transcripts (um registro por número e mês) e preenche a partir de
+-- conversation_history. Bancos novos ganham a tabela no create_all, já vazia.
+--
+-- Rodar antes de subir a versão que grava transcripts (ou com a aplicação parada):
+-- meses que já tiverem transcript não são preenchidos de novo.
+--   psql "$DATABASE_URL" -f migrations/002_conversation_transcripts.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS conversation_transcripts (
+    whatsapp_number VARCHAR(20) NOT NULL,
+    month DATE NOT NULL,
+    messages JSONB NOT NULL,
+    message_count INTEGER,
+    started_at TIMESTAMP WITHOUT TIME ZONE,
+    updated_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (whatsapp_number, month)
+);
+
+-- Mensagens no formato do histórico do Redis: {type, content, timestamp ISO}
+INSERT INTO conversation_transcripts (whatsapp_number, month, messages, message_count, started_at, updated_at)
+SELECT
+    whatsapp_number,
+    date_trunc('month', "timestamp")::date,
+    jsonb_agg(
+        jsonb_build_object(
+            'type', message_type,
+            'content', content,
+            'timestamp', to_char("timestamp", 'YYYY-MM-DD"T"HH24:MI:SS.US')
+        )
+        ORDER BY "timestamp", id
+    ),
+    count(*),
+    min("timestamp"),
+    max("timestamp")
+FROM conversation_history
+WHERE whatsapp_number IS NOT NULL
+GROUP BY whatsapp_number, date_trunc('month', "timestamp")
+ON CONFLICT (whatsapp_number, month) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,134 @@
+import json
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Serialização dos valores de sessão e histórico no Redis. Os padrões não dependem do que
+# está instalado: orjson e zstandard são dependências do projeto, e um worker sem eles falha
+# na subida em vez de gravar num formato que os outros não leem
+REDIS_CODEC = os.getenv('REDIS_CODEC', 'orjson')
+# Compressão zstd de valores maiores que o limite (bytes); 'none' desliga
+REDIS_COMPRESSION = os.getenv('REDIS_COMPRESSION', 'zstd')
+REDIS_COMPRESSION_THRESHOLD = int(os.getenv('REDIS_COMPRESSION_THRESHOLD', 512))
+REDIS_COMPRESSION_LEVEL = int(os.getenv('REDIS_COMPRESSION_LEVEL', 3))
+
+# Valores binários começam com 0xFF, byte que nunca aparece em JSON/UTF-8;
+# o byte seguinte identifica o formato. Sem o prefixo o valor é JSON puro
+# (formato antigo ou valor pequeno não comprimido) e continua legível por qualquer versão.
+_HEADER = b'\xff'
+_ZSTD_JSON = b'z'
+
+# Tipos de mensagem abreviados no histórico compacto
+_MESSAGE_TYPES = {'user': 'u', 'assistant': 'a'}
+_MESSAGE_TYPES_REVERSE = {code: name for name, code in _MESSAGE_TYPES.items()}
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, default=str, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _orjson_dumps(value: Any) -> bytes:
+    # Chaves não-str (p.ex. int) viram string, como no json.dumps
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _json_loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _compact_history_item(item: Dict[str, Any]) -> List[Any]:
+    timestamp = item.get('timestamp')
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    epoch = int(timestamp.timestamp()) if isinstance(timestamp, datetime) else int(timestamp or 0)
+    message_type = item.get('type')
+    return [_MESSAGE_TYPES.get(message_type, message_type), item.get('content'), epoch]
+
+
+def _expand_history_item(value: Any) -> Dict[str, Any]:
+    if isinstance(value, dict):
+        # Formato antigo: objeto JSON com timestamp ISO
+        return value
+    message_type, content, epoch = value
+    return {
+        "type": _MESSAGE_TYPES_REVERSE.get(message_type, message_type),
+        "content": content,
+        "timestamp": datetime.fromtimestamp(epoch).isoformat()
+    }
+
+
+# Codecs disponíveis: nome -> função de serialização (a leitura é sempre JSON)
+CODECS: Dict[str, Callable[[Any], bytes]] = {'json': _json_dumps}
+if orjson:
+    CODECS['orjson'] = _orjson_dumps
+
+
+class RedisCodec:
+    """
+    Serializa valores para o Redis: JSON (orjson quando disponível) com compressão
+    zstd opcional acima de um tamanho mínimo. A leitura aceita qualquer formato já
+    gravado, inclusive o JSON do formato antigo, então a migração é transparente:
+    cada chave é convertida na próxima escrita.
+    """
+
+    def __init__(self, codec: str = REDIS_CODEC, compression: str = REDIS_COMPRESSION,
+                 threshold: int = REDIS_COMPRESSION_THRESHOLD, level: int = REDIS_COMPRESSION_LEVEL):
+        if codec not in CODECS:
+            raise ValueError(f"Codec Redis desconhecido ou não instalado: {codec}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("REDIS_COMPRESSION=zstd requer o pacote zstandard")
+        self.name = codec if compression != 'zstd' else f"{codec}+zstd"
+        self._dumps = CODECS[codec]
+        self._threshold = threshold
+        self._compressor = zstandard.ZstdCompressor(level=level) if compression == 'zstd' else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+    def encode(self, value: Any) -> bytes:
+        data = self._dumps(value)
+        if self._compressor is not None and len(data) > self._threshold:
+            compressed = self._compressor.compress(data)
+            if len(compressed) + 2 < len(data):
+                return _HEADER + _ZSTD_JSON + compressed
+        return data
+
+    def decode(self, data: Optional[bytes]) -> Any:
+        if data is None:
+            return None
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if data[:1] == _HEADER:
+            if data[1:2] == _ZSTD_JSON:
+                if self._decompressor is None:
+                    raise ValueError("Valor comprimido com zstd, mas o pacote zstandard não está instalado")
+                return _json_loads(self._decompressor.decompress(data[2:]))
+            raise ValueError(f"Formato de valor Redis desconhecido: {data[1:2]!r}")
+        return _json_loads(data)
+
+    def encode_history_item(self, item: Dict[str, Any]) -> bytes:
+        """Item do histórico compacto: [tipo abreviado, conteúdo, epoch em segundos]"""
+        return self.encode(_compact_history_item(item))
+
+    def decode_history_item(self, data: bytes) -> Dict[str, Any]:
+        """Item do histórico no formato da aplicação ({type, content, timestamp ISO})"""
+        return _expand_history_item(self.decode(data))
+
+    def encode_history(self, items: List[Dict[str, Any]]) -> bytes:
+        """Histórico inteiro em um único valor (snapshot no PostgreSQL), com itens compactos"""
+        return self.encode([_compact_history_item(item) for item in items])
+
+    def decode_history(self, data: bytes) -> List[Dict[str, Any]]:
+        return [_expand_history_item(value) for value in self.decode(data) or []]
+
+
+# Instância global
+redis_codec = RedisCodec()
@@ -0,0 +1,215 @@
+"""
+Benchmark dos formatos de sessão/histórico no Redis.
+
+Gera conversas sintéticas (sessão com os campos do lead + histórico) e compara o
+formato antigo (JSON com default=str, histórico com chaves e timestamp ISO) com os
+codecs disponíveis: tempo de encode/decode por conversa e bytes gravados,
+extrapolados para 10 mil conversas ativas:
+
+    PYTHONPATH=src python -m cache.codec_benchmark --conversations 10000 --messages 20
+
+Com --redis-url as conversas também são gravadas em um Redis de teste e o uso de
+memória (INFO used_memory) é medido por formato; as chaves são apagadas no fim:
+
+    PYTHONPATH=src python -m cache.codec_benchmark --redis-url redis://localhost:6379/15
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from cache.codec import CODECS, RedisCodec, zstandard
+
+_WORDS = (
+    "olá quero saber mais sobre o consórcio de imóvel qual o valor da parcela "
+    "como funciona o lance posso usar o fgts quanto tempo demora a contemplação "
+    "meu nome é tenho renda de mil reais por mês trabalho como autônomo"
+).split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(words))
+
+
+def build_conversations(count: int, messages: int, seed: int = 42) -> List[Tuple[Dict, List[Dict]]]:
+    """Conversas sintéticas: (sessão, histórico em ordem cronológica)"""
+    rng = random.Random(seed)
+    conversations = []
+    started = datetime(2025, 1, 1, 9, 0, 0)
+    for index in range(count):
+        number = f"55119{index:08d}"
+        session = {
+            'whatsapp_number': number,
+            'nome': f"Cliente {index}",
+            'cpf': f"{rng.randrange(10**10, 10**11)}",
+            'estado_civil': rng.choice(['solteiro', 'casado', None]),
+            'naturalidade': rng.choice(['São Paulo', 'Campinas', None]),
+            'endereco': None,
+            'email': f"cliente{index}@exemplo.com.br",
+            'nome_mae': None,
+            'renda': str(rng.randrange(2000, 20000)),
+            'profissao': rng.choice(['autônomo', 'professor', 'engenheiro']),
+            'conversation_stage': rng.choice(['inicio', 'qualificacao', 'dados']),
+            'is_complete': False,
+            'updated_at': started.isoformat(),
+        }
+        session['lead'] = {name: session[name] for name in ('whatsapp_number', 'nome', 'cpf', 'is_complete')}
+        history = []
+        for position in range(messages):
+            history.append({
+                'type': 'user' if position % 2 == 0 else 'assistant',
+                'content': _text(rng, rng.randint(4, 12) if position % 2 == 0 else rng.randint(20, 80)),
+                'timestamp': (started + timedelta(seconds=30 * position)).isoformat(),
+            })
+        conversations.append((session, history))
+    return conversations
+
+
+class LegacyFormat:
+    """Formato anterior: sessão como documento JSON inteiro, itens do histórico como objetos"""
+    name = 'legacy-json'
+
+    def session_values(self, session: Dict) -> Dict[str, bytes]:
+        return {'': json.dumps(session, default=str).encode('utf-8')}
+
+    def history_values(self, history: List[Dict]) -> List[bytes]:
+        return [json.dumps(item).encode('utf-8') for item in history]
+
+    def decode_session(self, values: Dict[str, bytes]) -> Dict:
+        return json.loads(values[''])
+
+    def decode_history(self, values: List[bytes]) -> List[Dict]:
+        return [json.loads(value) for value in values]
+
+
+class CodecFormat:
+    """Formato atual: sessão em hash (um valor por campo) e histórico compacto"""
+
+    def __init__(self, codec: RedisCodec):
+        self.codec = codec
+        self.name = codec.name
+
+    def session_values(self, session: Dict) -> Dict[str, bytes]:
+        return {name: self.codec.encode(value) for name, value in session.items()}
+
+    def history_values(self, history: List[Dict]) -> List[bytes]:
+        return [self.codec.encode_history_item(item) for item in history]
+
+    def decode_session(self, values: Dict[str, bytes]) -> Dict:
+        return {name: self.codec.decode(value) for name, value in values.items()}
+
+    def decode_history(self, values: List[bytes]) -> List[Dict]:
+        return [self.codec.decode_history_item(value) for value in values]
+
+
+def available_formats() -> List[Any]:
+    formats: List[Any] = [LegacyFormat()]
+    for codec in CODECS:
+        formats.append(CodecFormat(RedisCodec(codec, 'none')))
+        if zstandard:
+            formats.append(CodecFormat(RedisCodec(codec, 'zstd')))
+    return formats
+
+
+def _timed(function: Callable[[], Any]) -> Tuple[Any, float]:
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def benchmark_format(fmt: Any, conversations: List[Tuple[Dict, List[Dict]]]) -> Dict[str, Any]:
+    """Tempo de encode/decode e bytes de um formato sobre todas as conversas"""
+    encoded, encode_seconds = _timed(lambda: [
+        (fmt.session_values(session), fmt.history_values(history)) for session, history in conversations
+    ])
+    _, decode_seconds = _timed(lambda: [
+        (fmt.decode_session(session_values), fmt.decode_history(history_values))
+        for session_values, history_values in encoded
+    ])
+    session_bytes = sum(len(name) + len(value) for values, _ in encoded for name, value in values.items())
+    history_bytes = sum(len(value) for _, values in encoded for value in values)
+    count = len(conversations)
+    return {
+        'format': fmt.name,
+        'encode_us_per_conversation': round(encode_seconds / count * 1e6, 1),
+        'decode_us_per_conversation': round(decode_seconds / count * 1e6, 1),
+        'session_bytes_per_conversation': round(session_bytes / count, 1),
+        'history_bytes_per_conversation': round(history_bytes / count, 1),
+        'payload_mb_per_10k': round((session_bytes + history_bytes) / count * 10000 / 2**20, 2),
+        '_encoded': encoded,
+    }
+
+
+def measure_redis_memory(redis_url: str, fmt: Any, encoded: List[Tuple[Dict, List[bytes]]]) -> Optional[float]:
+    """Memória usada no Redis (MB por 10k conversas) com as conversas gravadas nesse formato"""
+    import redis
+
+    client = redis.Redis.from_url(redis_url)
+    prefix = f"codec_bench:{fmt.name}:"
+    before = client.info('memory')['used_memory']
+    pipe = client.pipeline(transaction=False)
+    for index, (session_values, history_values) in enumerate(encoded):
+        if '' in session_values:
+            pipe.set(f"{prefix}session:{index}", session_values[''])
+        else:
+            pipe.hset(f"{prefix}session:{index}", mapping=session_values)
+        pipe.rpush(f"{prefix}history:{index}", *history_values)
+        if index % 1000 == 999:
+            pipe.execute()
+    pipe.execute()
+    after = client.info('memory')['used_memory']
+
+    # Limpeza com SCAN (nunca KEYS)
+    batch = []
+    for key in client.scan_iter(match=f"{prefix}*", count=1000):
+        batch.append(key)
+        if len(batch) >= 1000:
+            client.delete(*batch)
+            batch = []
+    if batch:
+        client.delete(*batch)
+    client.close()
+    return round((after - before) / len(encoded) * 10000 / 2**20, 2)
+
+
+def print_report(rows: List[Dict[str, Any]]):
+    header = f"{'format':<14} {'enc µs':>8} {'dec µs':>8} {'session B':>10} {'history B':>10} {'MB/10k':>8} {'Redis MB/10k':>13}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        redis_mb = row.get('redis_mb_per_10k')
+        print(f"{row['format']:<14} {row['encode_us_per_conversation']:>8} {row['decode_us_per_conversation']:>8} "
+              f"{row['session_bytes_per_conversation']:>10} {row['history_bytes_per_conversation']:>10} "
+              f"{row['payload_mb_per_10k']:>8} {redis_mb if redis_mb is not None else '-':>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos codecs de sessão/histórico no Redis")
+    parser.add_argument('--conversations', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=20, help="Mensagens no histórico de cada conversa")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--redis-url', help="Redis de teste para medir memória (as chaves são apagadas no fim)")
+    parser.add_argument('--output', help="Grava o relatório em JSON neste arquivo")
+    args = parser.parse_args()
+
+    conversations = build_conversations(args.conversations, args.messages, args.seed)
+    rows = []
+    for fmt in available_formats():
+        row = benchmark_format(fmt, conversations)
+        encoded = row.pop('_encoded')
+        if args.redis_url:
+            row['redis_mb_per_10k'] = measure_redis_memory(args.redis_url, fmt, encoded)
+        rows.append(row)
+
+    print(f"{args.conversations} conversas, {args.messages} mensagens cada\n")
+    print_report(rows)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'conversations': args.conversations, 'messages': args.messages, 'rows': rows}, f, indent=2)
+        print(f"\nRelatório gravado em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from cache.codec import redis_codec
+from cache.keys import IDLE_SPILL_LOCK_KEY
+from cache.redis_session_manager import SessionRecord, redis_client
+from database.config import async_session
+from database.models import ConversationSnapshot
+from resources.resource_manager import resource_manager
+
+# Conversas sem turno há mais de N minutos saem do Redis para o PostgreSQL (opt-in). Desligado,
+# os snapshots já gravados continuam sendo restaurados na próxima mensagem
+REDIS_IDLE_SPILL = os.getenv('REDIS_IDLE_SPILL', 'false').lower() in ('1', 'true', 'yes')
+REDIS_IDLE_SPILL_MINUTES = int(os.getenv('REDIS_IDLE_SPILL_MINUTES', 30))
+# Intervalo entre varreduras (segundos) e conversas por lote
+REDIS_IDLE_SPILL_INTERVAL = int(os.getenv('REDIS_IDLE_SPILL_INTERVAL', 60))
+REDIS_IDLE_SPILL_BATCH_SIZE = int(os.getenv('REDIS_IDLE_SPILL_BATCH_SIZE', 200))
+
+
+class IdleSessionSpiller:
+    """
+    Camada fria das sessões: um sweeper em background copia as conversas ociosas
+    (sessão + histórico recente) para a tabela conversation_snapshots, um registro
+    compacto por número, e as apaga do Redis. A memória do Redis passa a acompanhar as
+    conversas ativas no momento, não o tráfego do dia.
+
+    A próxima mensagem da conversa erra no Redis e a restaura com uma única query
+    (take_snapshot: DELETE ... RETURNING pela chave primária), sem recompor o estado a
+    partir de leads_consorcio e conversation_history.
+
+    A ordem garante que nada se perde: o snapshot é gravado antes de apagar do Redis, e
+    o Redis só é apagado se a versão da sessão não mudou desde a leitura. Se a conversa
+    recebeu um turno no meio, ela fica no Redis e o snapshot é descartado. Snapshots mais
+    antigos que o TTL da sessão valem como expirados, como a sessão expiraria no Redis.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._reset()
+            resource_manager.register_fork_handler(cls._instance._reset)
+        return cls._instance
+
+    def _reset(self):
+        self._task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, Any] = {
+            'sweeps': 0,
+            'spilled': 0,
+            'kept_active': 0,
+            'restored': 0,
+            'expired_snapshots': 0,
+            'last_sweep_ms': 0.0,
+        }
+
+    def start(self, session_ttl: int):
+        """Inicia o sweeper no event loop atual (um por worker; o lock no Redis alterna entre eles)"""
+        if not REDIS_IDLE_SPILL or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run(session_ttl))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, session_ttl: int):
+        while True:
+            await asyncio.sleep(REDIS_IDLE_SPILL_INTERVAL)
+            try:
+                # Uma varredura por intervalo entre todos os workers
+                if await redis_client.acquire_lock(IDLE_SPILL_LOCK_KEY, REDIS_IDLE_SPILL_INTERVAL):
+                    await self.sweep(session_ttl)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Erro na varredura de conversas ociosas: {e}")
+
+    async def sweep(self, session_ttl: int, idle_minutes: int = REDIS_IDLE_SPILL_MINUTES) -> Dict[str, int]:
+        """
+        Retira do Redis todas as conversas ociosas há mais de `idle_minutes`, em lotes
+        Returns:
+            Contagens da varredura
+        """
+        started = time.monotonic()
+        idle_before = time.time() - idle_minutes * 60
+        spilled = kept = 0
+        while True:
+            conversations = await redis_client.idle_conversations(idle_before, REDIS_IDLE_SPILL_BATCH_SIZE)
+            if not conversations:
+                break
+
+            await self._save_snapshots(conversations)
+            results = await redis_client.spill([(number, record.version) for number, record, _, _ in conversations])
+            active = [number for (number, _, _, _), result in zip(conversations, results) if not result]
+            if active:
+                # Receberam um turno durante a varredura: o Redis continua sendo a fonte
+                await self._discard_snapshots(active)
+
+            spilled += len(conversations) - len(active)
+            kept += len(active)
+            # Um turno também atualiza o índice de atividade, então as mantidas saem da faixa
+            # ociosa; um lote sem nenhuma retirada encerra a varredura de qualquer forma
+            if len(conversations) < REDIS_IDLE_SPILL_BATCH_SIZE or len(active) == len(conversations):
+                break
+
+        expired = await self._delete_expired_snapshots(session_ttl)
+
+        self._stats['sweeps'] += 1
+        self._stats['spilled'] += spilled
+        self._stats['kept_active'] += kept
+        self._stats['expired_snapshots'] += expired
+        self._stats['last_sweep_ms'] = round((time.monotonic() - started) * 1000, 2)
+        if spilled or expired:
+            print(f"🧊 Conversas ociosas retiradas do Redis: {spilled} (mantidas: {kept}, snapshots expirados: {expired})")
+        return {'spilled': spilled, 'kept_active': kept, 'expired_snapshots': expired}
+
+    # PostgreSQL
+
+    async def _save_snapshots(self, conversations: List[Tuple[str, SessionRecord, List[Dict], float]]):
+        rows = [
+            {
+                'whatsapp_number': whatsapp_number,
+                'session': redis_codec.encode(record.data),
+                'history': redis_codec.encode_history(history),
+                'message_count': len(history),
+                'last_activity': datetime.utcfromtimestamp(last_activity),
+                'spilled_at': datetime.utcnow(),
+            }
+            for whatsapp_number, record, history, last_activity in conversations
+        ]
+        statement = insert(ConversationSnapshot).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[ConversationSnapshot.whatsapp_number],
+            set_={name: statement.excluded[name] for name in rows[0] if name != 'whatsapp_number'}
+        )
+        async with async_session() as db:
+            await db.execute(statement)
+            await db.commit()
+
+    async def _discard_snapshots(self, whatsapp_numbers: List[str]):
+        async with async_session() as db:
+            await db.execute(
+                delete(ConversationSnapshot).where(ConversationSnapshot.whatsapp_number.in_(whatsapp_numbers))
+            )
+            await db.commit()
+
+    async def _delete_expired_snapshots(self, session_ttl: int) -> int:
+        async with async_session() as db:
+            result = await db.execute(delete(ConversationSnapshot).where(
+                ConversationSnapshot.last_activity < datetime.utcnow() - timedelta(seconds=session_ttl)
+            ))
+            await db.commit()
+            return result.rowcount or 0
+
+    async def take_snapshot(self, whatsapp_number: str, session_ttl: int) -> Optional[Tuple[Dict, List[Dict]]]:
+        """
+        Remove e retorna o snapshot da conversa (sessão, histórico em ordem cronológica);
+        None se não existe ou se já passou do TTL da sessão
+        """
+        async with async_session() as db:
+            row = (await db.execute(
+                delete(ConversationSnapshot)
+                .where(ConversationSnapshot.whatsapp_number == whatsapp_number)
+                .returning(ConversationSnapshot.session, ConversationSnapshot.history,
+                           ConversationSnapshot.last_activity)
+            )).first()
+            await db.commit()
+
+        if row is None or row.last_activity < datetime.utcnow() - timedelta(seconds=session_ttl):
+            return None
+        self._stats['restored'] += 1
+        return redis_codec.decode(row.session), redis_codec.decode_history(row.history)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['enabled'] = REDIS_IDLE_SPILL
+        stats['idle_minutes'] = REDIS_IDLE_SPILL_MINUTES
+        return stats
+
+
+# Instância global
+idle_session_spiller = IdleSessionSpiller()
@@ -0,0 +1,65 @@
+import os
+from datetime import datetime
+from typing import Optional, Union
+
+# Namespace de todas as chaves da aplicação (p.ex. "line:"); não pode conter chaves { }
+REDIS_KEY_PREFIX = os.getenv('REDIS_KEY_PREFIX', '')
+# Redis Cluster: cliente de cluster, sem MULTI/EXEC e sem o L1 com tracking
+REDIS_CLUSTER = os.getenv('REDIS_CLUSTER', 'false').lower() in ('1', 'true', 'yes')
+
+# Chaves antigas sem hash tag (session:<número>, history:<número>): adotadas na primeira
+# leitura da conversa. Só existem em deploys sem cluster; desligar depois de um TTL de sessão
+REDIS_LEGACY_KEYS = os.getenv('REDIS_LEGACY_KEYS', 'true').lower() in ('1', 'true', 'yes') and not REDIS_CLUSTER
+
+if '{' in REDIS_KEY_PREFIX or '}' in REDIS_KEY_PREFIX:
+    raise ValueError("REDIS_KEY_PREFIX não pode conter hash tags ({ })")
+
+# Chaves de uma conversa: o número entre chaves é a hash tag, então sessão e histórico
+# caem no mesmo slot do cluster e podem ir juntos em pipelines e scripts
+SESSION_KEY_PREFIX = f"{REDIS_KEY_PREFIX}session:"
+HISTORY_KEY_PREFIX = f"{REDIS_KEY_PREFIX}history:"
+LEAD_KEY_PREFIX = f"{REDIS_KEY_PREFIX}lead:"
+
+# Contadores globais de atividade: hash tag própria, todos no mesmo slot
+ACTIVITY_KEY = f"{REDIS_KEY_PREFIX}{{stats}}:sessions:active"
+DAILY_ACTIVE_KEY_PREFIX = f"{REDIS_KEY_PREFIX}{{stats}}:sessions:daily:"
+# Lock do sweeper de conversas ociosas (um worker por vez)
+IDLE_SPILL_LOCK_KEY = f"{REDIS_KEY_PREFIX}{{stats}}:sessions:spill_lock"
+# Lock da manutenção das partições de conversation_history
+HISTORY_PARTITIONS_LOCK_KEY = f"{REDIS_KEY_PREFIX}{{stats}}:history:partitions_lock"
+
+# Cache de respostas do knowledge_search
+FAQ_RESULT_KEY_PREFIX = f"{REDIS_KEY_PREFIX}faq_result:"
+
+
+def session_key(whatsapp_number: str) -> str:
+    return f"{SESSION_KEY_PREFIX}{{{whatsapp_number}}}"
+
+
+def history_key(whatsapp_number: str) -> str:
+    return f"{HISTORY_KEY_PREFIX}{{{whatsapp_number}}}"
+
+
+def lead_key(whatsapp_number: str) -> str:
+    return f"{LEAD_KEY_PREFIX}{{{whatsapp_number}}}"
+
+
+def legacy_session_key(whatsapp_number: str) -> str:
+    return f"session:{whatsapp_number}"
+
+
+def legacy_history_key(whatsapp_number: str) -> str:
+    return f"history:{whatsapp_number}"
+
+
+def number_from_key(key: Union[str, bytes]) -> str:
+    """Número do WhatsApp de uma chave de sessão ou histórico (atual ou antiga)"""
+    if isinstance(key, bytes):
+        key = key.decode('utf-8')
+    if '{' not in key:
+        return key.rsplit(':', 1)[1]
+    return key.rsplit('{', 1)[1].rstrip('}')
+
+
+def daily_active_key(day: Optional[datetime] = None) -> str:
+    return f"{DAILY_ACTIVE_KEY_PREFIX}{(day or datetime.now()).strftime('%Y%m%d')}"
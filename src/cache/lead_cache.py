@@ -0,0 +1,113 @@
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, Tuple
+from sqlalchemy import select
+from cache.redis_session_manager import redis_client
+from database.config import async_session
+from database.models import LeadConsorcio
+from resources.resource_manager import resource_manager
+
+# Projeção do lead no Redis: dura mais que a sessão, para quem volta depois de dias
+LEAD_CACHE_TTL = int(os.getenv('LEAD_CACHE_TTL', 7 * 86400))
+# Lead inexistente: TTL curto, leads criados fora do webhook (CRM, importação) não passam
+# pelo write-through e só aparecem quando essa entrada expira
+LEAD_CACHE_NEGATIVE_TTL = int(os.getenv('LEAD_CACHE_NEGATIVE_TTL', 60))
+
+# Colunas de leads_consorcio na projeção (id é interno)
+LEAD_PROJECTION_COLUMNS = tuple(column.name for column in LeadConsorcio.__table__.columns if column.name != 'id')
+
+
+def lead_projection(row: Any) -> Tuple[Dict[str, Any], int]:
+    """
+    Lead do PostgreSQL (objeto ORM ou linha com as colunas) -> (projeção, versão);
+    a versão é o updated_at em microssegundos
+    """
+    lead = {}
+    for name in LEAD_PROJECTION_COLUMNS:
+        value = getattr(row, name)
+        lead[name] = value.isoformat() if isinstance(value, datetime) else value
+    updated_at = getattr(row, 'updated_at')
+    return lead, int(updated_at.timestamp() * 1_000_000) if updated_at else 1
+
+
+class LeadCache:
+    """
+    Cache read-through/write-through do lead no Redis (lead:{número}).
+
+    Leituras vão ao Redis e só no miss ao PostgreSQL, que repopula a projeção; um lead
+    inexistente também é guardado ({} na versão 0, por LEAD_CACHE_NEGATIVE_TTL) para não
+    consultar o banco a cada mensagem.
+    Cada upsert do LeadWriter regrava a projeção com a linha devolvida pelo RETURNING.
+    A versão (updated_at) protege contra corridas: uma leitura do banco mais antiga
+    que um write-through já gravado é descartada pelo script.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._reset()
+            resource_manager.register_fork_handler(cls._instance._reset)
+        return cls._instance
+
+    def _reset(self):
+        self._stats: Dict[str, int] = {
+            'hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'stale_writes': 0,
+            'errors': 0,
+        }
+
+    async def get(self, whatsapp_number: str) -> Dict[str, Any]:
+        """Projeção do lead ({} se o lead não existe no PostgreSQL)"""
+        try:
+            cached = await redis_client.get_lead(whatsapp_number)
+        except Exception as e:
+            self._stats['errors'] += 1
+            print(f"⚠️ Erro ao ler lead do Redis: {e}")
+            cached = None
+        if cached is not None:
+            self._stats['hits'] += 1
+            return cached[0]
+
+        self._stats['misses'] += 1
+        async with async_session() as db:
+            row = await db.scalar(select(LeadConsorcio).where(
+                LeadConsorcio.whatsapp_number == whatsapp_number
+            ))
+        if row is None:
+            await self._write([(whatsapp_number, {}, 0)], LEAD_CACHE_NEGATIVE_TTL)
+            return {}
+        lead, version = lead_projection(row)
+        await self._write([(whatsapp_number, lead, version)])
+        return lead
+
+    async def put(self, rows: Iterable[Any]):
+        """Write-through: regrava a projeção a partir de linhas lidas ou gravadas no PostgreSQL"""
+        await self._write([(row.whatsapp_number, *lead_projection(row)) for row in rows])
+
+    async def _write(self, leads, ttl: int = LEAD_CACHE_TTL):
+        if not leads:
+            return
+        try:
+            results = await redis_client.set_leads(leads, ttl)
+        except Exception as e:
+            # O TTL limita quanto tempo uma projeção não atualizada pode durar
+            self._stats['errors'] += 1
+            print(f"⚠️ Erro ao gravar lead no Redis: {e}")
+            return
+        written = sum(results)
+        self._stats['writes'] += written
+        self._stats['stale_writes'] += len(results) - written
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+# Instância global
+lead_cache = LeadCache()
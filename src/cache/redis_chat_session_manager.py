@@ -1,10 +1,15 @@
-import asyncio
-from typing import Dict, Optional, TYPE_CHECKING
+import time
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 from datetime import datetime, timedelta
-from dataclasses import dataclass
-from database.config import SessionLocal
-from database.models import ConversationHistory, LeadConsorcio
-from cache.redis_session_manager import redis_client
+from dataclasses import dataclass, field
+from database.config import async_session, close_async_engine
+from database.models import ChatState, ConversationHistory, ConversationTranscript, LeadConsorcio
+from sqlalchemy import String, func, select, true
+from sqlalchemy.dialects.postgresql import array
+from cache.redis_session_manager import SessionRecord, redis_client
+from cache.session_l1_cache import session_l1_cache
+from cache.idle_spill import idle_session_spiller
+from cache.lead_cache import lead_cache, lead_projection
 from crews.chat_crew.chat_flow import ChatFlow
 
 @dataclass
@@ -14,6 +19,37 @@ class SessionStats:
     redis_memory: str
     total_messages_processed: int
     avg_response_time_ms: float
+    # Bytes de sessão por escrita: documento JSON inteiro (formato antigo) vs campos alterados
+    session_bytes_per_write_full: float = 0.0
+    session_bytes_per_write: float = 0.0
+    # Contadores de atividade: turnos na última hora e números distintos no dia
+    active_last_hour: int = 0
+    daily_active: int = 0
+    # L1 por worker: hit rate, invalidações e lag de invalidação
+    l1_cache: Dict = field(default_factory=dict)
+    # Conversas ociosas retiradas do Redis e restauradas do PostgreSQL
+    idle_spill: Dict = field(default_factory=dict)
+    # Projeção do lead no Redis: hit rate e write-through
+    lead_cache: Dict = field(default_factory=dict)
+
+# Campos do lead espelhados na sessão do Redis (evita ler o PostgreSQL a cada turno)
+LEAD_FIELDS = (
+    'whatsapp_number', 'nome', 'cpf', 'estado_civil', 'naturalidade', 'endereco', 'email',
+    'nome_mae', 'renda', 'profissao', 'conversation_stage', 'is_complete', 'lead_score'
+)
+
+@dataclass
+class ConversationContext:
+    """Contexto de um turno: sessão, histórico recente e lead, lidos de uma vez"""
+    chat_flow: "ChatFlow"
+    history: List[Dict] = field(default_factory=list)
+    lead: Dict = field(default_factory=dict)
+    # Sessão como lida/gravada no Redis: versão e campos base do diff do próximo commit
+    session: Optional[SessionRecord] = None
+
+    def history_text(self, limit: Optional[int] = None) -> str:
+        messages = self.history[-limit:] if limit else self.history
+        return "\n".join(f"{msg['type']}: {msg['content']}" for msg in messages)
 
 class RedisChatSessionManager:
     """
@@ -45,47 +81,72 @@ class RedisChatSessionManager:
     async def initialize(self):
         """Inicializa conexão com Redis"""
         await redis_client.initialize()
+        # L1 opcional (REDIS_L1_CACHE): listener de invalidações no event loop do worker
+        session_l1_cache.start()
+        # Sweeper de conversas ociosas (REDIS_IDLE_SPILL)
+        idle_session_spiller.start(self.session_ttl)
         print("🚀 RedisChatSessionManager inicializado")
 
     async def get_or_create_session(self, whatsapp_number: str):
         """
         Obtém sessão existente do Redis ou cria nova carregando do PostgreSQL
         """
+        context = await self.load_context(whatsapp_number)
+        return context.chat_flow
+
+    async def load_context(self, whatsapp_number: str) -> ConversationContext:
+        """
+        Carrega sessão, histórico recente e lead em uma única ida ao Redis;
+        o PostgreSQL só é lido quando a sessão não está no cache
+        """
         start_time = datetime.now()
 
         try:
-            # Verifica se sessão existe no Redis
-            session_data = await redis_client.get_session_data(whatsapp_number)
+            cached = session_l1_cache.get(whatsapp_number)
+            if cached:
+                session, history = cached
+            else:
+                token = session_l1_cache.begin_read()
+                session, history = await redis_client.get_turn_context(whatsapp_number, self.history_limit)
+                if session and session.fields:
+                    session_l1_cache.put(whatsapp_number, session, history, token)
 
-            if session_data:
+            if session:
                 # Sessão encontrada no cache
-                chat_flow = await self._restore_session_from_redis(session_data)
-                await redis_client.extend_session_ttl(whatsapp_number, self.session_ttl)
+                # O TTL é renovado no commit_turn ao fim do turno
+                context = self._restore_session_from_redis(session.data, history)
+                context.session = session
+                if 'lead' not in session.data:
+                    # Sessão gravada antes do lead ser espelhado no Redis
+                    context.lead = await self._load_lead(whatsapp_number)
 
                 print(f"✅ Sessão restaurada do Redis: {whatsapp_number}")
 
             else:
-                # Criar nova sessão carregando do PostgreSQL
-                chat_flow = await self._create_session_from_database(whatsapp_number)
-                print(f"🆕 Nova sessão criada para: {whatsapp_number}")
+                # Conversa retirada do Redis por ociosidade: restaura do snapshot
+                context = await self._restore_spilled_session(whatsapp_number)
+                if context:
+                    print(f"♻️ Sessão restaurada do snapshot: {whatsapp_number}")
+                else:
+                    # Criar nova sessão carregando do PostgreSQL
+                    context = await self._create_session_from_database(whatsapp_number)
+                    print(f"🆕 Nova sessão criada para: {whatsapp_number}")
 
             # Atualiza estatísticas
             response_time = (datetime.now() - start_time).total_seconds() * 1000
             self._update_stats(response_time)
 
-            return chat_flow
+            return context
 
         except Exception as e:
             print(f"❌ Erro ao obter/criar sessão: {e}")
             # Fallback: cria sessão básica
-            return await self._create_fallback_session(whatsapp_number)
+            return ConversationContext(await self._create_fallback_session(whatsapp_number))
 
-    async def _restore_session_from_redis(self, session_data: Dict):
+    def _restore_session_from_redis(self, session_data: Dict, history: List[Dict]) -> ConversationContext:
         """
-        Restaura ChatFlow a partir dos dados do Redis
+        Restaura ChatFlow a partir dos dados e do histórico lidos do Redis
         """
-        from crews.chat_crew.chat_flow import ChatFlow
-
         chat_flow = ChatFlow()
 
         # Restaura estado básico
@@ -93,91 +154,238 @@ class RedisChatSessionManager:
             if hasattr(chat_flow.state, key):
                 setattr(chat_flow.state, key, value)
 
-        # Carrega histórico do Redis
-        history = await redis_client.get_conversation_history(
-            session_data['whatsapp_number'],
-            self.history_limit
-        )
-
+        context = ConversationContext(chat_flow, history, session_data.get('lead') or {})
         if history:
-            history_text = []
-            for msg in history:
-                history_text.append(f"{msg['type']}: {msg['content']}")
-            chat_flow.state.history = "\n".join(history_text)
+            chat_flow.state.history = context.history_text()
 
-        return chat_flow
+        return context
+
+    async def _restore_spilled_session(self, whatsapp_number: str) -> Optional[ConversationContext]:
+        """
+        Restaura uma conversa do snapshot gravado pelo idle spill (uma query pela chave
+        primária) e a devolve ao Redis; None se não há snapshot
+        """
+        snapshot = await idle_session_spiller.take_snapshot(whatsapp_number, self.session_ttl)
+        if snapshot is None:
+            return None
+        session_data, history = snapshot
+
+        session = None
+        try:
+            sessions = await redis_client.hydrate([(whatsapp_number, session_data, history)], self.session_ttl)
+            session = sessions[0]
+        except Exception as e:
+            # O snapshot já saiu do PostgreSQL: o commit do turno grava a sessão inteira
+            print(f"⚠️ Erro ao devolver snapshot ao Redis: {e}")
+
+        context = self._restore_session_from_redis(session_data, history[-self.history_limit:])
+        context.session = session
+        if 'lead' not in session_data:
+            context.lead = await self._load_lead(whatsapp_number)
+        return context
+
+    async def _load_lead(self, whatsapp_number: str) -> Dict:
+        """
+        Campos do lead (projeção no Redis; PostgreSQL só no miss), {} se o lead ainda não existe
+        """
+        lead = await lead_cache.get(whatsapp_number)
+        return {name: lead.get(name) for name in LEAD_FIELDS} if lead else {}
 
-    async def _create_session_from_database(self, whatsapp_number: str) -> "ChatFlow":
+    async def _create_session_from_database(self, whatsapp_number: str) -> ConversationContext:
         """
         Cria nova sessão carregando dados do PostgreSQL e salvando no Redis
         """
         chat_flow = ChatFlow()
-        db = SessionLocal()
 
         try:
-            # Carrega lead do PostgreSQL
-            lead = db.query(LeadConsorcio).filter(
-                LeadConsorcio.whatsapp_number == whatsapp_number
-            ).first()
-
+            # Lead da projeção no Redis (PostgreSQL só no miss)
+            lead = await lead_cache.get(whatsapp_number)
+            lead_data = self._apply_lead(chat_flow.state, whatsapp_number, lead)
             if lead:
-                # Lead existente
-                chat_flow.state.whatsapp_number = whatsapp_number
-                chat_flow.state.nome = lead.nome
-                chat_flow.state.cpf = lead.cpf
-                chat_flow.state.estado_civil = lead.estado_civil
-                chat_flow.state.naturalidade = lead.naturalidade
-                chat_flow.state.endereco = lead.endereco
-                chat_flow.state.email = lead.email
-                chat_flow.state.nome_mae = lead.nome_mae
-                chat_flow.state.renda = lead.renda
-                chat_flow.state.profissao = lead.profissao
-                chat_flow.state.conversation_stage = lead.conversation_stage
-                chat_flow.state.is_complete = lead.is_complete
-                chat_flow.state.lead_score = lead.lead_score
-
                 print(f"📋 Lead existente carregado: {whatsapp_number}")
             else:
-                # Novo lead
-                chat_flow.state.whatsapp_number = whatsapp_number
-                chat_flow.state.conversation_stage = "inicio"
                 print(f"🆕 Novo lead detectado: {whatsapp_number}")
 
-            # Carrega histórico do PostgreSQL
-            conversation_history = db.query(ConversationHistory)\
-                .filter(ConversationHistory.whatsapp_number == whatsapp_number)\
-                .order_by(ConversationHistory.timestamp.desc())\
-                .limit(self.history_limit).all()
-
-            if conversation_history:
-                conversation_history.reverse()
-
-                # Salva no Redis para acesso rápido
-                for msg in conversation_history:
-                    await redis_client.add_message_to_history(
-                        whatsapp_number,
-                        msg.message_type,
-                        msg.content
-                    )
+            async with async_session() as db:
+                # Carrega histórico do PostgreSQL
+                history_items = (await self._load_histories(db, [whatsapp_number])).get(whatsapp_number, [])
 
+            if history_items:
                 # Atualiza histórico no ChatFlow
-                history_text = []
-                for msg in conversation_history:
-                    history_text.append(f"{msg.message_type}: {msg.content}")
-                chat_flow.state.history = "\n".join(history_text)
+                chat_flow.state.history = ConversationContext(chat_flow, history_items).history_text()
+                print(f"💬 Histórico carregado: {len(history_items)} mensagens")
 
-                print(f"💬 Histórico carregado: {len(conversation_history)} mensagens")
+            # Salva histórico e sessão no Redis em uma única ida
+            sessions = await redis_client.hydrate(
+                [(whatsapp_number, self._session_data(chat_flow.state, lead_data), history_items)],
+                self.session_ttl
+            )
 
-            # Salva sessão no Redis
-            await self._save_session_to_redis(chat_flow)
-
-            return chat_flow
+            return ConversationContext(chat_flow, history_items, lead_data, sessions[0])
 
         except Exception as e:
             print(f"❌ Erro ao carregar do banco: {e}")
             return await self._create_fallback_session(whatsapp_number)
-        finally:
-            db.close()
+
+    @staticmethod
+    def _apply_lead(state: ChatState, whatsapp_number: str, lead: Optional[Dict]) -> Dict:
+        """
+        Preenche o estado com o lead (projeção do leads_consorcio) e retorna os campos espelhados na sessão
+        """
+        state.whatsapp_number = whatsapp_number
+        if not lead:
+            # Novo lead
+            state.conversation_stage = "inicio"
+            return {}
+
+        # Lead existente
+        state.nome = lead.get('nome')
+        state.cpf = lead.get('cpf')
+        state.estado_civil = lead.get('estado_civil')
+        state.naturalidade = lead.get('naturalidade')
+        state.endereco = lead.get('endereco')
+        state.email = lead.get('email')
+        state.nome_mae = lead.get('nome_mae')
+        state.renda = lead.get('renda')
+        state.profissao = lead.get('profissao')
+        state.conversation_stage = lead.get('conversation_stage')
+        state.is_complete = lead.get('is_complete')
+        state.lead_score = lead.get('lead_score')
+        return {name: lead.get(name) for name in LEAD_FIELDS}
+
+    async def _load_histories(self, db, whatsapp_numbers: List[str]) -> Dict[str, List[Dict]]:
+        """
+        Últimas history_limit mensagens de cada número, em ordem cronológica: os segmentos
+        mensais mais recentes de conversation_transcripts que bastam para o limite;
+        conversation_history só para números sem transcript (conversas anteriores a ele)
+        """
+        # Mensagens dos segmentos mais novos que este (0 no último mês)
+        newer = func.coalesce(func.sum(ConversationTranscript.message_count).over(
+            partition_by=ConversationTranscript.whatsapp_number,
+            order_by=ConversationTranscript.month.desc(),
+            rows=(None, -1)
+        ), 0)
+        segments = select(
+            ConversationTranscript.whatsapp_number,
+            ConversationTranscript.month,
+            ConversationTranscript.messages,
+            newer.label('newer')
+        ).where(ConversationTranscript.whatsapp_number.in_(whatsapp_numbers)).subquery()
+        rows = await db.execute(
+            select(segments.c.whatsapp_number, segments.c.messages)
+            .where(segments.c.newer < self.history_limit)
+            .order_by(segments.c.whatsapp_number, segments.c.month)
+        )
+        histories: Dict[str, List[Dict]] = {}
+        for number, messages in rows:
+            histories.setdefault(number, []).extend(messages)
+        histories = {number: messages[-self.history_limit:] for number, messages in histories.items()}
+
+        missing = [number for number in whatsapp_numbers if number not in histories]
+        if missing:
+            histories.update(await self._load_history_rows(db, missing))
+        return histories
+
+    async def _load_history_rows(self, db, whatsapp_numbers: List[str]) -> Dict[str, List[Dict]]:
+        """
+        Últimas history_limit mensagens de cada número a partir de conversation_history, em uma só query.
+        Um LATERAL ... LIMIT por número: cada um lê só history_limit entradas do índice
+        (whatsapp_number, timestamp DESC), não todo o histórico do número
+        """
+        numbers = func.unnest(array(whatsapp_numbers, type_=String))\
+            .table_valued('whatsapp_number').render_derived('numbers')
+        recent = select(
+            ConversationHistory.message_type,
+            ConversationHistory.content,
+            ConversationHistory.timestamp
+        ).where(
+            ConversationHistory.whatsapp_number == numbers.c.whatsapp_number
+        ).order_by(ConversationHistory.timestamp.desc()).limit(self.history_limit).lateral('recent')
+
+        rows = await db.execute(
+            select(numbers.c.whatsapp_number, recent.c.message_type, recent.c.content, recent.c.timestamp)
+            .select_from(numbers.join(recent, true()))
+            .order_by(numbers.c.whatsapp_number, recent.c.timestamp)
+        )
+
+        histories: Dict[str, List[Dict]] = {}
+        for number, message_type, content, timestamp in rows:
+            histories.setdefault(number, []).append(redis_client.history_item(message_type, content, timestamp))
+        return histories
+
+    async def _load_conversations(self, whatsapp_numbers: List[str]) -> List[Tuple[str, Dict, List[Dict]]]:
+        """
+        Sessão e histórico de um lote de números a partir do PostgreSQL (duas queries por lote)
+        """
+        async with async_session() as db:
+            rows = list(await db.scalars(
+                select(LeadConsorcio).where(LeadConsorcio.whatsapp_number.in_(whatsapp_numbers))
+            ))
+            histories = await self._load_histories(db, whatsapp_numbers)
+
+        # Aproveita a leitura para aquecer também a projeção dos leads
+        await lead_cache.put(rows)
+        leads = {row.whatsapp_number: lead_projection(row)[0] for row in rows}
+
+        conversations = []
+        for whatsapp_number in whatsapp_numbers:
+            state = ChatState()
+            lead_data = self._apply_lead(state, whatsapp_number, leads.get(whatsapp_number))
+            conversations.append((
+                whatsapp_number,
+                self._session_data(state, lead_data),
+                histories.get(whatsapp_number, [])
+            ))
+        return conversations
+
+    async def _recent_numbers(self, limit: int, since: Optional[datetime] = None) -> List[str]:
+        """
+        Números com mensagens mais recentes no PostgreSQL
+        """
+        last_message = func.max(ConversationHistory.timestamp).label('last_message')
+        query = select(ConversationHistory.whatsapp_number, last_message)
+        if since is not None:
+            query = query.where(ConversationHistory.timestamp >= since)
+        query = query.group_by(ConversationHistory.whatsapp_number)\
+            .order_by(last_message.desc())\
+            .limit(limit)
+        async with async_session() as db:
+            rows = await db.execute(query)
+            return [row.whatsapp_number for row in rows]
+
+    async def warm_up_from_database(self, limit: int = 1000, batch_size: int = 200,
+                                    since: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Re-hidrata no Redis as conversas mais recentes do PostgreSQL, em lotes (p.ex. após
+        um flush ou failover do Redis, antes de liberar o tráfego). Sessões que já estão
+        no Redis não são sobrescritas.
+        Args:
+            limit: Número máximo de conversas
+            batch_size: Conversas por lote (duas queries no PostgreSQL e uma ida ao Redis)
+            since: Só conversas com mensagens a partir desta data
+        Returns:
+            Contagens e duração
+        """
+        started = time.monotonic()
+        await redis_client.initialize()
+        numbers = await self._recent_numbers(limit, since)
+
+        hydrated = 0
+        for offset in range(0, len(numbers), batch_size):
+            batch = numbers[offset:offset + batch_size]
+            conversations = await self._load_conversations(batch)
+            sessions = await redis_client.hydrate(conversations, self.session_ttl)
+            hydrated += sum(1 for session in sessions if session is not None)
+            print(f"🔥 Warm-up: {offset + len(batch)}/{len(numbers)} conversas processadas")
+
+        result = {
+            'conversations': len(numbers),
+            'hydrated': hydrated,
+            'already_cached': len(numbers) - hydrated,
+            'seconds': round(time.monotonic() - started, 2)
+        }
+        print(f"✅ Warm-up concluído: {result}")
+        return result
 
     async def _create_fallback_session(self, whatsapp_number: str) -> "ChatFlow":
         """
@@ -192,29 +400,36 @@ class RedisChatSessionManager:
 
         return chat_flow
 
-    async def _save_session_to_redis(self, chat_flow: "ChatFlow"):
+    def _session_data(self, state: ChatState, lead: Optional[Dict] = None) -> Dict:
         """
-        Salva estado da sessão no Redis
+        Estado da sessão gravado no Redis (com os campos do lead no PostgreSQL, se conhecidos).
+        Sem timestamp: a atividade fica no ZSET e o turno que não muda o estado não grava campos
         """
         session_data = {
-            'whatsapp_number': chat_flow.state.whatsapp_number,
-            'nome': chat_flow.state.nome,
-            'cpf': chat_flow.state.cpf,
-            'estado_civil': chat_flow.state.estado_civil,
-            'naturalidade': chat_flow.state.naturalidade,
-            'endereco': chat_flow.state.endereco,
-            'email': chat_flow.state.email,
-            'nome_mae': chat_flow.state.nome_mae,
-            'renda': chat_flow.state.renda,
-            'profissao': chat_flow.state.profissao,
-            'conversation_stage': chat_flow.state.conversation_stage,
-            'is_complete': chat_flow.state.is_complete,
-            'updated_at': datetime.now().isoformat()
+            'whatsapp_number': state.whatsapp_number,
+            'nome': state.nome,
+            'cpf': state.cpf,
+            'estado_civil': state.estado_civil,
+            'naturalidade': state.naturalidade,
+            'endereco': state.endereco,
+            'email': state.email,
+            'nome_mae': state.nome_mae,
+            'renda': state.renda,
+            'profissao': state.profissao,
+            'conversation_stage': state.conversation_stage,
+            'is_complete': state.is_complete
         }
+        if lead is not None:
+            session_data['lead'] = lead
+        return session_data
 
+    async def _save_session_to_redis(self, chat_flow: "ChatFlow"):
+        """
+        Salva estado da sessão no Redis
+        """
         await redis_client.set_session_data(
             chat_flow.state.whatsapp_number,
-            session_data,
+            self._session_data(chat_flow.state),
             self.session_ttl
         )
 
@@ -230,6 +445,38 @@ class RedisChatSessionManager:
         """
         await redis_client.add_message_to_history(whatsapp_number, message_type, content)
 
+    def turn_message(self, message_type: str, content: str) -> Dict:
+        """
+        Mensagem do turno a gravar no commit_turn (timestamp do momento da chamada)
+        """
+        return redis_client.history_item(message_type, content)
+
+    async def commit_turn(self, context: ConversationContext, messages: List[Dict]) -> bool:
+        """
+        Grava as mensagens do turno e os campos alterados da sessão em uma única ida ao
+        Redis (substitui add_message_to_history + update_session por mensagem)
+        """
+        whatsapp_number = context.chat_flow.state.whatsapp_number
+        token = session_l1_cache.expect_write(whatsapp_number)
+        session = await redis_client.commit_turn(
+            whatsapp_number,
+            messages,
+            self._session_data(context.chat_flow.state, context.lead),
+            self.session_ttl,
+            base=context.session
+        )
+        if session is None:
+            session_l1_cache.write_failed(whatsapp_number)
+            return False
+
+        if context.session is not None and context.session.fields and session.version == context.session.version + 1:
+            # Ninguém escreveu entre a leitura e o commit: o estado gravado é exatamente este
+            history = (context.history + messages)[-self.history_limit:]
+            session_l1_cache.put(whatsapp_number, session, history, token)
+        context.session = session
+        context.history = context.history + messages
+        return True
+
     async def get_conversation_history(self, whatsapp_number: str, limit: int = 10) -> str:
         """
         Recupera histórico de conversas do Redis em formato de string
@@ -256,7 +503,7 @@ class RedisChatSessionManager:
         """
         Retorna estatísticas detalhadas
         """
-        redis_stats = await redis_client.get_stats()
+        redis_stats = await redis_client.get_stats(self.session_ttl)
 
         avg_response_time = 0.0
         if self._stats['request_count'] > 0:
@@ -267,7 +514,14 @@ class RedisChatSessionManager:
             redis_histories=redis_stats.get('active_histories', 0),
             redis_memory=redis_stats.get('redis_memory_used', 'N/A'),
             total_messages_processed=self._stats['total_messages'],
-            avg_response_time_ms=round(avg_response_time, 2)
+            avg_response_time_ms=round(avg_response_time, 2),
+            session_bytes_per_write_full=redis_stats.get('session_bytes_per_write_full', 0.0),
+            session_bytes_per_write=redis_stats.get('session_bytes_per_write', 0.0),
+            active_last_hour=redis_stats.get('active_last_hour', 0),
+            daily_active=redis_stats.get('daily_active', 0),
+            l1_cache=session_l1_cache.get_stats(),
+            idle_spill=idle_session_spiller.get_stats(),
+            lead_cache=lead_cache.get_stats()
         )
 
     def _update_stats(self, response_time_ms: float):
@@ -284,7 +538,10 @@ class RedisChatSessionManager:
         """
         Limpeza de recursos
         """
+        await session_l1_cache.stop()
+        await idle_session_spiller.stop()
         await redis_client.close()
+        await close_async_engine()
         print("🧹 RedisChatSessionManager limpo")
 
 # Instância global
@@ -1,40 +1,297 @@
 import redis.asyncio as redis
 import json
 import os
-from typing import Optional, Dict, Any, Union
+import time
+from typing import Optional, Dict, Any, List, Tuple, Union
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from redis.exceptions import NoScriptError, ResponseError
+from cache.codec import redis_codec
+from cache.keys import (
+    ACTIVITY_KEY,
+    REDIS_CLUSTER,
+    REDIS_LEGACY_KEYS,
+    SESSION_KEY_PREFIX,
+    daily_active_key,
+    history_key,
+    legacy_history_key,
+    legacy_session_key,
+    lead_key,
+    number_from_key,
+    session_key,
+)
+from resources.resource_manager import resource_manager
+
+def _create_redis_pool() -> Union[redis.Redis, redis.RedisCluster]:
+    """Cria o pool de conexões do processo atual (recriado em cada worker após o fork)"""
+    redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
+    # Respostas em bytes: sessões e histórico passam pelo codec (JSON/zstd)
+    if REDIS_CLUSTER:
+        # Descobre os nós a partir do REDIS_URL; max_connections é por nó
+        pool = redis.RedisCluster.from_url(
+            redis_url,
+            decode_responses=False,
+            max_connections=20
+        )
+        print("✅ Redis Cluster client inicializado")
+        return pool
+    pool = redis.from_url(
+        redis_url,
+        encoding="utf-8",
+        decode_responses=False,
+        max_connections=20
+    )
+    print("✅ Redis client inicializado")
+    return pool
+
+resource_manager.register('redis', _create_redis_pool)
+
+# Histórico no Redis: últimas 100 mensagens, TTL de 24h
+HISTORY_MAX_MESSAGES = 100
+HISTORY_TTL = 86400
+
+# Tentativas de gravar a sessão quando outro writer mudou a versão no meio do turno
+SESSION_WRITE_RETRIES = 3
+
+# Campo do hash da sessão com a versão (incrementada a cada escrita)
+SESSION_VERSION_FIELD = '_v'
+
+# Contadores de atividade mantidos no commit do turno (estatísticas sem varrer o keyspace):
+# sorted set número -> último turno (epoch) e HyperLogLog de números ativos por dia
+DAILY_ACTIVE_TTL = 8 * 86400  # mantém a última semana
+
+# Grava o turno atomicamente: campos alterados da sessão (se a versão bate), histórico, TTLs
+# e contadores de atividade.
+# KEYS: sessão (hash), histórico (lista), atividade (sorted set), ativos do dia (HyperLogLog);
+#       no Redis Cluster só as duas primeiras (mesmo slot) e a atividade vai à parte
+# ARGV: versão esperada (-1 ignora), TTL da sessão, TTL do histórico, máx. de mensagens,
+#       número do WhatsApp, agora (epoch), TTL dos ativos do dia,
+#       nº de campos, campo1, valor1, ..., mensagem1, mensagem2, ...
+# Retorna {1, nova versão} ou {0, versão atual} em conflito (nada é gravado)
+_COMMIT_TURN_SCRIPT = """
+local expected = tonumber(ARGV[1])
+local key_type = redis.call('TYPE', KEYS[1])['ok']
+local version = 0
+if key_type == 'hash' then
+  version = tonumber(redis.call('HGET', KEYS[1], '_v') or '0')
+end
+if expected >= 0 and version ~= expected then
+  return {0, version}
+end
+if key_type == 'string' then
+  -- Sessão no formato antigo (JSON): convertida para hash nesta escrita
+  redis.call('DEL', KEYS[1])
+end
+local n_fields = tonumber(ARGV[8])
+local first_message = 9 + 2 * n_fields
+if n_fields > 0 then
+  redis.call('HSET', KEYS[1], unpack(ARGV, 9, first_message - 1))
+end
+version = redis.call('HINCRBY', KEYS[1], '_v', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if #ARGV >= first_message then
+  redis.call('LPUSH', KEYS[2], unpack(ARGV, first_message))
+  redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[4]) - 1)
+end
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+if #KEYS >= 4 then
+  local now = tonumber(ARGV[6])
+  redis.call('ZADD', KEYS[3], now, ARGV[5])
+  -- Remove quem já expirou: a cardinalidade do sorted set é o total de sessões ativas
+  redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now - tonumber(ARGV[2]))
+  redis.call('PFADD', KEYS[4], ARGV[5])
+  redis.call('EXPIRE', KEYS[4], ARGV[7])
+end
+return {1, version}
+"""
+
+# Hidratação a partir do PostgreSQL: grava sessão e histórico só se a sessão não existe
+# (não sobrescreve uma conversa que já voltou a ter tráfego) e substitui o histórico.
+# KEYS: sessão (hash), histórico (lista), atividade (sorted set; fora no Redis Cluster)
+# ARGV: TTL da sessão, TTL do histórico, máx. de mensagens, número do WhatsApp, agora (epoch),
+#       nº de campos, campo1, valor1, ..., mensagem1, mensagem2, ... (ordem cronológica)
+# Retorna 1 se gravou, 0 se a sessão já existia
+_HYDRATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return 0
+end
+redis.call('DEL', KEYS[2])
+local n_fields = tonumber(ARGV[6])
+local first_message = 7 + 2 * n_fields
+if n_fields > 0 then
+  redis.call('HSET', KEYS[1], unpack(ARGV, 7, first_message - 1))
+end
+redis.call('HSET', KEYS[1], '_v', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+if #ARGV >= first_message then
+  redis.call('LPUSH', KEYS[2], unpack(ARGV, first_message))
+  redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[3]) - 1)
+  redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+if #KEYS >= 3 then
+  redis.call('ZADD', KEYS[3], ARGV[5], ARGV[4])
+end
+return 1
+"""
+
+# Retira do Redis uma conversa já copiada para o PostgreSQL, se ela não mudou desde a leitura.
+# KEYS: sessão (hash), histórico (lista), atividade (sorted set; fora no Redis Cluster)
+# ARGV: versão lida (0 para sessão no formato antigo), número do WhatsApp
+# Retorna 1 se apagou, 0 se a conversa recebeu um turno no meio
+_SPILL_SCRIPT = """
+local key_type = redis.call('TYPE', KEYS[1])['ok']
+local version = -1
+if key_type == 'hash' then
+  version = tonumber(redis.call('HGET', KEYS[1], '_v') or '0')
+elseif key_type == 'string' then
+  version = 0
+end
+if version ~= tonumber(ARGV[1]) then
+  return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+if #KEYS >= 3 then
+  redis.call('ZREM', KEYS[3], ARGV[2])
+end
+return 1
+"""
+
+# Adota as chaves antigas (sem hash tag) de uma conversa: renomeia sessão e histórico para
+# as chaves atuais, mantendo o TTL. Nunca sobrescreve uma sessão já gravada na chave nova.
+# KEYS: sessão nova, histórico novo, sessão antiga, histórico antigo (sem cluster: sem restrição de slot)
+# Retorna 1 se adotou, 0 se não havia sessão antiga ou a nova já existe
+_ADOPT_LEGACY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 or redis.call('EXISTS', KEYS[3]) == 0 then
+  return 0
+end
+redis.call('RENAME', KEYS[3], KEYS[1])
+if redis.call('EXISTS', KEYS[4]) == 1 then
+  redis.call('RENAME', KEYS[4], KEYS[2])
+end
+return 1
+"""
+
+# Projeção do lead (cache do leads_consorcio): grava só se a versão é mais nova que a guardada,
+# então uma leitura antiga do PostgreSQL nunca sobrescreve um write-through mais recente.
+# KEYS: lead (hash com 'lead' e '_v')
+# ARGV: versão (updated_at em microssegundos; 0 para lead inexistente), TTL, lead codificado
+# Retorna 1 se gravou, 0 se a versão guardada já é igual ou mais nova
+_SET_LEAD_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], '_v') or '-1')
+if current >= tonumber(ARGV[1]) then
+  return 0
+end
+redis.call('HSET', KEYS[1], '_v', ARGV[1], 'lead', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+@dataclass
+class SessionRecord:
+    """Sessão lida do Redis: dados, versão e campos como gravados (base para o diff)"""
+    data: Dict[str, Any]
+    version: int = 0
+    fields: Dict[str, bytes] = field(default_factory=dict)
+
+
+def _decode_session(raw: Dict[bytes, bytes]) -> Optional[SessionRecord]:
+    """Hash da sessão -> SessionRecord (None se a sessão não existe)"""
+    if not raw:
+        return None
+    fields = {name.decode('utf-8'): value for name, value in raw.items()}
+    version = int(fields.pop(SESSION_VERSION_FIELD, 0))
+    data = {}
+    for name, value in fields.items():
+        try:
+            data[name] = redis_codec.decode(value)
+        except ValueError:
+            data[name] = value.decode('utf-8', errors='replace')
+    return SessionRecord(data, version, fields)
+
+
+def _legacy_session(raw: Optional[bytes]) -> Optional[SessionRecord]:
+    """Sessão no formato antigo (JSON inteiro em uma string): sem campos base, a próxima escrita grava tudo"""
+    if not raw:
+        return None
+    return SessionRecord(redis_codec.decode(raw))
+
 
 class RedisClient:
     _instance = None
-    _pool: Optional[redis.Redis] = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
+            # Bytes de sessão por escrita: documento inteiro (SETEX antigo) vs campos alterados
+            cls._instance._write_stats = {
+                'session_writes': 0,
+                'session_bytes_full': 0,
+                'session_bytes_written': 0,
+                'session_conflicts': 0
+            }
+            # Scripts já carregados nos primários do cluster (SCRIPT LOAD vale para o servidor, não para o processo)
+            cls._instance._cluster_scripts = set()
         return cls._instance
 
+    @property
+    def _pool(self) -> redis.Redis:
+        """Pool do processo atual, criado no primeiro uso"""
+        return resource_manager.get('redis')
+
     async def initialize(self):
         """Inicializa a conexão com Redis"""
-        if self._pool is None:
-            redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
-            self._pool = redis.from_url(
-                redis_url,
-                encoding="utf-8",
-                decode_responses=True,
-                max_connections=20
-            )
-            print("✅ Redis client inicializado")
+        resource_manager.get('redis')
 
     async def close(self):
         """Fecha a conexão com Redis"""
-        if self._pool:
-            await self._pool.close()
+        pool = resource_manager.discard('redis')
+        if pool:
+            await pool.close()
             print("🔒 Redis client fechado")
 
     async def _ensure_connection(self):
         """Garante que a conexão está ativa"""
-        if self._pool is None:
-            await self.initialize()
+        await self.initialize()
+
+    def _pipeline(self, transaction: bool = False):
+        """Pipeline; no Redis Cluster sem MULTI/EXEC (as chaves de uma conversa ficam no mesmo slot)"""
+        return self._pool.pipeline(transaction=transaction and not REDIS_CLUSTER)  # type: ignore
+
+    async def _run_script_pipeline(self, source: str, calls: List[Tuple[List[str], List[Any]]]) -> list:
+        """
+        Executa o script uma vez por (keys, args) em um pipeline. O Pipeline comum carrega
+        o script antes do EVALSHA; o ClusterPipeline não, então no Redis Cluster o script é
+        carregado em todos os primários (SCRIPT LOAD) e, se um nó ainda não o tem (failover,
+        SCRIPT FLUSH), carregado de novo e o lote repetido uma vez. Os scripts chamados
+        assim são idempotentes ou protegidos por versão.
+        """
+        for attempt in range(2):
+            script = self._pool.register_script(source)  # type: ignore
+            if REDIS_CLUSTER and script.sha not in self._cluster_scripts:
+                await self._pool.script_load(source)  # type: ignore
+                self._cluster_scripts.add(script.sha)
+            try:
+                async with self._pipeline() as pipe:
+                    for keys, args in calls:
+                        await script(keys=keys, args=args, client=pipe)
+                    return await pipe.execute()
+            except NoScriptError:
+                if attempt or not REDIS_CLUSTER:
+                    raise
+                self._cluster_scripts.discard(script.sha)
+        return []
+
+    async def _record_activity(self, whatsapp_number: str, session_ttl: int):
+        """Contadores de atividade fora do script (Redis Cluster: ficam em outro slot)"""
+        now = int(time.time())
+        daily_key = daily_active_key()
+        async with self._pipeline() as pipe:
+            pipe.zadd(ACTIVITY_KEY, {whatsapp_number: now})
+            pipe.zremrangebyscore(ACTIVITY_KEY, '-inf', now - session_ttl)
+            pipe.pfadd(daily_key, whatsapp_number)
+            pipe.expire(daily_key, DAILY_ACTIVE_TTL)
+            await pipe.execute()
 
     async def set_session_data(self, whatsapp_number: str, data: Dict[str, Any], ttl: int = 86400):
         """
@@ -44,15 +301,8 @@ class RedisClient:
             data: Dados da sessão
             ttl: Time to live em segundos (default: 24h)
         """
-        try:
-            await self._ensure_connection()
-            key = f"session:{whatsapp_number}"
-            serialized_data = json.dumps(data, default=str)
-            await self._pool.setex(key, ttl, serialized_data)  # type: ignore
-            return True
-        except Exception as e:
-            print(f"❌ Erro ao salvar sessão no Redis: {e}")
-            return False
+        result = await self.commit_turn(whatsapp_number, [], data, ttl)
+        return result is not None
 
     async def get_session_data(self, whatsapp_number: str) -> Optional[Dict[str, Any]]:
         """
@@ -64,15 +314,21 @@ class RedisClient:
         """
         try:
             await self._ensure_connection()
-            key = f"session:{whatsapp_number}"
-            data = await self._pool.get(key)  # type: ignore
-            if data:
-                return json.loads(data)
-            return None
+            record = await self._read_session(whatsapp_number)
+            return record.data if record else None
         except Exception as e:
             print(f"❌ Erro ao recuperar sessão do Redis: {e}")
             return None
 
+    async def _read_session(self, whatsapp_number: str) -> Optional[SessionRecord]:
+        key = session_key(whatsapp_number)
+        try:
+            return _decode_session(await self._pool.hgetall(key))  # type: ignore
+        except ResponseError as e:
+            if 'WRONGTYPE' not in str(e):
+                raise
+            return _legacy_session(await self._pool.get(key))  # type: ignore
+
     async def delete_session(self, whatsapp_number: str) -> bool:
         """
         Remove sessão do Redis
@@ -83,8 +339,11 @@ class RedisClient:
         """
         try:
             await self._ensure_connection()
-            key = f"session:{whatsapp_number}"
-            result = await self._pool.delete(key)  # type: ignore
+            key = session_key(whatsapp_number)
+            async with self._pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.zrem(ACTIVITY_KEY, whatsapp_number)
+                result, _ = await pipe.execute()
             return result > 0
         except Exception as e:
             print(f"❌ Erro ao deletar sessão do Redis: {e}")
@@ -101,7 +360,7 @@ class RedisClient:
         """
         try:
             await self._ensure_connection()
-            key = f"session:{whatsapp_number}"
+            key = session_key(whatsapp_number)
             result = await self._pool.expire(key, ttl)  # type: ignore
             return result
         except Exception as e:
@@ -118,7 +377,7 @@ class RedisClient:
         """
         try:
             await self._ensure_connection()
-            key = f"session:{whatsapp_number}"
+            key = session_key(whatsapp_number)
             result = await self._pool.exists(key)  # type: ignore
             return result > 0
         except Exception as e:
@@ -135,22 +394,262 @@ class RedisClient:
         """
         try:
             await self._ensure_connection()
-            key = f"history:{whatsapp_number}"
-            timestamp = datetime.now().isoformat()
-            message_data = {
-                "type": message_type,
-                "content": content,
-                "timestamp": timestamp
-            }
+            key = history_key(whatsapp_number)
+            message_data = self.history_item(message_type, content)
 
-            # Adiciona à lista e mantém apenas as últimas 100 mensagens
-            await self._pool.lpush(key, json.dumps(message_data))  # type: ignore
-            await self._pool.ltrim(key, 0, 99)  # type: ignore
-            await self._pool.expire(key, 86400)  # type: ignore  # TTL de 24h
+            # Adiciona à lista e mantém apenas as últimas 100 mensagens (uma ida ao Redis)
+            async with self._pipeline(transaction=True) as pipe:
+                pipe.lpush(key, redis_codec.encode_history_item(message_data))
+                pipe.ltrim(key, 0, HISTORY_MAX_MESSAGES - 1)
+                pipe.expire(key, HISTORY_TTL)  # TTL de 24h
+                await pipe.execute()
 
         except Exception as e:
             print(f"❌ Erro ao adicionar mensagem ao histórico: {e}")
 
+    @staticmethod
+    def history_item(message_type: str, content: str, timestamp: Optional[datetime] = None) -> Dict[str, str]:
+        """Item do histórico no formato gravado no Redis"""
+        return {
+            "type": message_type,
+            "content": content,
+            "timestamp": (timestamp or datetime.now()).isoformat()
+        }
+
+    async def commit_turn(self, whatsapp_number: str, messages: List[Dict[str, str]],
+                          session_data: Optional[Dict[str, Any]] = None, session_ttl: int = 86400,
+                          base: Optional[SessionRecord] = None) -> Optional[SessionRecord]:
+        """
+        Grava um turno inteiro em uma única ida ao Redis (script Lua): adiciona as
+        mensagens ao histórico, mantém as últimas 100, renova os TTLs e grava na sessão
+        só os campos que mudaram em relação a `base`.
+
+        Com `base`, a escrita só acontece se a versão da sessão ainda for a lida; se
+        outro writer gravou no meio do turno, a sessão é relida e as alterações deste
+        turno são reaplicadas sobre ela, sem apagar os campos que o outro mudou.
+        Args:
+            whatsapp_number: Número do WhatsApp
+            messages: Itens do histórico em ordem cronológica (ver history_item)
+            session_data: Dados da sessão (None mantém a sessão atual)
+            session_ttl: TTL da sessão em segundos
+            base: Sessão como foi lida no início do turno (None grava todos os campos)
+        Returns:
+            Sessão como ficou gravada (base do próximo diff) ou None em caso de erro
+        """
+        try:
+            await self._ensure_connection()
+            keys = [session_key(whatsapp_number), history_key(whatsapp_number)]
+            if not REDIS_CLUSTER:
+                keys += [ACTIVITY_KEY, daily_active_key()]
+            encoded = {name: redis_codec.encode(value) for name, value in (session_data or {}).items()}
+            base_fields = base.fields if base else {}
+            changes = {name: value for name, value in encoded.items() if base_fields.get(name) != value}
+            expected_version = base.version if base else -1
+            script = self._pool.register_script(_COMMIT_TURN_SCRIPT)  # type: ignore
+            # LPUSH com vários valores insere na ordem: a mais recente fica no início
+            message_args = [redis_codec.encode_history_item(message) for message in messages]
+
+            for attempt in range(SESSION_WRITE_RETRIES + 1):
+                if attempt == SESSION_WRITE_RETRIES:
+                    # Última tentativa sem checar versão: o turno não pode se perder
+                    expected_version = -1
+                    print(f"⚠️ Sessão {whatsapp_number} em conflito após {attempt} tentativas; gravando sem versão")
+
+                fields_args = [item for pair in changes.items() for item in pair]
+                ok, version = await script(
+                    keys=keys,
+                    args=[expected_version, session_ttl, HISTORY_TTL, HISTORY_MAX_MESSAGES,
+                          whatsapp_number, int(time.time()), DAILY_ACTIVE_TTL,
+                          len(changes), *fields_args, *message_args]
+                )
+                if ok:
+                    if REDIS_CLUSTER:
+                        await self._record_activity(whatsapp_number, session_ttl)
+                    self._record_session_write(session_data, changes)
+                    return SessionRecord(
+                        {**(base.data if base else {}), **{name: session_data[name] for name in changes}},
+                        int(version),
+                        {**base_fields, **changes}
+                    )
+
+                # Conflito: rebase das alterações deste turno sobre a sessão atual
+                self._write_stats['session_conflicts'] += 1
+                base = await self._read_session(whatsapp_number)
+                if base is None or not base.fields:
+                    # Sessão expirou ou está no formato antigo: grava todos os campos
+                    base = SessionRecord({}, base.version if base else 0)
+                    changes = dict(encoded)
+                base_fields = base.fields
+                expected_version = base.version
+
+            return None
+        except Exception as e:
+            print(f"❌ Erro ao gravar turno no Redis: {e}")
+            return None
+
+    async def hydrate(self, conversations: List[Tuple[str, Dict[str, Any], List[Dict[str, str]]]],
+                      session_ttl: int = 86400) -> List[Optional[SessionRecord]]:
+        """
+        Grava conversas carregadas do PostgreSQL em uma única ida ao Redis (pipeline com
+        um script por conversa). Conversas cuja sessão já existe no Redis não são tocadas.
+        Args:
+            conversations: (número, dados da sessão, histórico em ordem cronológica)
+            session_ttl: TTL da sessão em segundos
+        Returns:
+            Sessão gravada de cada conversa, na mesma ordem (None se já existia)
+        """
+        if not conversations:
+            return []
+        await self._ensure_connection()
+        now = int(time.time())
+        encoded_sessions = []
+        calls = []
+        for whatsapp_number, session_data, messages in conversations:
+            encoded = {name: redis_codec.encode(value) for name, value in session_data.items()}
+            encoded_sessions.append(encoded)
+            keys = [session_key(whatsapp_number), history_key(whatsapp_number)]
+            calls.append((
+                keys if REDIS_CLUSTER else keys + [ACTIVITY_KEY],
+                [session_ttl, HISTORY_TTL, HISTORY_MAX_MESSAGES, whatsapp_number, now, len(encoded),
+                 *[item for pair in encoded.items() for item in pair],
+                 *[redis_codec.encode_history_item(message) for message in messages]]
+            ))
+        results = await self._run_script_pipeline(_HYDRATE_SCRIPT, calls)
+
+        if REDIS_CLUSTER:
+            written = {number: now for (number, _, _), result in zip(conversations, results) if result}
+            if written:
+                await self._pool.zadd(ACTIVITY_KEY, written)  # type: ignore
+
+        return [
+            SessionRecord(dict(session_data), 1, encoded) if written else None
+            for (_, session_data, _), encoded, written in zip(conversations, encoded_sessions, results)
+        ]
+
+    async def acquire_lock(self, key: str, ttl: int) -> bool:
+        """Lock simples entre workers (SET NX EX); expira sozinho após `ttl` segundos"""
+        await self._ensure_connection()
+        return bool(await self._pool.set(key, os.getpid(), nx=True, ex=ttl))  # type: ignore
+
+    async def idle_conversations(self, idle_before: float,
+                                 limit: int = 200) -> List[Tuple[str, SessionRecord, list, float]]:
+        """
+        Conversas sem turno desde `idle_before`, lidas do índice de atividade, com a
+        sessão e o histórico completo (uma ida ao Redis para o lote). Números cuja
+        sessão já expirou são removidos do índice e não entram no resultado.
+        Args:
+            idle_before: Epoch do último turno aceito como ocioso
+            limit: Tamanho do lote
+        Returns:
+            (número, sessão, histórico em ordem cronológica, epoch do último turno)
+        """
+        await self._ensure_connection()
+        entries = await self._pool.zrangebyscore(  # type: ignore
+            ACTIVITY_KEY, '-inf', idle_before, start=0, num=limit, withscores=True
+        )
+        if not entries:
+            return []
+
+        numbers = [member.decode('utf-8') if isinstance(member, bytes) else member for member, _ in entries]
+        async with self._pipeline() as pipe:
+            for whatsapp_number in numbers:
+                pipe.hgetall(session_key(whatsapp_number))
+                pipe.lrange(history_key(whatsapp_number), 0, HISTORY_MAX_MESSAGES - 1)
+            results = await pipe.execute(raise_on_error=False)
+
+        conversations = []
+        expired = []
+        for index, (whatsapp_number, (_, last_activity)) in enumerate(zip(numbers, entries)):
+            session_raw, messages = results[2 * index], results[2 * index + 1]
+            if isinstance(messages, Exception):
+                raise messages
+            if isinstance(session_raw, ResponseError) and 'WRONGTYPE' in str(session_raw):
+                record = _legacy_session(await self._pool.get(session_key(whatsapp_number)))  # type: ignore
+            elif isinstance(session_raw, Exception):
+                raise session_raw
+            else:
+                record = _decode_session(session_raw)
+            if record is None:
+                expired.append(whatsapp_number)
+                continue
+            conversations.append((whatsapp_number, record, self._parse_history(messages), last_activity))
+
+        if expired:
+            await self._pool.zrem(ACTIVITY_KEY, *expired)  # type: ignore
+        return conversations
+
+    async def spill(self, conversations: List[Tuple[str, int]]) -> List[bool]:
+        """
+        Apaga do Redis conversas já copiadas para o PostgreSQL (pipeline com um script
+        por conversa); uma conversa que recebeu um turno depois da leitura é mantida.
+        Args:
+            conversations: (número, versão da sessão lida em idle_conversations)
+        Returns:
+            Se cada conversa foi apagada, na mesma ordem
+        """
+        if not conversations:
+            return []
+        await self._ensure_connection()
+        calls = []
+        for whatsapp_number, version in conversations:
+            keys = [session_key(whatsapp_number), history_key(whatsapp_number)]
+            calls.append((keys if REDIS_CLUSTER else keys + [ACTIVITY_KEY], [version, whatsapp_number]))
+        results = [bool(result) for result in await self._run_script_pipeline(_SPILL_SCRIPT, calls)]
+
+        if REDIS_CLUSTER:
+            spilled = [number for (number, _), result in zip(conversations, results) if result]
+            if spilled:
+                await self._pool.zrem(ACTIVITY_KEY, *spilled)  # type: ignore
+        return results
+
+    async def get_lead(self, whatsapp_number: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """
+        Projeção do lead no Redis
+        Returns:
+            (lead, versão) ou None se não está no cache; lead {} é um lead inexistente no PostgreSQL
+        """
+        await self._ensure_connection()
+        data, version = await self._pool.hmget(lead_key(whatsapp_number), ['lead', SESSION_VERSION_FIELD])  # type: ignore
+        if data is None:
+            return None
+        return redis_codec.decode(data), int(version or 0)
+
+    async def set_leads(self, leads: List[Tuple[str, Dict[str, Any], int]], ttl: int) -> List[bool]:
+        """
+        Grava projeções de lead (pipeline, uma por número) se a versão for mais nova
+        Args:
+            leads: (número, lead, versão)
+            ttl: TTL da projeção em segundos
+        Returns:
+            Se cada projeção foi gravada, na mesma ordem
+        """
+        if not leads:
+            return []
+        await self._ensure_connection()
+        results = await self._run_script_pipeline(_SET_LEAD_SCRIPT, [
+            ([lead_key(whatsapp_number)], [version, ttl, redis_codec.encode(lead)])
+            for whatsapp_number, lead, version in leads
+        ])
+        return [bool(result) for result in results]
+
+    def _record_session_write(self, session_data: Optional[Dict[str, Any]], changes: Dict[str, bytes]):
+        if not session_data:
+            return
+        self._write_stats['session_writes'] += 1
+        # O formato antigo gravava o documento JSON inteiro a cada turno
+        self._write_stats['session_bytes_full'] += len(json.dumps(session_data, default=str).encode('utf-8'))
+        self._write_stats['session_bytes_written'] += sum(
+            len(name.encode('utf-8')) + len(value) for name, value in changes.items()
+        )
+
+    def get_write_stats(self) -> Dict[str, Any]:
+        """Bytes de sessão gravados por escrita: documento inteiro (antes) vs campos alterados (agora)"""
+        stats: Dict[str, Any] = dict(self._write_stats)
+        writes = stats['session_writes']
+        stats['session_bytes_per_write_full'] = round(stats['session_bytes_full'] / writes, 1) if writes else 0.0
+        stats['session_bytes_per_write'] = round(stats['session_bytes_written'] / writes, 1) if writes else 0.0
+        return stats
+
     async def get_conversation_history(self, whatsapp_number: str, limit: int = 50) -> list:
         """
         Recupera histórico de conversas do Redis
@@ -162,46 +661,155 @@ class RedisClient:
         """
         try:
             await self._ensure_connection()
-            key = f"history:{whatsapp_number}"
+            key = history_key(whatsapp_number)
             messages = await self._pool.lrange(key, 0, limit - 1)  # type: ignore
-
-            # Converte de JSON e inverte a ordem (mais antigas primeira)
-            history = []
-            for msg in reversed(messages):
-                try:
-                    history.append(json.loads(msg))
-                except json.JSONDecodeError:
-                    continue
-
-            return history
+            return self._parse_history(messages)
         except Exception as e:
             print(f"❌ Erro ao recuperar histórico: {e}")
             return []
 
-    async def get_stats(self) -> Dict[str, Any]:
+    @staticmethod
+    def _parse_history(messages: list) -> list:
+        """Decodifica (formato compacto ou JSON antigo) e inverte a ordem (mais antigas primeiro)"""
+        history = []
+        for msg in reversed(messages):
+            try:
+                history.append(redis_codec.decode_history_item(msg))
+            except (ValueError, TypeError):
+                continue
+        return history
+
+    async def get_turn_context(self, whatsapp_number: str,
+                               history_limit: int = 10) -> Tuple[Optional[SessionRecord], list]:
         """
-        Retorna estatísticas do Redis
+        Sessão e histórico recente em uma única ida ao Redis (pipeline)
+        Args:
+            whatsapp_number: Número do WhatsApp
+            history_limit: Limite de mensagens do histórico
+        Returns:
+            (sessão ou None, mensagens em ordem cronológica)
+        """
+        record, history = await self._read_turn_context(whatsapp_number, history_limit)
+        if record is None and REDIS_LEGACY_KEYS and await self._adopt_legacy_keys(whatsapp_number):
+            # Conversa gravada com as chaves antigas: agora nas chaves atuais
+            record, history = await self._read_turn_context(whatsapp_number, history_limit)
+        return record, history
+
+    async def _adopt_legacy_keys(self, whatsapp_number: str) -> bool:
+        await self._ensure_connection()
+        script = self._pool.register_script(_ADOPT_LEGACY_SCRIPT)  # type: ignore
+        return bool(await script(keys=[
+            session_key(whatsapp_number), history_key(whatsapp_number),
+            legacy_session_key(whatsapp_number), legacy_history_key(whatsapp_number)
+        ]))
+
+    async def _read_turn_context(self, whatsapp_number: str,
+                                 history_limit: int) -> Tuple[Optional[SessionRecord], list]:
+        await self._ensure_connection()
+        async with self._pipeline() as pipe:
+            pipe.hgetall(session_key(whatsapp_number))
+            pipe.lrange(history_key(whatsapp_number), 0, history_limit - 1)
+            session_raw, messages = await pipe.execute(raise_on_error=False)
+
+        if isinstance(messages, Exception):
+            raise messages
+        if isinstance(session_raw, ResponseError) and 'WRONGTYPE' in str(session_raw):
+            # Sessão ainda no formato antigo (string JSON); convertida no próximo commit_turn
+            record = _legacy_session(await self._pool.get(session_key(whatsapp_number)))  # type: ignore
+        elif isinstance(session_raw, Exception):
+            raise session_raw
+        else:
+            record = _decode_session(session_raw)
+        return record, self._parse_history(messages)
+
+    async def get_stats(self, session_ttl: int = 86400) -> Dict[str, Any]:
+        """
+        Retorna estatísticas do Redis a partir dos contadores de atividade
+        (O(log N), sem KEYS: seguro para coletar a cada poucos segundos)
         Returns:
             Dicionário com estatísticas
         """
         try:
             await self._ensure_connection()
-            info = await self._pool.info()  # type: ignore
+            now = time.time()
+            # Contadores no mesmo slot ({stats}): um pipeline também no cluster
+            async with self._pipeline() as pipe:
+                pipe.zcount(ACTIVITY_KEY, now - session_ttl, '+inf')
+                pipe.zcount(ACTIVITY_KEY, now - HISTORY_TTL, '+inf')
+                pipe.zcount(ACTIVITY_KEY, now - 3600, '+inf')
+                pipe.pfcount(daily_active_key())
+                active_sessions, active_histories, active_last_hour, daily_active = await pipe.execute()
 
-            # Conta sessões ativas
-            session_keys = await self._pool.keys("session:*")  # type: ignore
-            history_keys = await self._pool.keys("history:*")  # type: ignore
+            return {
+                "active_sessions": active_sessions,
+                "active_histories": active_histories,
+                "active_last_hour": active_last_hour,
+                "daily_active": daily_active,
+                **await self._server_info(),
+                **self.get_write_stats()
+            }
+        except Exception as e:
+            print(f"❌ Erro ao obter estatísticas: {e}")
+            return {}
 
+    async def _server_info(self) -> Dict[str, Any]:
+        """Memória, clientes e versão do Redis (somados entre os primários no cluster)"""
+        if not REDIS_CLUSTER:
+            info = await self._pool.info()  # type: ignore
             return {
-                "active_sessions": len(session_keys),
-                "active_histories": len(history_keys),
                 "redis_memory_used": info.get('used_memory_human', 'N/A'),
                 "connected_clients": info.get('connected_clients', 0),
                 "redis_version": info.get('redis_version', 'N/A')
             }
-        except Exception as e:
-            print(f"❌ Erro ao obter estatísticas: {e}")
-            return {}
+
+        infos = await self._pool.info(target_nodes=redis.RedisCluster.PRIMARIES)  # type: ignore
+        nodes = list(infos.values()) if all(isinstance(value, dict) for value in infos.values()) else [infos]
+        used_memory = sum(node.get('used_memory', 0) for node in nodes)
+        return {
+            "redis_memory_used": f"{used_memory / 2**20:.2f}M",
+            "connected_clients": sum(node.get('connected_clients', 0) for node in nodes),
+            "redis_version": nodes[0].get('redis_version', 'N/A') if nodes else 'N/A',
+            "cluster_nodes": len(nodes)
+        }
+
+    async def rebuild_activity_index(self, session_ttl: int = 86400, batch_size: int = 500) -> int:
+        """
+        Reconstrói o sorted set de atividade a partir das sessões existentes (SCAN,
+        nunca KEYS). Uso em manutenção, p.ex. sessões criadas antes dos contadores.
+        Args:
+            session_ttl: TTL das sessões (o último turno é estimado pelo TTL restante)
+            batch_size: Chaves por iteração do SCAN
+        Returns:
+            Número de sessões indexadas
+        """
+        await self._ensure_connection()
+        now = time.time()
+        indexed = 0
+        batch: List[str] = []
+
+        async def flush():
+            async with self._pipeline() as pipe:
+                for key in batch:
+                    pipe.ttl(key)
+                ttls = await pipe.execute()
+            scores = {
+                number_from_key(key): now - (session_ttl - ttl)
+                for key, ttl in zip(batch, ttls) if ttl and ttl > 0
+            }
+            if scores:
+                await self._pool.zadd(ACTIVITY_KEY, scores)  # type: ignore
+            batch.clear()
+            return len(scores)
+
+        async for key in self._pool.scan_iter(match=f"{SESSION_KEY_PREFIX}*", count=batch_size):  # type: ignore
+            batch.append(key)
+            if len(batch) >= batch_size:
+                indexed += await flush()
+        if batch:
+            indexed += await flush()
+
+        print(f"📇 Índice de atividade reconstruído: {indexed} sessões")
+        return indexed
 
 # Instância global
 redis_client = RedisClient()
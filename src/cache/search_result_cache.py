@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+import redis
+from cache.keys import FAQ_RESULT_KEY_PREFIX, REDIS_CLUSTER
+from knowledge.lexical_index import fold_accents
+from resources.resource_manager import resource_manager
+
+logger = logging.getLogger(__name__)
+
+# Cache das respostas formatadas do knowledge_search
+FAQ_RESULT_CACHE = os.getenv('FAQ_RESULT_CACHE', 'true').lower() in ('1', 'true', 'yes')
+FAQ_RESULT_CACHE_SIZE = int(os.getenv('FAQ_RESULT_CACHE_SIZE', 1024))  # entradas no LRU local
+FAQ_RESULT_CACHE_TTL = int(os.getenv('FAQ_RESULT_CACHE_TTL', 86400))  # segundos no Redis
+FAQ_RESULT_CACHE_REDIS = os.getenv('FAQ_RESULT_CACHE_REDIS', 'true').lower() in ('1', 'true', 'yes')
+# A busca não pode ficar esperando o Redis: acima disso conta como miss
+FAQ_RESULT_CACHE_REDIS_TIMEOUT = float(os.getenv('FAQ_RESULT_CACHE_REDIS_TIMEOUT', 0.1))
+
+_WORDS = re.compile(r'[a-z0-9]+')
+
+
+def normalize_query(query: str) -> str:
+    """Minúsculas, sem acentos nem pontuação: "Como funciona o lance?" == "como funciona o lance" """
+    return ' '.join(_WORDS.findall(fold_accents(query or '')))
+
+
+def _create_sync_redis() -> Union[redis.Redis, redis.RedisCluster]:
+    """Cliente Redis síncrono (a tool roda fora do event loop)"""
+    redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
+    client_class = redis.RedisCluster if REDIS_CLUSTER else redis.Redis
+    return client_class.from_url(
+        redis_url,
+        decode_responses=True,
+        socket_timeout=FAQ_RESULT_CACHE_REDIS_TIMEOUT,
+        socket_connect_timeout=FAQ_RESULT_CACHE_REDIS_TIMEOUT
+    )
+
+resource_manager.register('redis_sync', _create_sync_redis)
+
+
+class SearchResultCache:
+    """
+    Cache em dois níveis das respostas do knowledge_search: LRU em memória do
+    processo e Redis compartilhado entre os workers.
+
+    A chave inclui a versão do índice, então um re-index invalida tudo sozinho:
+    o LRU local é limpo na troca de versão e as chaves antigas expiram no Redis.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._reset()
+            resource_manager.register_fork_handler(cls._instance._reset)
+        return cls._instance
+
+    def _reset(self):
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Contadores por arquivo de perfil (source_file)
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def make_key(query: str, source_file: Optional[str], index_version: str) -> str:
+        digest = hashlib.sha1(f"{normalize_query(query)}\x1f{source_file or ''}".encode('utf-8')).hexdigest()
+        return f"{FAQ_RESULT_KEY_PREFIX}{index_version}:{digest}"
+
+    def _count(self, source_file: Optional[str], counter: str):
+        with self._lock:
+            stats = self._stats.setdefault(source_file or '(all)', {'local_hits': 0, 'redis_hits': 0, 'misses': 0})
+            stats[counter] += 1
+
+    def get(self, query: str, source_file: Optional[str], index_version: str) -> Optional[str]:
+        """Resposta formatada em cache (LRU local primeiro, depois Redis) ou None"""
+        if not FAQ_RESULT_CACHE:
+            return None
+
+        key = self.make_key(query, source_file, index_version)
+        with self._lock:
+            output = self._entries.get(key)
+            if output is not None:
+                self._entries.move_to_end(key)
+        if output is not None:
+            self._count(source_file, 'local_hits')
+            return output
+
+        if FAQ_RESULT_CACHE_REDIS:
+            try:
+                output = resource_manager.get('redis_sync').get(key)
+            except Exception as e:
+                logger.warning(f"Result cache: Redis indisponível ({e})")
+                output = None
+            if output is not None:
+                self._store_local(key, output)
+                self._count(source_file, 'redis_hits')
+                return output
+
+        self._count(source_file, 'misses')
+        return None
+
+    def set(self, query: str, source_file: Optional[str], index_version: str, output: str):
+        if not FAQ_RESULT_CACHE:
+            return
+
+        key = self.make_key(query, source_file, index_version)
+        self._store_local(key, output)
+        if FAQ_RESULT_CACHE_REDIS:
+            try:
+                resource_manager.get('redis_sync').setex(key, FAQ_RESULT_CACHE_TTL, output)
+            except Exception as e:
+                logger.warning(f"Result cache: falha ao gravar no Redis ({e})")
+
+    def _store_local(self, key: str, output: str):
+        with self._lock:
+            self._entries[key] = output
+            self._entries.move_to_end(key)
+            while len(self._entries) > FAQ_RESULT_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear_local(self):
+        """Descarta o LRU local (troca de versão do índice)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Hits/misses por arquivo de perfil, com hit rate"""
+        with self._lock:
+            stats = {name: dict(counters) for name, counters in self._stats.items()}
+        for counters in stats.values():
+            total = counters['local_hits'] + counters['redis_hits'] + counters['misses']
+            hits = counters['local_hits'] + counters['redis_hits']
+            counters['hit_rate'] = round(hits / total, 3) if total else 0.0
+        return stats
+
+
+# Instância global
+search_result_cache = SearchResultCache()
@@ -0,0 +1,294 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import redis.asyncio as redis
+from cache.keys import (
+    HISTORY_KEY_PREFIX,
+    REDIS_CLUSTER,
+    SESSION_KEY_PREFIX,
+    history_key,
+    number_from_key,
+    session_key,
+)
+from cache.redis_session_manager import SessionRecord
+from resources.resource_manager import resource_manager
+
+# Cache L1 (memória do worker) de sessão + histórico recente, coerente via invalidação do Redis
+REDIS_L1_CACHE = os.getenv('REDIS_L1_CACHE', 'false').lower() in ('1', 'true', 'yes')
+REDIS_L1_MAX_ENTRIES = int(os.getenv('REDIS_L1_MAX_ENTRIES', 5000))
+REDIS_L1_MAX_BYTES = int(os.getenv('REDIS_L1_MAX_BYTES', 32 * 1024 * 1024))
+# Intervalo do PING de saúde da conexão de tracking (segundos)
+REDIS_L1_HEALTH_CHECK_INTERVAL = float(os.getenv('REDIS_L1_HEALTH_CHECK_INTERVAL', 5))
+
+_INVALIDATE_CHANNEL = b'__redis__:invalidate'
+# Uma escrita própria ainda não confirmada por invalidação expira depois disso
+_SELF_WRITE_TIMEOUT = 5.0
+
+
+def _entry_size(session: SessionRecord, history: List[Dict]) -> int:
+    """Tamanho aproximado em memória de uma entrada"""
+    return (
+        sum(len(name) + len(value) for name, value in session.fields.items())
+        + sum(len(message.get('content') or '') + 64 for message in history)
+        + 256
+    )
+
+
+class SessionL1Cache:
+    """
+    Cache por worker da sessão e do histórico recente de cada conversa.
+
+    Coerência via client-side caching do Redis em modo BCAST: uma conexão dedicada
+    liga o tracking dos prefixos de sessão/histórico e redireciona as invalidações
+    para uma conexão inscrita em __redis__:invalidate. Qualquer escrita, expiração ou
+    eviction de uma chave (de qualquer worker) remove a conversa do L1. Enquanto o
+    listener não está conectado o cache fica desligado (get sempre erra).
+
+    As escritas do próprio worker são anunciadas antes (expect_write): a invalidação
+    que elas geram não apaga a entrada regravada após um commit sem conflito, e o
+    tempo até ela chegar é o lag de invalidação exportado.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._reset()
+            resource_manager.register_fork_handler(cls._instance._reset)
+        return cls._instance
+
+    def _reset(self):
+        self._entries: "OrderedDict[str, Tuple[SessionRecord, List[Dict], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._connected = False
+        self._task: Optional[asyncio.Task] = None
+        # Sequência de invalidações: leituras iniciadas antes de uma invalidação não entram no cache
+        self._sequence = 0
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        self._pruned_sequence = 0
+        # chave -> instantes das escritas próprias aguardando a invalidação
+        self._pending_writes: Dict[bytes, List[float]] = {}
+        self._stats: Dict[str, Any] = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+            'self_invalidations': 0,
+            'evictions': 0,
+            'reconnects': 0,
+            'lag_samples': 0,
+            'lag_total_ms': 0.0,
+            'lag_max_ms': 0.0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return REDIS_L1_CACHE and not REDIS_CLUSTER and self._connected
+
+    def start(self):
+        """Inicia o listener de invalidações no event loop atual (uma vez por processo)"""
+        if not REDIS_L1_CACHE or (self._task is not None and not self._task.done()):
+            return
+        if REDIS_CLUSTER:
+            # O tracking é por nó: no cluster o L1 fica desligado
+            print("⚠️ REDIS_L1_CACHE ignorado no Redis Cluster")
+            return
+        self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # Leitura / escrita do cache
+
+    def begin_read(self) -> int:
+        """Marca o início de uma leitura no Redis (token para put)"""
+        return self._sequence
+
+    def get(self, whatsapp_number: str) -> Optional[Tuple[SessionRecord, List[Dict]]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(whatsapp_number)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(whatsapp_number)
+            self._stats['hits'] += 1
+        session, history, _ = entry
+        return session, list(history)
+
+    def put(self, whatsapp_number: str, session: SessionRecord, history: List[Dict], token: int):
+        """Guarda a conversa se nada a invalidou desde o token"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._invalidated.get(whatsapp_number, 0) > token or self._pruned_sequence > token:
+                return
+            self._drop(whatsapp_number)
+            size = _entry_size(session, history)
+            if size > REDIS_L1_MAX_BYTES:
+                return
+            self._entries[whatsapp_number] = (session, list(history), size)
+            self._bytes += size
+            while len(self._entries) > REDIS_L1_MAX_ENTRIES or self._bytes > REDIS_L1_MAX_BYTES:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats['evictions'] += 1
+
+    def expect_write(self, whatsapp_number: str) -> int:
+        """
+        Anuncia uma escrita deste worker na conversa: descarta a entrada, invalida
+        leituras em andamento e retorna o token para regravar a entrada após o commit.
+        """
+        if not self.enabled:
+            return self._sequence
+        now = time.monotonic()
+        with self._lock:
+            for key in (session_key(whatsapp_number), history_key(whatsapp_number)):
+                self._pending_writes.setdefault(key.encode('utf-8'), []).append(now)
+            self._invalidate_number(whatsapp_number)
+            return self._sequence
+
+    def write_failed(self, whatsapp_number: str):
+        """A escrita anunciada falhou: a próxima invalidação dessas chaves não é mais esperada"""
+        with self._lock:
+            for key in (session_key(whatsapp_number), history_key(whatsapp_number)):
+                self._pending_writes.pop(key.encode('utf-8'), None)
+            self._invalidate_number(whatsapp_number)
+
+    def _drop(self, whatsapp_number: str):
+        entry = self._entries.pop(whatsapp_number, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _invalidate_number(self, whatsapp_number: str):
+        self._sequence += 1
+        self._invalidated[whatsapp_number] = self._sequence
+        self._invalidated.move_to_end(whatsapp_number)
+        while len(self._invalidated) > REDIS_L1_MAX_ENTRIES:
+            _, sequence = self._invalidated.popitem(last=False)
+            self._pruned_sequence = max(self._pruned_sequence, sequence)
+        self._drop(whatsapp_number)
+
+    def _clear(self):
+        with self._lock:
+            self._sequence += 1
+            self._pruned_sequence = self._sequence
+            self._invalidated.clear()
+            self._pending_writes.clear()
+            self._entries.clear()
+            self._bytes = 0
+
+    # Invalidações
+
+    def _handle_invalidation(self, keys: Optional[List[bytes]]):
+        if keys is None:
+            # FLUSHDB/FLUSHALL: tudo invalidado
+            self._stats['invalidations'] += 1
+            self._clear()
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                pending = self._pending_writes.get(key)
+                # Descarta escritas próprias antigas que nunca foram confirmadas
+                while pending and now - pending[0] > _SELF_WRITE_TIMEOUT:
+                    pending.pop(0)
+                if pending:
+                    lag_ms = (now - pending.pop(0)) * 1000
+                    if not pending:
+                        del self._pending_writes[key]
+                    self._stats['self_invalidations'] += 1
+                    self._stats['lag_samples'] += 1
+                    self._stats['lag_total_ms'] += lag_ms
+                    self._stats['lag_max_ms'] = max(self._stats['lag_max_ms'], lag_ms)
+                    continue
+                self._stats['invalidations'] += 1
+                self._invalidate_number(number_from_key(key))
+
+    async def _listen(self):
+        """Mantém as conexões de invalidação; reconecta com backoff e desliga o cache enquanto cai"""
+        redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
+        backoff = 1.0
+        while True:
+            pool = redis.ConnectionPool.from_url(redis_url)
+            subscriber = pool.make_connection()
+            tracker = pool.make_connection()
+            read = None
+            try:
+                await subscriber.connect()
+                await subscriber.send_command('CLIENT', 'ID')
+                subscriber_id = await subscriber.read_response()
+                await subscriber.send_command('SUBSCRIBE', _INVALIDATE_CHANNEL)
+                await subscriber.read_response()
+
+                await tracker.connect()
+                await tracker.send_command(
+                    'CLIENT', 'TRACKING', 'ON', 'REDIRECT', subscriber_id, 'BCAST',
+                    'PREFIX', SESSION_KEY_PREFIX, 'PREFIX', HISTORY_KEY_PREFIX
+                )
+                await tracker.read_response()
+
+                self._clear()
+                self._connected = True
+                backoff = 1.0
+                print("🔔 L1 de sessões conectado às invalidações do Redis")
+
+                read = asyncio.ensure_future(subscriber.read_response())
+                while True:
+                    done, _ = await asyncio.wait({read}, timeout=REDIS_L1_HEALTH_CHECK_INTERVAL)
+                    if read in done:
+                        message = read.result()
+                        if message and message[0] == b'message' and message[1] == _INVALIDATE_CHANNEL:
+                            self._handle_invalidation(message[2])
+                        read = asyncio.ensure_future(subscriber.read_response())
+                    else:
+                        # Sem a conexão de tracking as invalidações param: checa se ela está viva
+                        await tracker.send_command('PING')
+                        await tracker.read_response()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ L1 de sessões desconectado das invalidações ({e}); cache desligado")
+                self._stats['reconnects'] += 1
+            finally:
+                self._connected = False
+                self._clear()
+                if read is not None:
+                    read.cancel()
+                await subscriber.disconnect()
+                await tracker.disconnect()
+                await pool.disconnect()
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        samples = stats.pop('lag_samples')
+        stats['invalidation_lag_avg_ms'] = round(stats.pop('lag_total_ms') / samples, 2) if samples else 0.0
+        stats['invalidation_lag_max_ms'] = round(stats.pop('lag_max_ms'), 2)
+        stats['enabled'] = REDIS_L1_CACHE and not REDIS_CLUSTER
+        stats['connected'] = self._connected
+        return stats
+
+
+# Instância global
+session_l1_cache = SessionL1Cache()
@@ -0,0 +1,37 @@
+"""
+Re-hidrata o Redis com as conversas mais recentes do PostgreSQL.
+
+Rodar após um flush ou failover do Redis, antes de liberar o tráfego, para que os
+leads que voltam não paguem todos ao mesmo tempo a carga a partir do banco:
+
+    PYTHONPATH=src python -m cache.warm_up --limit 5000 --batch-size 200 --days 7
+
+Sessões que já estão no Redis não são sobrescritas, então é seguro rodar com tráfego.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from cache.redis_chat_session_manager import redis_session_manager
+
+
+async def run(limit: int, batch_size: int, days: int):
+    # Mesmo relógio dos timestamps do histórico (hora local, gravados com datetime.now())
+    since = datetime.now() - timedelta(days=days) if days else None
+    try:
+        return await redis_session_manager.warm_up_from_database(limit, batch_size, since)
+    finally:
+        await redis_session_manager.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm-up do Redis a partir do PostgreSQL")
+    parser.add_argument('--limit', type=int, default=1000, help="Conversas mais recentes a carregar")
+    parser.add_argument('--batch-size', type=int, default=200, help="Conversas por lote")
+    parser.add_argument('--days', type=int, default=1,
+                        help="Só conversas com mensagens nos últimos N dias (0 = sem limite)")
+    args = parser.parse_args()
+    asyncio.run(run(args.limit, args.batch_size, args.days))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ import yaml
 
 # Import our custom tools
 from tools.knowledge_search_tool import knowledge_search_tool
+from tools.async_knowledge_search_tool import FAQ_ASYNC_SEARCH, get_async_knowledge_search_tool
 from tools.simulation_tool import vehicle_simulation_tool
 from tools.lead_qualification_tool import lead_qualification_tool
 
@@ -150,7 +151,8 @@ class ChatCrew:
             backstory=agent_config["backstory"],
             llm=self._create_base_llm(temperature=0.1),  # ✅ Lower temperature for more consistent tool usage
             tools=[
-                knowledge_search_tool,
+                # ✅ FAQ_ASYNC_SEARCH: embedding + Milvus via async clients (searches overlap under load)
+                get_async_knowledge_search_tool() if FAQ_ASYNC_SEARCH else knowledge_search_tool,
                 vehicle_simulation_tool,
                 lead_qualification_tool
             ],  # ✅ Agent must have tools assigned
@@ -0,0 +1,261 @@
+import asyncio
+import gzip
+import os
+import re
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from cache.keys import HISTORY_PARTITIONS_LOCK_KEY
+from cache.redis_session_manager import redis_client
+from database.config import async_session
+from database.models import ConversationHistory, ConversationTranscript
+from resources.resource_manager import resource_manager
+
+# Partições mensais criadas com antecedência (meses à frente do atual)
+HISTORY_PARTITION_MONTHS_AHEAD = int(os.getenv('HISTORY_PARTITION_MONTHS_AHEAD', 3))
+# Meses mantidos no PostgreSQL; partições mais antigas vão para arquivos comprimidos (0 desliga)
+HISTORY_RETENTION_MONTHS = int(os.getenv('HISTORY_RETENTION_MONTHS', 12))
+HISTORY_ARCHIVE_DIR = os.getenv('HISTORY_ARCHIVE_DIR', 'archive/conversation_history')
+# Intervalo da manutenção (segundos)
+HISTORY_PARTITION_INTERVAL = int(os.getenv('HISTORY_PARTITION_INTERVAL', 6 * 3600))
+# Espera máxima pelo lock do DETACH (ms): na fila do lock, ele trava os inserts do histórico
+HISTORY_DETACH_LOCK_TIMEOUT_MS = int(os.getenv('HISTORY_DETACH_LOCK_TIMEOUT_MS', 5000))
+
+_TABLE = ConversationHistory.__tablename__
+_TRANSCRIPTS = ConversationTranscript.__tablename__
+_DEFAULT_PARTITION = f"{_TABLE}_default"
+_PARTITION_NAME = re.compile(rf"^{_TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+_MIGRATION = "migrations/001_partition_conversation_history.sql"
+
+_IS_PARTITIONED = text("SELECT relkind = 'p' FROM pg_class WHERE relname = :table AND relkind IN ('r', 'p')")
+_LIST_PARTITIONS = text("""
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = :table
+""")
+_IS_ATTACHED = text("SELECT relispartition FROM pg_class WHERE relname = :name AND relkind = 'r'")
+# Partições mensais desanexadas por um arquivamento que parou antes do DROP
+_LIST_DETACHED = text("SELECT relname FROM pg_class WHERE relname LIKE :pattern AND relkind = 'r' AND NOT relispartition")
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def _partition_month(name: str) -> Optional[date]:
+    match = _PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def create_partitions(connection: Connection, months_ahead: int = HISTORY_PARTITION_MONTHS_AHEAD) -> List[str]:
+    """
+    Cria a partição default e as partições mensais do mês atual até `months_ahead`
+    meses à frente (as que faltam). Conexão síncrona: roda após o create_all e, no
+    job, via run_sync.
+    Returns:
+        Partições criadas
+    """
+    if not connection.execute(_IS_PARTITIONED, {'table': _TABLE}).scalar():
+        # Banco criado antes do particionamento: a tabela é convertida pela migração
+        print(f"⚠️ {_TABLE} não é particionada; aplique {_MIGRATION}")
+        return []
+
+    existing = set(connection.execute(_LIST_PARTITIONS, {'table': _TABLE}).scalars())
+    statements = []
+    if _DEFAULT_PARTITION not in existing:
+        # Rede de segurança: linhas fora das partições mensais não quebram o insert
+        statements.append((_DEFAULT_PARTITION, f"CREATE TABLE {_DEFAULT_PARTITION} PARTITION OF {_TABLE} DEFAULT"))
+
+    current = date.today().replace(day=1)
+    for offset in range(months_ahead + 1):
+        month = _add_months(current, offset)
+        name = partition_name(month)
+        if name not in existing:
+            statements.append((name, (
+                f"CREATE TABLE {name} PARTITION OF {_TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+            )))
+
+    created = []
+    for name, statement in statements:
+        # Um savepoint por partição: se a default já tem linhas do mês, só essa falha
+        try:
+            with connection.begin_nested():
+                connection.execute(text(statement))
+            created.append(name)
+        except Exception as e:
+            print(f"⚠️ Erro ao criar a partição {name}: {e}")
+    if created:
+        print(f"🗂️ Partições de {_TABLE} criadas: {', '.join(created)}")
+    return created
+
+
+class HistoryPartitionManager:
+    """
+    Manutenção das partições mensais de conversation_history.
+
+    Periodicamente (um worker por vez, via lock no Redis) cria as partições dos
+    próximos meses e arquiva as que passaram de HISTORY_RETENTION_MONTHS: o conteúdo
+    da partição é exportado com COPY para um CSV gzip em HISTORY_ARCHIVE_DIR e, só
+    depois que o arquivo está no disco, a partição é removida (DROP TABLE, sem
+    DELETE de linhas nem VACUUM na tabela principal). Os segmentos de
+    conversation_transcripts do mês (mesmas mensagens, já no arquivo) saem na mesma
+    transação do DROP.
+
+    Antes do COPY a partição é desanexada (DETACH PARTITION) numa transação própria:
+    o lock ACCESS EXCLUSIVE na tabela principal dura só o DETACH, e o COPY e o DROP
+    pegam lock apenas na tabela desanexada. O DETACH CONCURRENTLY não serve porque a
+    tabela tem partição default. Uma tabela que ficou desanexada (arquivamento
+    interrompido) é arquivada na próxima execução.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._reset()
+            resource_manager.register_fork_handler(cls._instance._reset)
+        return cls._instance
+
+    def _reset(self):
+        self._task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, Any] = {
+            'runs': 0,
+            'partitions_created': 0,
+            'partitions_archived': 0,
+            'rows_archived': 0,
+            'transcripts_removed': 0,
+            'last_run_ms': 0.0,
+        }
+
+    def start(self):
+        """Inicia a manutenção no event loop atual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(HISTORY_PARTITION_INTERVAL)
+            try:
+                if await redis_client.acquire_lock(HISTORY_PARTITIONS_LOCK_KEY, HISTORY_PARTITION_INTERVAL):
+                    await self.maintain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Erro na manutenção das partições do histórico: {e}")
+
+    async def maintain(self) -> Dict[str, Any]:
+        """Cria as partições futuras e arquiva as expiradas"""
+        started = time.monotonic()
+        async with async_session() as db:
+            connection = await db.connection()
+            created = await connection.run_sync(create_partitions)
+            await db.commit()
+
+        archived = []
+        if HISTORY_RETENTION_MONTHS > 0:
+            cutoff = _add_months(date.today().replace(day=1), -HISTORY_RETENTION_MONTHS)
+            for name in await self._partitions():
+                month = _partition_month(name)
+                if month is not None and _add_months(month, 1) <= cutoff:
+                    await self.archive_partition(name)
+                    archived.append(name)
+
+        self._stats['runs'] += 1
+        self._stats['partitions_created'] += len(created)
+        self._stats['last_run_ms'] = round((time.monotonic() - started) * 1000, 2)
+        return {'created': created, 'archived': archived}
+
+    async def _partitions(self) -> List[str]:
+        """Partições mensais, incluindo as que ficaram desanexadas"""
+        async with async_session() as db:
+            attached = set((await db.execute(_LIST_PARTITIONS, {'table': _TABLE})).scalars())
+            detached = set((await db.execute(_LIST_DETACHED, {'pattern': f"{_TABLE}_p%"})).scalars())
+        return sorted(attached | detached)
+
+    async def archive_partition(self, name: str) -> int:
+        """
+        Desanexa a partição, exporta para HISTORY_ARCHIVE_DIR/<partição>.csv.gz e a
+        remove, junto com os segmentos de transcript até o mês dela
+        Returns:
+            Linhas arquivadas
+        """
+        directory = Path(HISTORY_ARCHIVE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{name}.csv.gz"
+        partial = directory / f"{name}.csv.gz.partial"
+
+        async with async_session() as db:
+            # Transação curta: enquanto espera ou segura o lock, o insert do histórico para
+            if (await db.execute(_IS_ATTACHED, {'name': name})).scalar():
+                await db.execute(text(f"SET LOCAL lock_timeout = {HISTORY_DETACH_LOCK_TIMEOUT_MS}"))
+                await db.execute(text(f"ALTER TABLE {_TABLE} DETACH PARTITION {name}"))
+            await db.commit()
+
+        async with async_session() as db:
+            # O COPY de um mês inteiro passa do statement_timeout do webhook
+            await db.execute(text("SET LOCAL statement_timeout = 0"))
+            connection = await db.connection()
+            driver_connection = (await connection.get_raw_connection()).driver_connection
+
+            with open(partial, 'wb') as raw:
+                archive = gzip.GzipFile(fileobj=raw, mode='wb')
+
+                async def write(chunk: bytes):
+                    await asyncio.to_thread(archive.write, chunk)
+
+                status = await driver_connection.copy_from_table(name, output=write, format='csv', header=True)
+                await asyncio.to_thread(archive.close)
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(partial, path)
+
+            # Só remove depois que o arquivo está completo no disco; desanexada, a tabela
+            # não trava a principal
+            await db.execute(text(f"DROP TABLE {name}"))
+            month = _partition_month(name)
+            transcripts = 0
+            if month is not None:
+                transcripts = (await db.execute(
+                    text(f"DELETE FROM {_TRANSCRIPTS} WHERE month < :until"),
+                    {'until': _add_months(month, 1)}
+                )).rowcount
+            await db.commit()
+
+        rows = int(status.split()[-1])
+        self._stats['partitions_archived'] += 1
+        self._stats['rows_archived'] += rows
+        self._stats['transcripts_removed'] += transcripts
+        print(f"📦 Partição {name} arquivada em {path} ({rows} mensagens, {transcripts} transcripts removidos)")
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['retention_months'] = HISTORY_RETENTION_MONTHS
+        stats['months_ahead'] = HISTORY_PARTITION_MONTHS_AHEAD
+        return stats
+
+
+# Instância global
+history_partitions = HistoryPartitionManager()
@@ -0,0 +1,219 @@
+import asyncio
+import os
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from cache.redis_session_manager import redis_client
+from database.config import async_session
+from database.models import ConversationHistory, ConversationTranscript
+from resources.resource_manager import resource_manager
+
+# Lote: grava ao juntar N mensagens ou quando a mais antiga do lote espera o prazo (segundos)
+HISTORY_WRITER_BATCH_SIZE = int(os.getenv('HISTORY_WRITER_BATCH_SIZE', 500))
+HISTORY_WRITER_MAX_DELAY = float(os.getenv('HISTORY_WRITER_MAX_DELAY', 1.0))
+# Fila máxima: cheia, quem enfileira espera (backpressure quando o PostgreSQL atrasa)
+HISTORY_WRITER_MAX_QUEUE = int(os.getenv('HISTORY_WRITER_MAX_QUEUE', 10000))
+# Tentativas de gravar um lote antes de descartá-lo (backoff exponencial até 30s)
+HISTORY_WRITER_MAX_RETRIES = int(os.getenv('HISTORY_WRITER_MAX_RETRIES', 8))
+# Tempo máximo para esvaziar a fila no shutdown
+HISTORY_WRITER_DRAIN_TIMEOUT = float(os.getenv('HISTORY_WRITER_DRAIN_TIMEOUT', 10))
+# Acrescenta cada lote também em conversation_transcripts (um documento por conversa)
+HISTORY_TRANSCRIPTS = os.getenv('HISTORY_TRANSCRIPTS', 'true').lower() in ('1', 'true', 'yes')
+
+_COLUMNS = ('whatsapp_number', 'message_type', 'content', 'timestamp')
+
+# (número, tipo, conteúdo, timestamp, instante em que entrou na fila)
+_Item = Tuple[str, str, str, datetime, float]
+
+
+def _transcript_statement(rows: List[Tuple[str, str, str, datetime]]):
+    """
+    Upsert que acrescenta as mensagens do lote ao segmento do mês de cada número (um
+    registro por número e mês, em ordem de chave para transações concorrentes não se
+    travarem). O `||` regrava o documento do segmento, que fica limitado a um mês de
+    conversa em vez da conversa inteira
+    """
+    messages: Dict[Tuple[str, date], List[Tuple[str, str, datetime]]] = {}
+    for whatsapp_number, message_type, content, timestamp in rows:
+        month = timestamp.date().replace(day=1)
+        messages.setdefault((whatsapp_number, month), []).append((message_type, content, timestamp))
+
+    statement = pg_insert(ConversationTranscript).values([
+        {
+            'whatsapp_number': whatsapp_number,
+            'month': month,
+            'messages': [redis_client.history_item(*message) for message in items],
+            'message_count': len(items),
+            'started_at': items[0][2],
+            'updated_at': items[-1][2],
+        }
+        for (whatsapp_number, month), items in sorted(messages.items())
+    ])
+    return statement.on_conflict_do_update(
+        index_elements=[ConversationTranscript.whatsapp_number, ConversationTranscript.month],
+        set_={
+            'messages': ConversationTranscript.messages.op('||')(statement.excluded.messages),
+            'message_count': ConversationTranscript.message_count + statement.excluded.message_count,
+            'updated_at': statement.excluded.updated_at,
+        }
+    )
+
+
+class HistoryWriter:
+    """
+    Grava as mensagens em conversation_history em lotes, fora do caminho do turno.
+
+    Um lote é gravado quando junta HISTORY_WRITER_BATCH_SIZE mensagens ou quando
+    HISTORY_WRITER_MAX_DELAY segundos se passaram desde a primeira mensagem dele (um
+    prazo único por lote, não por item). Sob carga os lotes crescem sozinhos até o
+    limite; com pouco tráfego cada mensagem espera no máximo o prazo.
+
+    A gravação usa COPY (asyncpg) com insert multi-linha como alternativa. Se o
+    PostgreSQL falha ou atrasa, o lote é repetido com backoff e a fila, limitada,
+    bloqueia quem enfileira. No shutdown, drain() espera a fila esvaziar.
+
+    Na mesma transação as mensagens são acrescentadas a conversation_transcripts,
+    então um lote repetido não duplica mensagens no transcript.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._reset()
+            resource_manager.register_fork_handler(cls._instance._reset)
+        return cls._instance
+
+    def _reset(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._first_write_at: Optional[float] = None
+        self._stats: Dict[str, Any] = {
+            'rows_written': 0,
+            'batches': 0,
+            'last_batch_rows': 0,
+            'last_flush_ms': 0.0,
+            'queue_age_last_seconds': 0.0,
+            'queue_age_max_seconds': 0.0,
+            'backpressure_waits': 0,
+            'failures': 0,
+            'dropped_rows': 0,
+        }
+
+    def _start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=HISTORY_WRITER_MAX_QUEUE)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def enqueue(self, whatsapp_number: str, message_type: str, content: str,
+                      timestamp: Optional[datetime] = None):
+        """Agenda uma mensagem para gravação; espera se a fila estiver cheia"""
+        self._start()
+        if self._queue.full():
+            self._stats['backpressure_waits'] += 1
+        await self._queue.put((whatsapp_number, message_type, content, timestamp or datetime.now(), time.monotonic()))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        getter: Optional[asyncio.Future] = None
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(self._queue.get())
+            batch = [await getter]
+            getter = None
+
+            deadline = loop.time() + HISTORY_WRITER_MAX_DELAY
+            while len(batch) < HISTORY_WRITER_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                # A espera pendente é reaproveitada pelo próximo lote (nenhum item se perde)
+                getter = asyncio.ensure_future(self._queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=deadline - loop.time())
+                if not done:
+                    break
+                batch.append(getter.result())
+                getter = None
+
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: List[_Item]):
+        rows = [item[:4] for item in batch]
+        for attempt in range(HISTORY_WRITER_MAX_RETRIES):
+            started = time.monotonic()
+            try:
+                await self._write(rows)
+                break
+            except Exception as e:
+                self._stats['failures'] += 1
+                print(f"⚠️ Erro ao gravar {len(rows)} mensagens no histórico (tentativa {attempt + 1}): {e}")
+                if attempt + 1 < HISTORY_WRITER_MAX_RETRIES:
+                    await asyncio.sleep(min(2 ** attempt, 30))
+        else:
+            self._stats['dropped_rows'] += len(rows)
+            print(f"❌ {len(rows)} mensagens descartadas após {HISTORY_WRITER_MAX_RETRIES} tentativas")
+            return
+
+        now = time.monotonic()
+        if self._first_write_at is None:
+            self._first_write_at = started
+        queue_age = now - batch[0][4]
+        self._stats['rows_written'] += len(rows)
+        self._stats['batches'] += 1
+        self._stats['last_batch_rows'] = len(rows)
+        self._stats['last_flush_ms'] = round((now - started) * 1000, 2)
+        self._stats['queue_age_last_seconds'] = round(queue_age, 3)
+        self._stats['queue_age_max_seconds'] = round(max(self._stats['queue_age_max_seconds'], queue_age), 3)
+
+    async def _write(self, rows: List[Tuple[str, str, str, datetime]]):
+        async with async_session() as db:
+            if HISTORY_TRANSCRIPTS:
+                await db.execute(_transcript_statement(rows))
+            connection = await db.connection()
+            driver_connection = (await connection.get_raw_connection()).driver_connection
+            if hasattr(driver_connection, 'copy_records_to_table'):
+                # Mesma conexão: o COPY entra na transação aberta pelo upsert do transcript
+                await driver_connection.copy_records_to_table(
+                    ConversationHistory.__tablename__, records=rows, columns=list(_COLUMNS)
+                )
+            else:
+                await db.execute(insert(ConversationHistory), [dict(zip(_COLUMNS, row)) for row in rows])
+            await db.commit()
+
+    async def drain(self):
+        """Shutdown: espera a fila ser gravada (até HISTORY_WRITER_DRAIN_TIMEOUT) e para o writer"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), HISTORY_WRITER_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Shutdown com {self._queue.qsize()} mensagens do histórico ainda na fila")
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        stats['queue_size'] = self._queue.qsize() if self._queue is not None else 0
+        elapsed = time.monotonic() - self._first_write_at if self._first_write_at is not None else 0
+        stats['rows_per_second'] = round(stats['rows_written'] / elapsed, 2) if elapsed > 0 else 0.0
+        stats['avg_batch_rows'] = round(stats['rows_written'] / stats['batches'], 1) if stats['batches'] else 0.0
+        return stats
+
+
+# Instância global
+history_writer = HistoryWriter()
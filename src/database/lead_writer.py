@@ -0,0 +1,189 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+from sqlalchemy.dialects.postgresql import insert
+from cache.lead_cache import lead_cache
+from database.config import async_session
+from database.models import LeadConsorcio
+from resources.resource_manager import resource_manager
+
+# Write-behind do lead: alterações acumuladas por número e gravadas no máximo uma vez por intervalo
+LEAD_WRITE_BEHIND = os.getenv('LEAD_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+LEAD_WRITE_BEHIND_INTERVAL = float(os.getenv('LEAD_WRITE_BEHIND_INTERVAL', 10))
+
+# Colunas de leads_consorcio gravadas a partir do estado da conversa
+LEAD_COLUMNS = (
+    'nome', 'cpf', 'estado_civil', 'naturalidade', 'endereco', 'email', 'nome_mae',
+    'renda', 'profissao', 'conversation_stage', 'is_complete', 'lead_score'
+)
+# Mudanças nestes campos são gravadas na hora, mesmo com write-behind (handoff e funil dependem deles)
+LEAD_FLUSH_NOW_COLUMNS = ('conversation_stage', 'is_complete')
+
+
+def lead_changes(data: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Colunas do lead com valor diferente do snapshot `previous` (lead como está no
+    PostgreSQL); sem snapshot todas entram. Valores None no estado não apagam colunas.
+    """
+    return {
+        name: data[name] for name in LEAD_COLUMNS
+        if data.get(name) is not None and (previous is None or previous.get(name) != data[name])
+    }
+
+
+def _upsert_statement(whatsapp_number: str, columns: Dict[str, Any]):
+    """
+    INSERT ... ON CONFLICT (whatsapp_number) DO UPDATE só das colunas informadas,
+    devolvendo a linha completa para a projeção do lead no Redis
+    """
+    statement = insert(LeadConsorcio).values(whatsapp_number=whatsapp_number, **columns)
+    return statement.on_conflict_do_update(
+        index_elements=[LeadConsorcio.whatsapp_number],
+        set_={**{name: statement.excluded[name] for name in columns}, 'updated_at': datetime.utcnow()}
+    ).returning(*LeadConsorcio.__table__.columns)
+
+
+class LeadWriter:
+    """
+    Grava o lead da conversa em uma única instrução (upsert das colunas alteradas), e
+    nenhuma quando o turno não mudou nada em relação ao snapshot da sessão.
+
+    Com LEAD_WRITE_BEHIND as alterações de cada número são acumuladas em memória e
+    gravadas juntas a cada LEAD_WRITE_BEHIND_INTERVAL segundos; mudanças de estágio ou
+    de is_complete são gravadas na hora, junto com o que estava pendente. O pendente é
+    do worker: drain() no shutdown grava o que falta, mas um worker morto perde até um
+    intervalo de alterações (o estado da conversa continua na sessão do Redis).
+
+    save() devolve só as colunas efetivamente gravadas, para o chamador atualizar o
+    snapshot do lead: as agendadas continuam fora dele e voltam no diff do turno
+    seguinte até o flush; as gravadas por um flush em segundo plano são devolvidas no
+    próximo save() do número.
+
+    Depois do commit as linhas gravadas regravam a projeção do lead (write-through).
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._reset()
+            resource_manager.register_fork_handler(cls._instance._reset)
+        return cls._instance
+
+    def _reset(self):
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Colunas gravadas por flush ainda não devolvidas ao chamador (por número)
+        self._flushed: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, int] = {
+            'saves': 0,
+            'unchanged': 0,
+            'deferred': 0,
+            'statements': 0,
+            'errors': 0,
+        }
+
+    async def save(self, data: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Grava as alterações do lead em relação a `previous`
+        Args:
+            data: Estado da conversa (precisa de whatsapp_number)
+            previous: Lead como está no PostgreSQL ({} se ainda não existe, None se desconhecido)
+        Returns:
+            Colunas gravadas no PostgreSQL ({} se nada foi gravado: sem alterações,
+            agendado no write-behind ou erro)
+        """
+        whatsapp_number = data.get('whatsapp_number')
+        if not whatsapp_number:
+            return {}
+
+        self._stats['saves'] += 1
+        flushed = self._flushed.pop(whatsapp_number, {})
+        if previous is not None:
+            previous = {**previous, **flushed}
+        changes = lead_changes(data, previous)
+        if LEAD_WRITE_BEHIND:
+            # O diff é contra o que já foi gravado (inclusive pelo flush) e substitui o pendente:
+            # uma coluna que voltou ao valor gravado deixa de ser gravada
+            self._pending.pop(whatsapp_number, None)
+        if not changes:
+            self._stats['unchanged'] += 1
+            return flushed
+
+        if LEAD_WRITE_BEHIND and previous and not any(name in changes for name in LEAD_FLUSH_NOW_COLUMNS):
+            self._pending[whatsapp_number] = changes
+            self._stats['deferred'] += 1
+            self._schedule_flush()
+            return flushed
+
+        try:
+            await self._write({whatsapp_number: changes})
+            return {**flushed, **changes}
+        except Exception as e:
+            self._stats['errors'] += 1
+            print(f"❌ Erro ao salvar lead {whatsapp_number}: {e}")
+            if LEAD_WRITE_BEHIND:
+                # Continua pendente para o próximo flush
+                self._pending[whatsapp_number] = {**changes, **self._pending.get(whatsapp_number, {})}
+                self._schedule_flush()
+            return flushed
+
+    async def _write(self, leads: Dict[str, Dict[str, Any]]):
+        """Um upsert por lead, todos na mesma transação; depois atualiza a projeção no Redis"""
+        async with async_session() as db:
+            rows = [
+                (await db.execute(_upsert_statement(whatsapp_number, columns))).one()
+                for whatsapp_number, columns in leads.items()
+            ]
+            await db.commit()
+        self._stats['statements'] += len(leads)
+        await lead_cache.put(rows)
+
+    def _schedule_flush(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._pending:
+            await asyncio.sleep(LEAD_WRITE_BEHIND_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        """Grava todas as alterações pendentes"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await self._write(pending)
+            for whatsapp_number, columns in pending.items():
+                self._flushed[whatsapp_number] = {**self._flushed.get(whatsapp_number, {}), **columns}
+        except Exception as e:
+            self._stats['errors'] += 1
+            print(f"❌ Erro ao gravar leads pendentes: {e}")
+            # Volta para a fila sem sobrescrever alterações mais novas
+            for whatsapp_number, columns in pending.items():
+                self._pending[whatsapp_number] = {**columns, **self._pending.get(whatsapp_number, {})}
+
+    async def drain(self):
+        """Shutdown: para o flush periódico e grava o que estiver pendente"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        stats['pending'] = len(self._pending)
+        stats['flushed_unacknowledged'] = len(self._flushed)
+        stats['write_behind'] = LEAD_WRITE_BEHIND
+        return stats
+
+
+# Instância global
+lead_writer = LeadWriter()
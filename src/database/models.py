@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, DateTime, Integer, Text, Boolean
+from sqlalchemy import BigInteger, Column, Date, String, DateTime, Index, Integer, Text, Boolean, LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 from pydantic import BaseModel, Field
@@ -30,13 +31,56 @@ class LeadConsorcio(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class ConversationHistory(Base):
+    """
+    Mensagens de todas as conversas, particionadas por mês de timestamp (partições
+    criadas e arquivadas por database.history_partitions)
+    """
     __tablename__ = "conversation_history"
+    __table_args__ = {"postgresql_partition_by": 'RANGE ("timestamp")'}
 
-    id = Column(Integer, primary_key=True, index=True)
-    whatsapp_number = Column(String(20), index=True)
+    # A chave de partição precisa fazer parte da chave primária
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    whatsapp_number = Column(String(20))
     message_type = Column(String(20))
     content = Column(Text)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, primary_key=True, default=datetime.utcnow)
+
+# Últimas mensagens de um número: WHERE whatsapp_number = ? ORDER BY timestamp DESC LIMIT n
+Index(
+    "ix_conversation_history_number_timestamp",
+    ConversationHistory.whatsapp_number,
+    ConversationHistory.timestamp.desc()
+)
+
+class ConversationTranscript(Base):
+    """
+    Conversa em um registro por número e mês: mensagens no formato do histórico do
+    Redis, acrescentadas pelo history_writer junto com as linhas de conversation_history.
+    O segmento mensal limita o documento regravado a cada lote e é removido junto com a
+    partição do mês na retenção
+    """
+    __tablename__ = "conversation_transcripts"
+
+    whatsapp_number = Column(String(20), primary_key=True)
+    month = Column(Date, primary_key=True)
+    messages = Column(JSONB, nullable=False, default=list)
+    message_count = Column(Integer, default=0)
+
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+class ConversationSnapshot(Base):
+    """Conversa ociosa retirada do Redis (sessão + histórico recente, um registro por número)"""
+    __tablename__ = "conversation_snapshots"
+
+    whatsapp_number = Column(String(20), primary_key=True)
+    # Valores no formato do codec do Redis (JSON, comprimido com zstd acima do limite)
+    session = Column(LargeBinary, nullable=False)
+    history = Column(LargeBinary, nullable=False)
+    message_count = Column(Integer, default=0)
+
+    last_activity = Column(DateTime, index=True)
+    spilled_at = Column(DateTime, default=datetime.utcnow)
 
 class ChatState(BaseModel):
     whatsapp_number: str = ""
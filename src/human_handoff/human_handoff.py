@@ -2,7 +2,7 @@ import os
 import requests
 import json
 import uuid
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, List, Optional, Union
 from datetime import datetime
 from database.models import ChatState
 
@@ -23,12 +23,13 @@ class HumanHandoffManager:
         self.api_key = api_key or os.getenv('ZCC_API_KEY')
         self.base_url = "https://sales.zenvia.com/api/v1/lead/retail"
 
-    def format_history(self, history: str, handoff_message: str) -> str:
+    def format_history(self, history: Union[str, List[Dict[str, Any]]], handoff_message: str) -> str:
         """
         Format the conversation history with proper structure and bullet points.
 
         Args:
-            history: Raw conversation history string
+            history: Chronological messages ({type, content}, as in the session history
+                or conversation transcript) or a raw "type: content" history string
 
         Returns:
             Formatted history string with header and bullet points
@@ -36,21 +37,10 @@ class HumanHandoffManager:
         if not history:
             return ""
 
-        # Split the history into individual messages
-        messages = []
-        current_message = ""
-
-        for line in history.split():
-            if line.startswith("user:") or line.startswith("assistant:"):
-                if current_message:
-                    messages.append(current_message.strip())
-                current_message = line
-            else:
-                current_message += " " + line
-
-        # Add the last message if there's any
-        if current_message:
-            messages.append(current_message.strip())
+        if isinstance(history, list):
+            messages = [f"{message['type']}: {message['content']}" for message in history]
+        else:
+            messages = self._split_history(history)
 
         # Take only the last 10 messages
         recent_messages = messages[-10:] if len(messages) > 10 else messages
@@ -67,6 +57,26 @@ class HumanHandoffManager:
 
         return formatted_history
 
+    @staticmethod
+    def _split_history(history: str) -> List[str]:
+        """Split a raw history string back into "type: content" messages"""
+        messages = []
+        current_message = ""
+
+        for line in history.split():
+            if line.startswith("user:") or line.startswith("assistant:"):
+                if current_message:
+                    messages.append(current_message.strip())
+                current_message = line
+            else:
+                current_message += " " + line
+
+        # Add the last message if there's any
+        if current_message:
+            messages.append(current_message.strip())
+
+        return messages
+
     def format_scoring(self, scoring: Dict[str, Any]) -> str:
         """
         Format the scoring dictionary into a structured string.
@@ -94,7 +104,7 @@ class HumanHandoffManager:
 
         return formatted_scoring
 
-    def convert_lead_data_to_lead_data(self, lead_data: Dict[str, Any], scoring: Dict[str, Any], handoff_message: str, conversation_history: str) -> Dict[str, Any]:
+    def convert_lead_data_to_lead_data(self, lead_data: Dict[str, Any], scoring: Dict[str, Any], handoff_message: str, conversation_history: Union[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
         """
         Convert ChatState to Zenvia lead data format
 
@@ -195,7 +205,7 @@ class HumanHandoffManager:
 
         return lead_data
 
-    def send_lead_to_zenvia(self, lead_data: Dict[str, Any], scoring: Dict[str, Any], handoff_message: str, conversation_history: str) -> Optional[Dict[str, Any]]:
+    def send_lead_to_zenvia(self, lead_data: Dict[str, Any], scoring: Dict[str, Any], handoff_message: str, conversation_history: Union[str, List[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
         """
         Send lead data to Zenvia Sales API
 
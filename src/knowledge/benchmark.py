@@ -0,0 +1,454 @@
+"""
+Retrieval benchmark for the FAQ knowledge base.
+
+The labelled query set comes from the FAQ files themselves: the main question `q`
+and every `sq` paraphrase of an entry are queries whose correct answer is that entry.
+
+Active index (the collection behind the alias), vector / lexical / hybrid retrieval
+over an nprobe grid, plus a table to pick the priority-file threshold:
+
+    PYTHONPATH=src python -m knowledge.benchmark --output bench.json
+
+Index parameter grid (temporary collections, dropped afterwards), per embedding backend:
+
+    PYTHONPATH=src python -m knowledge.benchmark --grid --backends openai local \\
+        --index-types IVF_FLAT IVF_SQ8 HNSW --nlists 64 128 256 --nprobes 5 10 20
+
+Regression check between two runs (e.g. before/after a re-index); exits with
+status 1 if any configuration lost recall or got slower beyond the tolerances:
+
+    PYTHONPATH=src python -m knowledge.benchmark --output new.json --baseline bench.json
+
+Every row reports recall@1/@3, MRR@10, p50/p99 search latency and estimated memory.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from pymilvus import Collection, MilvusClient, connections, utility
+from knowledge.collection_schema import FAQ_STORED_FIELDS, build_faq_schema, stored_fields
+from knowledge.embeddings import (
+    DEFAULT_EMBEDDING_MODELS,
+    FAQ_EMBEDDING_DIM,
+    LocalEmbeddingBackend,
+    OpenAIEmbeddingBackend,
+    get_embedding_backend,
+    is_index_compatible,
+    parse_index_tag,
+)
+from knowledge.evaluation import (
+    build_query_set,
+    first_relevant_rank,
+    mean_reciprocal_rank,
+    percentile,
+    question_key,
+    recall_at_k,
+)
+from knowledge.faq_parser import default_faqs_folder, load_all_faqs
+from knowledge.passages import embedding_text, expand_passages
+from knowledge.lexical_index import lexical_index_path, load_or_build_lexical_index, reciprocal_rank_fusion
+from knowledge.quantization import (
+    RerankVectors,
+    binarize,
+    bytes_per_vector,
+    exact_rerank,
+    hamming_to_cosine,
+    metric_for,
+    rerank_vectors_path,
+)
+from knowledge.versioning import FAQ_COLLECTION_ALIAS, resolve_active_collection
+
+# Carregar variáveis de ambiente do .env
+try:
+    from dotenv import load_dotenv
+    env_path = Path(__file__).parent.parent.parent / '.env'
+    load_dotenv(env_path)
+except ImportError:
+    pass
+
+TOP_K = 10
+HYBRID_CANDIDATES = 5
+RERANK_CANDIDATES = 20
+THRESHOLDS = [0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9]
+
+# Index types of the parameter grid and the storage their vectors use
+GRID_INDEX_STORAGE = {'FLAT': 'float', 'IVF_FLAT': 'float', 'IVF_SQ8': 'sq8', 'HNSW': 'float'}
+HNSW_M = 16
+BENCHMARK_COLLECTION_PREFIX = "faq_bench_"
+
+
+def connect() -> MilvusClient:
+    milvus_uri = os.getenv('MILVUS_URI')
+    milvus_token = os.getenv('MILVUS_TOKEN')
+
+    if not milvus_uri:
+        raise ValueError("MILVUS_URI environment variable is required")
+    if not milvus_token:
+        raise ValueError("MILVUS_TOKEN environment variable is required")
+
+    connections.connect(alias="default", uri=milvus_uri, token=milvus_token)
+    return MilvusClient(uri=milvus_uri, token=milvus_token)
+
+
+def make_backend(name: str):
+    """Embedding backend by name; the configured backend is reused as-is"""
+    configured = get_embedding_backend()
+    if name == configured.name:
+        return configured
+    if name == 'local':
+        return LocalEmbeddingBackend(DEFAULT_EMBEDDING_MODELS['local'], FAQ_EMBEDDING_DIM)
+    if name == 'openai':
+        return OpenAIEmbeddingBackend(DEFAULT_EMBEDDING_MODELS['openai'], FAQ_EMBEDDING_DIM)
+    raise ValueError(f"Unknown embedding backend: {name}")
+
+
+def embed_texts(backend, texts: List[str], batch_size: int = 64) -> List[List[float]]:
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(backend.embed_batch(texts[start:start + batch_size]))
+    return vectors
+
+
+def embed_queries(backend, queries: List[Dict]) -> Tuple[List[List[float]], List[float]]:
+    """Embed each query on its own, as the search tool does, timing every call"""
+    vectors, latencies = [], []
+    for item in queries:
+        started = time.perf_counter()
+        vectors.append(backend.embed(item['query']))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return vectors, latencies
+
+
+def summarize(ranks: List[Optional[int]], latencies_ms: List[float]) -> Dict:
+    return {
+        'recall@1': round(recall_at_k(ranks, 1), 4),
+        'recall@3': round(recall_at_k(ranks, 3), 4),
+        'mrr@10': round(mean_reciprocal_rank(ranks), 4),
+        'p50_ms': round(percentile(latencies_ms, 50), 2),
+        'p99_ms': round(percentile(latencies_ms, 99), 2),
+    }
+
+
+def search_params_for(index_type: str, metric: str, breadth: int) -> Dict:
+    """Search breadth: nprobe for IVF indexes, ef for HNSW (ignored by FLAT)"""
+    if index_type == 'HNSW':
+        return {"metric_type": metric, "params": {"ef": max(breadth, TOP_K)}}
+    return {"metric_type": metric, "params": {"nprobe": breadth}}
+
+
+def vector_search(collection: Collection, query_vector: List[float], params: Dict, storage: str,
+                  dim: int, rerank_vectors: Optional[RerankVectors] = None) -> Tuple[List[Dict], float]:
+    """Top-K hits for one query (same encoding/rerank as the search tool) and the request latency"""
+    limit = max(TOP_K, RERANK_CANDIDATES) if rerank_vectors else TOP_K
+    data = binarize(query_vector) if storage == 'binary' else query_vector
+
+    started = time.perf_counter()
+    search_results = collection.search(
+        data=[data],
+        anns_field="embedding",
+        param=params,
+        limit=limit,
+        output_fields=["q"]
+    )
+    hits = []
+    for batch in search_results:
+        for hit in batch:
+            score = hamming_to_cosine(hit.score, dim) if storage == 'binary' else hit.score
+            hits.append({'doc_id': str(hit.id), 'q': hit.entity.get('q'), 'relevance_score': score})
+    if rerank_vectors:
+        hits = exact_rerank(hits, query_vector, rerank_vectors)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return hits[:TOP_K], elapsed_ms
+
+
+def threshold_table(top_hits: List[Optional[Dict]], queries: List[Dict]) -> List[Dict]:
+    """
+    For each candidate threshold: the share of queries whose top-1 score passes it
+    (coverage) and how often those top-1 hits are the correct answer (precision).
+    """
+    rows = []
+    for threshold in THRESHOLDS:
+        passed = [
+            question_key(hit['q']) == item['target']
+            for hit, item in zip(top_hits, queries)
+            if hit and (hit['relevance_score'] or 0.0) > threshold
+        ]
+        rows.append({
+            'threshold': threshold,
+            'coverage': round(len(passed) / len(queries), 4) if queries else 0.0,
+            'precision': round(sum(passed) / len(passed), 4) if passed else 0.0,
+        })
+    return rows
+
+
+def benchmark_active(client: MilvusClient, queries: List[Dict], nprobes: List[int]) -> Dict:
+    """Benchmark the collection currently behind the alias, as the search tool sees it"""
+    collection_name = resolve_active_collection(client)
+    if collection_name is None:
+        sys.exit(f"No collection behind the alias '{FAQ_COLLECTION_ALIAS}': "
+                 f"run knowledge.index_faqs first, or benchmark candidates with --grid")
+    collection = Collection(collection_name)
+    collection.load()
+
+    index_tag = parse_index_tag(collection.description)
+    storage = index_tag.get('storage', 'float')
+    dim = next(f.params.get('dim') for f in collection.schema.fields if f.name == 'embedding')
+    entities = collection.num_entities
+    print(f"Active collection {collection_name}: {entities} entities, index {index_tag}")
+
+    rows = []
+
+    lexical_index = load_or_build_lexical_index(collection, collection_name, stored_fields(collection))
+    lexical_rankings, lexical_ranks, lexical_latencies = [], [], []
+    for item in queries:
+        started = time.perf_counter()
+        ranking = lexical_index.search(item['query'], limit=TOP_K)
+        lexical_latencies.append((time.perf_counter() - started) * 1000)
+        lexical_rankings.append(ranking)
+        lexical_ranks.append(first_relevant_rank([lexical_index.documents[d]['q'] for d, _ in ranking], item['target']))
+    lexical_path = lexical_index_path(collection_name)
+    rows.append({
+        'retriever': 'lexical',
+        **summarize(lexical_ranks, lexical_latencies),
+        'memory_bytes': lexical_path.stat().st_size if lexical_path.exists() else None,
+    })
+
+    backend = get_embedding_backend()
+    thresholds = []
+    if not is_index_compatible(index_tag, backend.tag):
+        print(f"Skipping vector retrieval: index built with {index_tag}, backend is {backend.tag}")
+    else:
+        query_vectors, embed_latencies = embed_queries(backend, queries)
+        rerank_vectors = RerankVectors.load_if_exists(rerank_vectors_path(collection_name))
+        memory = bytes_per_vector(dim, storage) * entities
+        if rerank_vectors:
+            memory += rerank_vectors_path(collection_name).stat().st_size
+
+        for nprobe in nprobes:
+            params = search_params_for('IVF', metric_for(storage), nprobe)
+            vector_ranks, hybrid_ranks, latencies, top_hits = [], [], [], []
+            for item, vector, lexical in zip(queries, query_vectors, lexical_rankings):
+                hits, elapsed_ms = vector_search(collection, vector, params, storage, dim, rerank_vectors)
+                latencies.append(elapsed_ms)
+                top_hits.append(hits[0] if hits else None)
+                vector_ranks.append(first_relevant_rank([h['q'] for h in hits], item['target']))
+
+                # Hybrid: same fusion as the search tool over the top candidates of each retriever
+                fused = reciprocal_rank_fusion([
+                    [h['doc_id'] for h in hits[:HYBRID_CANDIDATES]],
+                    [doc_id for doc_id, _ in lexical[:HYBRID_CANDIDATES]]
+                ])
+                questions = {h['doc_id']: h['q'] for h in hits}
+                hybrid_ranks.append(first_relevant_rank(
+                    [questions.get(d) or lexical_index.documents.get(d, {}).get('q', '') for d, _ in fused],
+                    item['target']
+                ))
+
+            rows.append({'retriever': 'vector', 'nprobe': nprobe, **summarize(vector_ranks, latencies),
+                         'memory_bytes': memory})
+            rows.append({'retriever': 'hybrid', 'nprobe': nprobe, **summarize(hybrid_ranks, latencies),
+                         'memory_bytes': memory})
+            thresholds.append({'nprobe': nprobe, 'table': threshold_table(top_hits, queries)})
+
+        rows.append({
+            'retriever': 'embedding',
+            'backend': backend.tag,
+            'p50_ms': round(percentile(embed_latencies, 50), 2),
+            'p99_ms': round(percentile(embed_latencies, 99), 2),
+        })
+
+    return {
+        'mode': 'active',
+        'collection': collection_name,
+        'index_tag': index_tag,
+        'entities': entities,
+        'results': rows,
+        'thresholds': thresholds,
+    }
+
+
+def estimate_index_bytes(index_type: str, dim: int, count: int) -> int:
+    storage = GRID_INDEX_STORAGE[index_type]
+    total = bytes_per_vector(dim, storage) * count
+    if index_type == 'HNSW':
+        # Graph links: ~2*M neighbours per vector on the base layer, 8 bytes each
+        total += count * HNSW_M * 2 * 8
+    return total
+
+
+def benchmark_grid(entries: List[Dict], queries: List[Dict], backend_names: List[str],
+                   index_types: List[str], nlists: List[int], nprobes: List[int], holdout: bool) -> Dict:
+    """
+    Build a temporary collection per backend x index type x nlist, search it with every
+    nprobe (ef for HNSW) and drop it.
+
+    With holdout, only `q` is embedded for the documents, so the `sq` paraphrases used
+    as queries are not part of the indexed text (production indexes "q sq").
+    """
+    rows = []
+    # Same rows as the indexer: one per answer passage
+    documents = expand_passages(entries)
+    doc_texts = [document['q'] if holdout else embedding_text(document) for document in documents]
+
+    for backend_name in backend_names:
+        backend = make_backend(backend_name)
+        print(f"Embedding {len(documents)} documents with {backend.tag}")
+        doc_vectors = embed_texts(backend, doc_texts)
+        query_vectors, embed_latencies = embed_queries(backend, queries)
+        dim = len(doc_vectors[0])
+
+        for index_type in index_types:
+            storage = GRID_INDEX_STORAGE[index_type]
+            for nlist in ([0] if index_type in ('FLAT', 'HNSW') else nlists):
+                name = f"{BENCHMARK_COLLECTION_PREFIX}{backend_name}_{index_type.lower()}_{nlist}"
+                if utility.has_collection(name):
+                    utility.drop_collection(name)
+                collection = Collection(name=name, schema=build_faq_schema(dim, storage, description="FAQ benchmark"))
+                try:
+                    collection.insert([
+                        doc_vectors,
+                        *[[document[field] for document in documents] for field in FAQ_STORED_FIELDS]
+                    ])
+                    collection.flush()
+                    if index_type == 'HNSW':
+                        params = {"M": HNSW_M, "efConstruction": 200}
+                    elif index_type == 'FLAT':
+                        params = {}
+                    else:
+                        params = {"nlist": nlist}
+                    collection.create_index(
+                        field_name="embedding",
+                        index_params={"metric_type": "COSINE", "index_type": index_type, "params": params}
+                    )
+                    collection.load()
+
+                    for breadth in ([0] if index_type == 'FLAT' else nprobes):
+                        search_params = search_params_for(index_type, "COSINE", breadth)
+                        ranks, latencies = [], []
+                        for item, vector in zip(queries, query_vectors):
+                            hits, elapsed_ms = vector_search(collection, vector, search_params, storage, dim)
+                            latencies.append(elapsed_ms)
+                            ranks.append(first_relevant_rank([h['q'] for h in hits], item['target']))
+
+                        row = {
+                            'backend': backend_name,
+                            'index_type': index_type,
+                            'nlist': nlist or None,
+                            'nprobe': breadth or None,
+                            **summarize(ranks, latencies),
+                            'embed_p50_ms': round(percentile(embed_latencies, 50), 2),
+                            'embed_p99_ms': round(percentile(embed_latencies, 99), 2),
+                            'memory_bytes': estimate_index_bytes(index_type, dim, len(documents)),
+                        }
+                        rows.append(row)
+                        print(f"{backend_name:>6} {index_type:>8} nlist={nlist:<4} nprobe/ef={breadth:<4} "
+                              f"R@1={row['recall@1']:.4f} R@3={row['recall@3']:.4f} MRR={row['mrr@10']:.4f} "
+                              f"p50={row['p50_ms']:.1f}ms p99={row['p99_ms']:.1f}ms")
+                finally:
+                    collection.release()
+                    collection.drop()
+
+    return {'mode': 'grid', 'holdout': holdout, 'results': rows}
+
+
+def config_key(row: Dict) -> str:
+    """Identity of a benchmark row, used to match rows between two runs"""
+    keys = ('retriever', 'backend', 'index_type', 'nlist', 'nprobe')
+    return '|'.join(f"{k}={row[k]}" for k in keys if k in row and not isinstance(row[k], dict))
+
+
+def compare_reports(report: Dict, baseline: Dict, max_recall_drop: float, max_latency_increase: float) -> List[str]:
+    """List the regressions of `report` against `baseline` (matching configurations only)"""
+    previous = {config_key(row): row for row in baseline.get('results', [])}
+    regressions = []
+    for row in report.get('results', []):
+        old = previous.get(config_key(row))
+        if not old or 'recall@1' not in row:
+            continue
+        drop = old['recall@1'] - row['recall@1']
+        if drop > max_recall_drop:
+            regressions.append(f"{config_key(row)}: recall@1 {old['recall@1']:.4f} -> {row['recall@1']:.4f}")
+        if old.get('p99_ms') and row['p99_ms'] > old['p99_ms'] * (1 + max_latency_increase):
+            regressions.append(f"{config_key(row)}: p99 {old['p99_ms']:.1f}ms -> {row['p99_ms']:.1f}ms")
+    return regressions
+
+
+def print_report(report: Dict):
+    print(f"\n{'retriever':>10} {'nprobe':>6} {'R@1':>7} {'R@3':>7} {'MRR':>7} {'p50ms':>8} {'p99ms':>8} {'memory':>10}")
+    for row in report['results']:
+        if 'recall@1' not in row:
+            continue
+        print(f"{row.get('retriever', row.get('index_type', '')):>10} {str(row.get('nprobe') or '-'):>6} "
+              f"{row['recall@1']:>7.4f} {row['recall@3']:>7.4f} {row['mrr@10']:>7.4f} "
+              f"{row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} {str(row.get('memory_bytes') or '-'):>10}")
+
+    for block in report.get('thresholds', []):
+        print(f"\nTop-1 score threshold (nprobe={block['nprobe']}): coverage / precision")
+        for row in block['table']:
+            print(f"  > {row['threshold']:.2f}: {row['coverage']:.3f} / {row['precision']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAQ retrieval benchmark")
+    parser.add_argument('--grid', action='store_true',
+                        help="Benchmark an index parameter grid on temporary collections instead of the active index")
+    parser.add_argument('--backends', nargs='+', default=None,
+                        help="Embedding backends for the grid (default: the configured one)")
+    parser.add_argument('--index-types', nargs='+', default=['IVF_FLAT'], choices=sorted(GRID_INDEX_STORAGE))
+    parser.add_argument('--nlists', type=int, nargs='+', default=[64, 128, 256])
+    parser.add_argument('--nprobes', type=int, nargs='+', default=[1, 5, 10, 20, 50])
+    parser.add_argument('--holdout', action='store_true',
+                        help="Grid only: index `q` alone and query with the `sq` paraphrases")
+    parser.add_argument('--sample', type=int, default=500, help="Number of queries (0 = all)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    parser.add_argument('--baseline', help="Previous JSON report to check for regressions")
+    parser.add_argument('--max-recall-drop', type=float, default=0.01)
+    parser.add_argument('--max-latency-increase', type=float, default=0.5,
+                        help="Maximum relative p99 increase (0.5 = +50%%)")
+    args = parser.parse_args()
+
+    entries = load_all_faqs(default_faqs_folder())
+    queries = build_query_set(entries, include_main_questions=not args.holdout)
+    if args.sample and len(queries) > args.sample:
+        queries = random.Random(args.seed).sample(queries, args.sample)
+    print(f"{len(entries)} FAQ entries, {len(queries)} labelled queries")
+
+    client = connect()
+    if args.grid:
+        report = benchmark_grid(entries, queries, args.backends or [get_embedding_backend().name],
+                                args.index_types, args.nlists, args.nprobes, args.holdout)
+    else:
+        report = benchmark_active(client, queries, args.nprobes)
+
+    report.update({
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'queries': len(queries),
+        'seed': args.seed,
+    })
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nReport written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.max_recall_drop, args.max_latency_increase)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from typing import List
+from pymilvus import FieldSchema, CollectionSchema, DataType
+
+# Scalar fields stored for every FAQ entry
+FAQ_SCALAR_FIELDS = ["q", "sq", "a", "t", "tags", "source_file"]
+
+# Passage fields: each row is one passage of an answer (see knowledge.passages)
+FAQ_PASSAGE_FIELDS = ["parent_id", "passage_index", "passage_count"]
+
+# Columns of a collection row after the vector, in schema order
+FAQ_STORED_FIELDS = FAQ_SCALAR_FIELDS + FAQ_PASSAGE_FIELDS
+
+
+def build_faq_schema(dim: int, storage: str = 'float', description: str = "FAQ collection for chatbot") -> CollectionSchema:
+    """Schema of a FAQ collection version (binary storage keeps only the sign bit of each dimension)"""
+    vector_dtype = DataType.BINARY_VECTOR if storage == 'binary' else DataType.FLOAT_VECTOR
+
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="embedding", dtype=vector_dtype, dim=dim),
+        FieldSchema(name="q", dtype=DataType.VARCHAR, max_length=2048),
+        FieldSchema(name="sq", dtype=DataType.VARCHAR, max_length=4096),
+        FieldSchema(name="a", dtype=DataType.VARCHAR, max_length=8192),
+        FieldSchema(name="t", dtype=DataType.VARCHAR, max_length=2048),
+        FieldSchema(name="tags", dtype=DataType.VARCHAR, max_length=1024),
+        FieldSchema(name="source_file", dtype=DataType.VARCHAR, max_length=512),
+        FieldSchema(name="parent_id", dtype=DataType.VARCHAR, max_length=64),
+        FieldSchema(name="passage_index", dtype=DataType.INT64),
+        FieldSchema(name="passage_count", dtype=DataType.INT64)
+    ]
+
+    return CollectionSchema(fields, description=description)
+
+
+def stored_fields(collection) -> List[str]:
+    """Stored fields present in a collection version (older versions have no passage fields)"""
+    names = {field.name for field in collection.schema.fields}
+    return [field for field in FAQ_STORED_FIELDS if field in names]
@@ -0,0 +1,168 @@
+"""
+Compare reduced-dimension and quantized FAQ embeddings against the full-precision baseline.
+
+Everything is computed locally with exact (brute-force) search over the FAQ corpus,
+so the report isolates the effect of the vector representation from the ANN index:
+
+    PYTHONPATH=src python -m knowledge.embedding_report --dims 1536 512 256 --output report.json
+
+For each dimension x storage (float / sq8 / binary, with and without exact rerank)
+it reports recall@1/@3 and MRR@10, top-1 agreement with the baseline, vector memory
+and scoring latency, plus a "safe" verdict. The queries are held-out paraphrases that
+are not part of the indexed text, so recall is not measured on leaked strings. The
+native dimension with float storage is always evaluated as the baseline.
+"""
+import argparse
+import json
+import time
+from typing import Dict, List
+import numpy as np
+from knowledge.embeddings import get_embedding_backend
+from knowledge.evaluation import build_held_out_split, mean_reciprocal_rank, question_key, recall_at_k
+from knowledge.faq_parser import default_faqs_folder, load_all_faqs
+from knowledge.quantization import bytes_per_vector, normalize_rows, scalar_quantize
+
+TOP_K = 10
+
+
+def embed_all(backend, texts: List[str], batch_size: int = 64) -> np.ndarray:
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(backend.embed_batch(texts[start:start + batch_size]))
+        print(f"Embedded {min(start + batch_size, len(texts))}/{len(texts)} texts...")
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def reduce_dim(matrix: np.ndarray, dim: int) -> np.ndarray:
+    """Shortened embedding: truncate and re-normalize (what text-embedding-3 does for `dimensions`)"""
+    return normalize_rows(matrix[:, :dim])
+
+
+def score_matrix(queries: np.ndarray, docs: np.ndarray, storage: str) -> np.ndarray:
+    """Similarity of every query against every document under a storage mode"""
+    if storage == 'sq8':
+        return queries @ normalize_rows(scalar_quantize(docs)).T
+    if storage == 'binary':
+        query_bits = (queries > 0).astype(np.float32)
+        doc_bits = (docs > 0).astype(np.float32)
+        agreement = query_bits @ doc_bits.T + (1 - query_bits) @ (1 - doc_bits).T
+        hamming = docs.shape[1] - agreement
+        return np.cos(np.pi * hamming / docs.shape[1])
+    return queries @ docs.T
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, scores.shape[1])
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, candidates, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def rerank(queries: np.ndarray, docs: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """Re-order the candidates of each query with exact cosine on the float16 copies"""
+    docs16 = docs.astype(np.float16).astype(np.float32)
+    exact = np.einsum('qd,qkd->qk', queries, docs16[candidates])
+    return np.take_along_axis(candidates, exact.argsort(axis=1)[:, ::-1], axis=1)
+
+
+def evaluate(rankings: np.ndarray, doc_keys: List[str], targets: List[str]) -> Dict:
+    ranks = []
+    for row, target in zip(rankings, targets):
+        rank = next((i for i, doc in enumerate(row, start=1) if doc_keys[doc] == target), None)
+        ranks.append(rank)
+    return {
+        'recall@1': round(recall_at_k(ranks, 1), 4),
+        'recall@3': round(recall_at_k(ranks, 3), 4),
+        'mrr@10': round(mean_reciprocal_rank(ranks), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAQ embedding dimension/quantization comparison report")
+    parser.add_argument('--dims', type=int, nargs='+', default=[1536, 512, 256])
+    parser.add_argument('--storages', nargs='+', default=['float', 'sq8', 'binary'])
+    parser.add_argument('--rerank-candidates', type=int, default=20)
+    parser.add_argument('--max-recall-drop', type=float, default=0.01,
+                        help="Maximum recall@1 loss vs. the baseline for a configuration to be considered safe")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    entries = load_all_faqs(default_faqs_folder())
+    documents, query_set = build_held_out_split(entries)
+    if not query_set:
+        parser.error("No FAQ entry has two or more paraphrases to hold out as queries")
+    doc_keys = [question_key(entry['q']) for entry in entries]
+    targets = [item['target'] for item in query_set]
+
+    # Embed once at the native size; shorter sizes are derived by truncation
+    configured = get_embedding_backend()
+    backend = type(configured)(configured.model)
+    print(f"Embedding {len(entries)} FAQ entries and {len(query_set)} queries with {backend.tag}")
+    doc_vectors = normalize_rows(embed_all(backend, documents))
+    query_vectors = normalize_rows(embed_all(backend, [item['query'] for item in query_set]))
+
+    native_dim = doc_vectors.shape[1]
+    baseline_top1 = top_k(score_matrix(query_vectors, doc_vectors, 'float'), 1)[:, 0]
+    rows = []
+
+    skipped = sorted(d for d in args.dims if d > native_dim)
+    if skipped:
+        print(f"Skipping dims larger than the native {native_dim}: {skipped}")
+    # The baseline (native dim, float) is always part of the sweep
+    dims = sorted({native_dim, *(d for d in args.dims if d <= native_dim)}, reverse=True)
+    storages = ['float', *(s for s in args.storages if s != 'float')]
+
+    for dim in dims:
+        docs = reduce_dim(doc_vectors, dim)
+        queries = reduce_dim(query_vectors, dim)
+        for storage in storages:
+            variants = [False, True] if storage != 'float' else [False]
+            for with_rerank in variants:
+                started = time.perf_counter()
+                scores = score_matrix(queries, docs, storage)
+                rankings = top_k(scores, max(TOP_K, args.rerank_candidates if with_rerank else 0))
+                if with_rerank:
+                    rankings = rerank(queries, docs, rankings)
+                rankings = rankings[:, :TOP_K]
+                elapsed_ms = (time.perf_counter() - started) * 1000
+
+                agreement = np.mean([doc_keys[a] == doc_keys[b] for a, b in zip(rankings[:, 0], baseline_top1)])
+                memory = bytes_per_vector(dim, storage) * len(entries)
+                rows.append({
+                    'dim': dim,
+                    'storage': storage,
+                    'exact_rerank': with_rerank,
+                    **evaluate(rankings, doc_keys, targets),
+                    'top1_agreement': round(float(agreement), 4),
+                    'index_vector_bytes': memory,
+                    'rerank_sidecar_bytes': dim * 2 * len(entries) if with_rerank else 0,
+                    'scoring_ms_per_query': round(elapsed_ms / len(query_set), 4),
+                })
+
+    baseline = next(r for r in rows if r['dim'] == native_dim and r['storage'] == 'float')
+    for row in rows:
+        row['recall@1_drop'] = round(baseline['recall@1'] - row['recall@1'], 4)
+        row['memory_ratio'] = round(row['index_vector_bytes'] / baseline['index_vector_bytes'], 4)
+        row['safe'] = row['recall@1_drop'] <= args.max_recall_drop
+
+    print(f"\n{'dim':>5} {'storage':>7} {'rerank':>6} {'R@1':>7} {'R@3':>7} {'MRR':>7} "
+          f"{'agree':>7} {'mem':>7} {'ms/q':>8}  safe")
+    for row in rows:
+        print(f"{row['dim']:>5} {row['storage']:>7} {str(row['exact_rerank']):>6} {row['recall@1']:>7.4f} "
+              f"{row['recall@3']:>7.4f} {row['mrr@10']:>7.4f} {row['top1_agreement']:>7.4f} "
+              f"{row['memory_ratio']:>7.3f} {row['scoring_ms_per_query']:>8.4f}  {'yes' if row['safe'] else 'NO'}")
+
+    if args.output:
+        report = {
+            'backend': backend.tag,
+            'entries': len(entries),
+            'queries': len(query_set),
+            'results': rows,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
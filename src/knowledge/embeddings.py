@@ -0,0 +1,285 @@
+import asyncio
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from resources.resource_manager import resource_manager
+
+# Embedding backend shared by the indexer and the search tool: "openai" or "local"
+FAQ_EMBEDDING_BACKEND = os.getenv('FAQ_EMBEDDING_BACKEND', 'openai').lower()
+
+DEFAULT_EMBEDDING_MODELS = {
+    'openai': 'text-embedding-3-small',
+    'local': 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2',
+}
+FAQ_EMBEDDING_MODEL = os.getenv('FAQ_EMBEDDING_MODEL') or DEFAULT_EMBEDDING_MODELS.get(FAQ_EMBEDDING_BACKEND, '')
+
+# Reduced embedding dimension (e.g. 256/512); 0 keeps the model's native size.
+# text-embedding-3-* shortens natively; local models are truncated and re-normalized.
+FAQ_EMBEDDING_DIM = int(os.getenv('FAQ_EMBEDDING_DIM', 0))
+
+# Local backend tuning
+# - quantize: "" (float32, torch), "int8" (torch dynamic quantization),
+#   "onnx" (ONNX Runtime) or "onnx-int8" (pre-quantized ONNX weights)
+FAQ_EMBEDDING_QUANTIZE = os.getenv('FAQ_EMBEDDING_QUANTIZE', '').lower()
+FAQ_EMBEDDING_ONNX_FILE = os.getenv('FAQ_EMBEDDING_ONNX_FILE', 'onnx/model_qint8_avx512_vnni.onnx')
+FAQ_EMBEDDING_THREADS = int(os.getenv('FAQ_EMBEDDING_THREADS', 0))  # 0 = torch default
+# Micro-batching: concurrent requests arriving within this window are encoded together
+FAQ_EMBEDDING_BATCH_WAIT_MS = float(os.getenv('FAQ_EMBEDDING_BATCH_WAIT_MS', 5))
+FAQ_EMBEDDING_MAX_BATCH = int(os.getenv('FAQ_EMBEDDING_MAX_BATCH', 32))
+# Load the local model in each worker's background warm-up instead of on the first search
+FAQ_EMBEDDING_PRELOAD = os.getenv('FAQ_EMBEDDING_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+# Legacy collections (created before indexes were tagged) used this backend
+LEGACY_INDEX_TAG = {'backend': 'openai', 'model': 'text-embedding-3-small'}
+
+_INDEX_TAG_PATTERN = re.compile(r'index=(\{.*\})')
+
+# Tag keys that must match between the index and the query-time backend
+EMBEDDING_TAG_KEYS = ('backend', 'model', 'quantize', 'dim')
+
+
+def _create_openai_client():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+
+def _create_async_openai_client():
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+
+resource_manager.register('openai', _create_openai_client)
+resource_manager.register('openai_async', _create_async_openai_client)
+
+
+class EmbeddingBackend:
+    """Base class for the embedding backends"""
+
+    name = ""
+
+    def __init__(self, model: str, dimensions: int = 0):
+        self.model = model
+        self.dimensions = dimensions
+
+    @property
+    def tag(self) -> Dict:
+        """Identifies the vector space; indexes built with a different tag are not comparable"""
+        tag = {'backend': self.name, 'model': self.model}
+        if self.dimensions:
+            tag['dim'] = self.dimensions
+        return tag
+
+    @property
+    def dim(self) -> int:
+        raise NotImplementedError
+
+    def preload(self):
+        """Load what the backend needs ahead of the first call (nothing for API backends)"""
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def aembed(self, text: str) -> List[float]:
+        """Async embedding; backends without a native async path use a worker thread"""
+        return await asyncio.to_thread(self.embed, text)
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """Embeddings from the OpenAI API (one network round trip per call)"""
+
+    name = "openai"
+    _DIMENSIONS = {'text-embedding-3-small': 1536, 'text-embedding-3-large': 3072, 'text-embedding-ada-002': 1536}
+
+    def __init__(self, model: str, dimensions: int = 0):
+        super().__init__(model, dimensions)
+        if not os.getenv('OPENAI_API_KEY'):
+            raise ValueError("OPENAI_API_KEY environment variable is required")
+
+    @property
+    def dim(self) -> int:
+        return self.dimensions or self._DIMENSIONS.get(self.model, 1536)
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        kwargs = {'dimensions': self.dimensions} if self.dimensions else {}
+        # HTTP client created on first use in each process (see _create_openai_client)
+        response = resource_manager.get('openai').embeddings.create(
+            model=self.model,
+            input=texts,
+            **kwargs
+        )
+        return [item.embedding for item in response.data]
+
+    async def aembed(self, text: str) -> List[float]:
+        kwargs = {'dimensions': self.dimensions} if self.dimensions else {}
+        response = await resource_manager.get('openai_async').embeddings.create(
+            model=self.model,
+            input=[text],
+            **kwargs
+        )
+        return response.data[0].embedding
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    Multilingual sentence-transformers model running on CPU.
+
+    The model is loaded once per process: each gunicorn worker loads it in the
+    background warm-up, never in the master, since torch's thread pools do not
+    survive a fork. Single-text calls from concurrent threads are micro-batched
+    into one forward pass.
+    """
+
+    name = "local"
+
+    def __init__(self, model: str, dimensions: int = 0, quantize: str = FAQ_EMBEDDING_QUANTIZE):
+        super().__init__(model, dimensions)
+        self.quantize = quantize
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+
+    @property
+    def tag(self) -> Dict:
+        tag = super().tag
+        if self.quantize:
+            # Quantized weights produce slightly different vectors
+            tag['quantize'] = self.quantize
+        return tag
+
+    @property
+    def dim(self) -> int:
+        return self._load_model().get_sentence_embedding_dimension()
+
+    def _load_model(self):
+        if self._model is not None:
+            return self._model
+
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+
+                started = time.perf_counter()
+                # Truncation happens before normalization inside encode()
+                truncate_dim = self.dimensions or None
+                if self.quantize.startswith('onnx'):
+                    model_kwargs = {'file_name': FAQ_EMBEDDING_ONNX_FILE} if self.quantize == 'onnx-int8' else None
+                    model = SentenceTransformer(self.model, device='cpu', backend='onnx',
+                                                model_kwargs=model_kwargs, truncate_dim=truncate_dim)
+                else:
+                    model = SentenceTransformer(self.model, device='cpu', truncate_dim=truncate_dim)
+                    if self.quantize == 'int8':
+                        import torch
+                        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+                print(f"Embedding model {self.model} loaded in {time.perf_counter() - started:.1f}s")
+                self._model = model
+        return self._model
+
+    def preload(self):
+        """Load the model weights now (from the worker's warm-up, ahead of the first search)"""
+        self._load_model()
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        model = self._load_model()
+        vectors = model.encode(texts, batch_size=max(len(texts), 1), normalize_embeddings=True)
+        return [vector.tolist() for vector in vectors]
+
+    def embed(self, text: str) -> List[float]:
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    async def aembed(self, text: str) -> List[float]:
+        # Same micro-batching queue; the caller awaits the result instead of blocking a thread
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return await asyncio.wrap_future(future)
+
+    def _ensure_worker(self):
+        # Threads don't survive fork: restart the batching thread in each worker process
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._model_lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                if FAQ_EMBEDDING_THREADS:
+                    import torch
+                    torch.set_num_threads(FAQ_EMBEDDING_THREADS)
+                if self._worker_pid != os.getpid():
+                    # Requests queued in the parent process will never be answered here
+                    self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + FAQ_EMBEDDING_BATCH_WAIT_MS / 1000
+            while len(batch) < FAQ_EMBEDDING_MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self.embed_batch([text for text, _ in batch])
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+_backend: Optional[EmbeddingBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_embedding_backend() -> EmbeddingBackend:
+    """Return the process-wide embedding backend configured by FAQ_EMBEDDING_BACKEND"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if FAQ_EMBEDDING_BACKEND == 'local':
+                    _backend = LocalEmbeddingBackend(FAQ_EMBEDDING_MODEL, FAQ_EMBEDDING_DIM)
+                elif FAQ_EMBEDDING_BACKEND == 'openai':
+                    _backend = OpenAIEmbeddingBackend(FAQ_EMBEDDING_MODEL, FAQ_EMBEDDING_DIM)
+                else:
+                    raise ValueError(f"Unknown FAQ_EMBEDDING_BACKEND: {FAQ_EMBEDDING_BACKEND}")
+    return _backend
+
+
+def format_index_tag(tag: Dict) -> str:
+    """Serialize an index tag to be stored in the collection description"""
+    return f"index={json.dumps(tag, sort_keys=True)}"
+
+
+def parse_index_tag(description: Optional[str]) -> Dict:
+    """Read the index tag from a collection description (legacy collections have none)"""
+    match = _INDEX_TAG_PATTERN.search(description or '')
+    if not match:
+        return dict(LEGACY_INDEX_TAG)
+    try:
+        return json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return dict(LEGACY_INDEX_TAG)
+
+
+def is_index_compatible(index_tag: Dict, backend_tag: Dict) -> bool:
+    """Whether query embeddings from `backend_tag` can be searched against an index tagged `index_tag`"""
+    return all(index_tag.get(key) == backend_tag.get(key) for key in EMBEDDING_TAG_KEYS)
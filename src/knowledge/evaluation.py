@@ -0,0 +1,96 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+from knowledge.lexical_index import fold_accents
+
+_QUESTION_SPLIT = re.compile(r'(?<=\?)\s+')
+
+
+def split_questions(text: str) -> List[str]:
+    """Split a `sq` field ("Pergunta 1? Pergunta 2?") into individual questions"""
+    return [part.strip() for part in _QUESTION_SPLIT.split(text or '') if len(part.strip()) > 3]
+
+
+def question_key(question: str) -> str:
+    """Identity of an FAQ answer: the same question may be repeated in several files"""
+    return ' '.join(fold_accents(question).split())
+
+
+def build_query_set(entries: List[Dict], include_main_questions: bool = True) -> List[Dict]:
+    """
+    Build a labelled query set from the FAQ entries: each `sq` paraphrase (and
+    optionally the main `q`) is a query whose correct answer is its own entry.
+
+    Returns:
+        List of {"query", "target", "source_file", "kind"} dicts
+    """
+    queries = []
+    for entry in entries:
+        target = question_key(entry['q'])
+        if include_main_questions:
+            queries.append({'query': entry['q'], 'target': target, 'source_file': entry['source_file'], 'kind': 'q'})
+        for paraphrase in split_questions(entry.get('sq', '')):
+            queries.append({'query': paraphrase, 'target': target, 'source_file': entry['source_file'], 'kind': 'sq'})
+    return queries
+
+
+def build_held_out_split(entries: List[Dict]) -> Tuple[List[str], List[Dict]]:
+    """
+    Document texts and a query set that share no text: for every entry with at least
+    two `sq` paraphrases the last one is held out as the query, and held-out strings
+    are left out of every document (the same paraphrase may appear in several entries).
+    Entries with fewer paraphrases are still indexed, as distractors, but contribute
+    no query.
+
+    Returns:
+        (one document text per entry, list of {"query", "target", "source_file", "kind"})
+    """
+    paraphrases = [split_questions(entry.get('sq', '')) for entry in entries]
+    main_questions = {question_key(entry['q']) for entry in entries}
+
+    queries = []
+    for entry, entry_paraphrases in zip(entries, paraphrases):
+        held_out = entry_paraphrases[-1] if len(entry_paraphrases) >= 2 else None
+        # A paraphrase that is some entry's main question can't be held out of the index
+        if held_out and question_key(held_out) not in main_questions:
+            queries.append({
+                'query': held_out,
+                'target': question_key(entry['q']),
+                'source_file': entry['source_file'],
+                'kind': 'held_out',
+            })
+
+    held_out_keys = {question_key(query['query']) for query in queries}
+    documents = [
+        ' '.join([entry['q'], *(p for p in entry_paraphrases if question_key(p) not in held_out_keys)])
+        for entry, entry_paraphrases in zip(entries, paraphrases)
+    ]
+    return documents, queries
+
+
+def first_relevant_rank(ranked_questions: Sequence[str], target: str) -> Optional[int]:
+    """1-based rank of the first result answering the target question (None if absent)"""
+    for rank, question in enumerate(ranked_questions, start=1):
+        if question_key(question) == target:
+            return rank
+    return None
+
+
+def recall_at_k(ranks: Sequence[Optional[int]], k: int) -> float:
+    if not ranks:
+        return 0.0
+    return sum(1 for rank in ranks if rank is not None and rank <= k) / len(ranks)
+
+
+def mean_reciprocal_rank(ranks: Sequence[Optional[int]]) -> float:
+    if not ranks:
+        return 0.0
+    return sum(1.0 / rank for rank in ranks if rank) / len(ranks)
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile (p in 0-100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
@@ -0,0 +1,67 @@
+import os
+import glob
+import re
+from typing import List, Dict
+
+
+def default_faqs_folder() -> str:
+    """Path of the FAQ files shipped with the app (src/faqs)"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(os.path.dirname(current_dir), "faqs")
+
+
+def parse_faq_file(file_path: str) -> List[Dict]:
+    """Parse a single FAQ file and return list of FAQ entries"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    # Split content by '---' separator
+    entries = content.split('---')
+    faq_entries = []
+
+    for entry in entries:
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        # Parse each field using regex
+        q_match = re.search(r'q:\s*(.*?)(?=\n\n|\nsq:|$)', entry, re.DOTALL)
+        sq_match = re.search(r'sq:\s*(.*?)(?=\n\n|\na:|$)', entry, re.DOTALL)
+        a_match = re.search(r'a:\s*(.*?)(?=\n\n|\nt:|$)', entry, re.DOTALL)
+        t_match = re.search(r't:\s*(.*?)(?=\n\n|\ntags:|$)', entry, re.DOTALL)
+        tags_match = re.search(r'tags:\s*(.*?)(?=\n\n|$)', entry, re.DOTALL)
+
+        if q_match and a_match:  # At minimum, we need question and answer
+            faq_entry = {
+                'q': q_match.group(1).strip() if q_match else '',
+                'sq': sq_match.group(1).strip() if sq_match else '',
+                'a': a_match.group(1).strip() if a_match else '',
+                't': t_match.group(1).strip() if t_match else '',
+                'tags': tags_match.group(1).strip() if tags_match else '',
+                'source_file': os.path.basename(file_path)
+            }
+            faq_entries.append(faq_entry)
+
+    return faq_entries
+
+
+def load_all_faqs(faqs_folder: str) -> List[Dict]:
+    """Load and parse all FAQ files from the faqs folder"""
+    all_faqs = []
+
+    # Get all .txt files from the faqs folder
+    faq_files = glob.glob(os.path.join(faqs_folder, "*.txt"))
+
+    print(f"Found {len(faq_files)} FAQ files:")
+    for file_path in faq_files:
+        print(f"  - {os.path.basename(file_path)}")
+
+    for file_path in faq_files:
+        try:
+            faqs = parse_faq_file(file_path)
+            all_faqs.extend(faqs)
+            print(f"Loaded {len(faqs)} FAQs from {os.path.basename(file_path)}")
+        except Exception as e:
+            print(f"Error loading {file_path}: {e}")
+
+    return all_faqs
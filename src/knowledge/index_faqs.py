@@ -1,11 +1,28 @@
 import os
-import glob
-import re
+import numpy as np
 from typing import List, Dict
-from pymilvus import MilvusClient, connections
-from pymilvus import FieldSchema, CollectionSchema, DataType, Collection
-from openai import OpenAI
+from pymilvus import MilvusClient, connections, Collection
 from pathlib import Path
+from knowledge.versioning import (
+    FAQ_COLLECTION_ALIAS,
+    versioned_collection_name,
+    next_collection_version,
+    switch_alias,
+    garbage_collect_versions,
+)
+from knowledge.embeddings import get_embedding_backend, format_index_tag
+from knowledge.lexical_index import BM25Index, lexical_index_path
+from knowledge.quantization import (
+    FAQ_VECTOR_STORAGE,
+    VECTOR_STORAGES,
+    RerankVectors,
+    binarize,
+    index_params_for,
+    rerank_vectors_path,
+)
+from knowledge.collection_schema import FAQ_STORED_FIELDS, build_faq_schema
+from knowledge.passages import embedding_text, expand_passages
+from knowledge.faq_parser import load_all_faqs, default_faqs_folder
 
 # Carregar variáveis de ambiente do .env
 try:
@@ -17,12 +34,8 @@ except ImportError:
     # Se python-dotenv não estiver instalado, continuar sem carregar
     pass
 
-# Load environment variables
-api_key = os.getenv('OPENAI_API_KEY')
-if not api_key:
-    raise ValueError("OPENAI_API_KEY environment variable is required")
-
-client = OpenAI(api_key=api_key)
+# Embedding backend selected by FAQ_EMBEDDING_BACKEND (must match the one used by the search tool)
+embedding_backend = get_embedding_backend()
 
 # Connect to Milvus
 milvus_uri = os.getenv('MILVUS_URI')
@@ -44,91 +57,33 @@ connections.connect(
 milvus_client = MilvusClient(uri=milvus_uri, token=milvus_token)
 print(f"Connected to Milvus successfully")
 
-# Define collection schema
-fields = [
-    FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-    FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=1536),  # OpenAI embedding size
-    FieldSchema(name="q", dtype=DataType.VARCHAR, max_length=2048),
-    FieldSchema(name="sq", dtype=DataType.VARCHAR, max_length=4096),
-    FieldSchema(name="a", dtype=DataType.VARCHAR, max_length=8192),
-    FieldSchema(name="t", dtype=DataType.VARCHAR, max_length=2048),
-    FieldSchema(name="tags", dtype=DataType.VARCHAR, max_length=1024),
-    FieldSchema(name="source_file", dtype=DataType.VARCHAR, max_length=512)
-]
-
-schema = CollectionSchema(fields, description="FAQ collection for chatbot")
-
-# Create or get collection
-collection_name = "faq_collection"
-try:
+if FAQ_VECTOR_STORAGE not in VECTOR_STORAGES:
+    raise ValueError(f"FAQ_VECTOR_STORAGE must be one of {VECTOR_STORAGES}")
+
+# The index tag records which backend/model produced the vectors (so searches with
+# a different backend are detected) and how they are stored (so searches use the
+# matching metric and query encoding)
+schema = build_faq_schema(
+    embedding_backend.dim,
+    FAQ_VECTOR_STORAGE,
+    description=f"FAQ collection for chatbot {format_index_tag({**embedding_backend.tag, 'storage': FAQ_VECTOR_STORAGE})}"
+)
+
+def create_versioned_collection() -> Collection:
+    """
+    Create a new, empty physical collection for this indexing run.
+
+    Searches keep using the collection behind the alias while this one is built,
+    so a re-index never exposes a half-built or unindexed collection.
+    """
+    collection_name = versioned_collection_name(next_collection_version(milvus_client))
     collection = Collection(name=collection_name, schema=schema)
     print(f"Collection '{collection_name}' created successfully")
-except Exception as e:
-    print(f"Collection might already exist: {e}")
-    collection = Collection(name=collection_name)
+    return collection
 
 def get_embedding(text: str) -> List[float]:
-    """Generate embedding for given text using OpenAI API"""
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return response.data[0].embedding
-
-def parse_faq_file(file_path: str) -> List[Dict]:
-    """Parse a single FAQ file and return list of FAQ entries"""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Split content by '---' separator
-    entries = content.split('---')
-    faq_entries = []
-
-    for entry in entries:
-        entry = entry.strip()
-        if not entry:
-            continue
-
-        # Parse each field using regex
-        q_match = re.search(r'q:\s*(.*?)(?=\n\n|\nsq:|$)', entry, re.DOTALL)
-        sq_match = re.search(r'sq:\s*(.*?)(?=\n\n|\na:|$)', entry, re.DOTALL)
-        a_match = re.search(r'a:\s*(.*?)(?=\n\n|\nt:|$)', entry, re.DOTALL)
-        t_match = re.search(r't:\s*(.*?)(?=\n\n|\ntags:|$)', entry, re.DOTALL)
-        tags_match = re.search(r'tags:\s*(.*?)(?=\n\n|$)', entry, re.DOTALL)
-
-        if q_match and a_match:  # At minimum, we need question and answer
-            faq_entry = {
-                'q': q_match.group(1).strip() if q_match else '',
-                'sq': sq_match.group(1).strip() if sq_match else '',
-                'a': a_match.group(1).strip() if a_match else '',
-                't': t_match.group(1).strip() if t_match else '',
-                'tags': tags_match.group(1).strip() if tags_match else '',
-                'source_file': os.path.basename(file_path)
-            }
-            faq_entries.append(faq_entry)
-
-    return faq_entries
-
-def load_all_faqs(faqs_folder: str) -> List[Dict]:
-    """Load and parse all FAQ files from the faqs folder"""
-    all_faqs = []
-
-    # Get all .txt files from the faqs folder
-    faq_files = glob.glob(os.path.join(faqs_folder, "*.txt"))
-
-    print(f"Found {len(faq_files)} FAQ files:")
-    for file_path in faq_files:
-        print(f"  - {os.path.basename(file_path)}")
-
-    for file_path in faq_files:
-        try:
-            faqs = parse_faq_file(file_path)
-            all_faqs.extend(faqs)
-            print(f"Loaded {len(faqs)} FAQs from {os.path.basename(file_path)}")
-        except Exception as e:
-            print(f"Error loading {file_path}: {e}")
-
-    return all_faqs
+    """Generate embedding for given text using the configured backend"""
+    return embedding_backend.embed(text)
 
 def index_faqs_to_milvus(faq_entries: List[Dict]):
     """Index FAQ entries to Milvus collection"""
@@ -136,72 +91,83 @@ def index_faqs_to_milvus(faq_entries: List[Dict]):
         print("No FAQ entries to index")
         return
 
-    print(f"Indexing {len(faq_entries)} FAQ entries...")
+    # Long answers become several passages (rows) pointing to the same parent entry
+    documents = expand_passages(faq_entries)
+    print(f"Indexing {len(faq_entries)} FAQ entries as {len(documents)} passages...")
 
-    # Prepare data lists for each field
     embeddings = []
-    questions = []
-    sub_questions = []
-    answers = []
-    text_refs = []
-    tags_list = []
-    source_files = []
-
-    for i, entry in enumerate(faq_entries):
+    indexed_documents = []
+
+    for i, document in enumerate(documents):
         try:
-            # Create text for embedding (combine question and sub-questions)
-            text_for_embedding = f"{entry['q']} {entry['sq']}"
-            embedding = get_embedding(text_for_embedding)
+            # Create text for embedding (question and sub-questions, plus the passage for split answers)
+            embedding = get_embedding(embedding_text(document))
 
             embeddings.append(embedding)
-            questions.append(entry['q'])
-            sub_questions.append(entry['sq'])
-            answers.append(entry['a'])
-            text_refs.append(entry['t'])
-            tags_list.append(entry['tags'])
-            source_files.append(entry['source_file'])
+            indexed_documents.append(document)
 
             if (i + 1) % 10 == 0:
-                print(f"Processed {i + 1}/{len(faq_entries)} entries...")
+                print(f"Processed {i + 1}/{len(documents)} passages...")
 
         except Exception as e:
-            print(f"Error processing entry {i}: {e}")
+            print(f"Error processing passage {i}: {e}")
             continue
 
     if embeddings:
+        collection = create_versioned_collection()
         try:
-            # Prepare data in the format Milvus expects (by columns)
+            # Prepare data in the format Milvus expects (by columns, in schema order)
             data_to_insert = [
-                embeddings,
-                questions,
-                sub_questions,
-                answers,
-                text_refs,
-                tags_list,
-                source_files
+                [binarize(e) for e in embeddings] if FAQ_VECTOR_STORAGE == 'binary' else embeddings,
+                *[[document[field] for document in indexed_documents] for field in FAQ_STORED_FIELDS]
             ]
 
-            # Insert data into collection
-            collection.insert(data_to_insert)
+            # Insert data into the new collection version
+            insert_result = collection.insert(data_to_insert)
             collection.flush()
-            print(f"Successfully indexed {len(embeddings)} FAQ entries to Milvus")
+            print(f"Successfully indexed {len(embeddings)} passages to {collection.name}")
 
             # Create index for better search performance
-            index_params = {
-                "metric_type": "COSINE",
-                "index_type": "IVF_FLAT",
-                "params": {"nlist": 128}
-            }
+            index_params = index_params_for(FAQ_VECTOR_STORAGE)
             collection.create_index(field_name="embedding", index_params=index_params)
-            print("Index created successfully")
+            print(f"Index created successfully ({index_params['index_type']})")
+
+            primary_keys = list(map(str, insert_result.primary_keys))
+            if FAQ_VECTOR_STORAGE != 'float':
+                # Full-precision copies for exact reranking of the quantized candidates
+                RerankVectors(primary_keys, np.asarray(embeddings)).save(rerank_vectors_path(collection.name))
+                print(f"Rerank vectors saved to {rerank_vectors_path(collection.name)}")
+
+            # Lexical (BM25) index for hybrid retrieval, keyed by the same primary keys
+            lexical_index = BM25Index.from_documents(zip(primary_keys, indexed_documents))
+            lexical_index.save(lexical_index_path(collection.name))
+            print(f"Lexical index saved to {lexical_index_path(collection.name)}")
+
+            # Load the new version before exposing it, so the first searches after
+            # the switch don't hit an unloaded collection
+            collection.load()
 
         except Exception as e:
             print(f"Error inserting data to Milvus: {e}")
+            print(f"Dropping incomplete collection {collection.name}")
+            collection.drop()
+            return
+
+        # Atomic switch: running workers pick up the new version on their next check
+        switch_alias(milvus_client, collection.name)
+        print(f"Alias '{FAQ_COLLECTION_ALIAS}' now points to {collection.name}")
+
+        dropped = garbage_collect_versions(milvus_client)
+        if dropped:
+            for name in dropped:
+                lexical_index_path(name).unlink(missing_ok=True)
+                rerank_vectors_path(name).unlink(missing_ok=True)
+            print(f"Dropped old collection versions: {', '.join(dropped)}")
 
 if __name__ == "__main__":
+    # Usage (from the project root): PYTHONPATH=src python -m knowledge.index_faqs
     # Define the path to the FAQs folder
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    faqs_folder = os.path.join(os.path.dirname(current_dir), "faqs")
+    faqs_folder = default_faqs_folder()
 
     print(f"Loading FAQs from: {faqs_folder}")
 
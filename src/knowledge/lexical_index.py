@@ -0,0 +1,225 @@
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Directory where the indexer stores the BM25 index of each collection version
+FAQ_LEXICAL_INDEX_DIR = Path(os.getenv('FAQ_LEXICAL_INDEX_DIR', Path(__file__).parent / 'lexical'))
+
+# Fields indexed lexically and their weight in the term frequency
+LEXICAL_FIELD_WEIGHTS = {'q': 2.0, 'sq': 1.0, 'tags': 1.5}
+
+# Common Portuguese words, already accent-folded
+PORTUGUESE_STOPWORDS = {
+    'a', 'ao', 'aos', 'as', 'ate', 'com', 'como', 'da', 'das', 'de', 'do', 'dos', 'e', 'ela',
+    'ele', 'eles', 'em', 'entre', 'era', 'essa', 'esse', 'esta', 'este', 'eu', 'foi', 'ha',
+    'isso', 'isto', 'ja', 'la', 'lhe', 'mais', 'mas', 'me', 'meu', 'minha', 'muito', 'na',
+    'nas', 'no', 'nos', 'num', 'numa', 'o', 'os', 'ou', 'para', 'pela', 'pelas', 'pelo',
+    'pelos', 'por', 'pra', 'pro', 'qual', 'quando', 'que', 'quem', 'se', 'sem', 'ser', 'seu',
+    'sua', 'so', 'sao', 'tambem', 'te', 'tem', 'ter', 'um', 'uma', 'uns', 'umas', 'voce',
+    'voces', 'vai', 'vou', 'eh', 'posso', 'pode', 'fazer', 'faz', 'tenho', 'sobre'
+}
+
+# Suffix rules applied in order (suffix, replacement, minimum stem length)
+_PLURAL_RULES = [
+    ('oes', 'ao', 2), ('aes', 'ao', 2), ('ais', 'al', 2), ('eis', 'el', 2), ('ois', 'ol', 2),
+    ('ns', 'm', 2), ('res', 'r', 2), ('ses', 's', 2), ('s', '', 3),
+]
+_SUFFIX_RULES = [
+    ('amente', '', 3), ('mente', '', 3), ('acao', '', 3), ('icao', '', 3), ('idade', '', 3),
+    ('mento', '', 3), ('adora', '', 3), ('ador', '', 3), ('avel', '', 3), ('ivel', '', 3),
+    ('ismo', '', 3), ('ista', '', 3), ('ando', '', 3), ('endo', '', 3), ('indo', '', 3),
+    ('ado', '', 3), ('ada', '', 3), ('ido', '', 3), ('ida', '', 3), ('oso', '', 3),
+    ('osa', '', 3), ('ar', '', 3), ('er', '', 3), ('ir', '', 3), ('ao', '', 3),
+    ('a', '', 3), ('o', '', 3), ('e', '', 3),
+]
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def fold_accents(text: str) -> str:
+    """Lowercase and strip accents (contemplação -> contemplacao)"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _apply_rules(token: str, rules: List[Tuple[str, str, int]]) -> str:
+    for suffix, replacement, min_stem in rules:
+        if token.endswith(suffix) and len(token) - len(suffix) >= min_stem:
+            return token[:-len(suffix)] + replacement
+    return token
+
+
+def stem(token: str) -> str:
+    """
+    Light Portuguese stemmer (plural reduction + common suffixes), enough to match
+    contemplação/contemplado/contemplada or parcela/parcelas to the same term.
+    """
+    return _apply_rules(_apply_rules(token, _PLURAL_RULES), _SUFFIX_RULES)
+
+
+def tokenize(text: str) -> List[str]:
+    """Fold accents, drop stopwords and stem the remaining words"""
+    tokens = []
+    for word in _NON_ALNUM.split(fold_accents(text or '')):
+        if len(word) < 2 or word in PORTUGUESE_STOPWORDS:
+            continue
+        tokens.append(stem(word))
+    return tokens
+
+
+def lexical_index_path(collection_name: str) -> Path:
+    """Path of the BM25 index stored next to a given collection version"""
+    return FAQ_LEXICAL_INDEX_DIR / f"{collection_name}.bm25.json"
+
+
+class BM25Index:
+    """
+    In-memory BM25 index over the FAQ `q`, `sq` and `tags` fields.
+
+    Documents keep their stored fields, so a lexical hit can be answered without
+    going back to Milvus.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: Dict[str, Dict] = {}
+        self._term_freqs: Dict[str, Dict[str, float]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._postings: Dict[str, List[str]] = {}
+        self._idf: Dict[str, float] = {}
+        self._avg_length = 0.0
+
+    def add(self, doc_id, document: Dict):
+        """Add a document (dict with the FAQ fields); call build() once all documents are added"""
+        doc_id = str(doc_id)
+        weighted = Counter()
+        for field, weight in LEXICAL_FIELD_WEIGHTS.items():
+            for token in tokenize(document.get(field, '')):
+                weighted[token] += weight
+
+        self.documents[doc_id] = document
+        self._term_freqs[doc_id] = dict(weighted)
+        self._doc_lengths[doc_id] = sum(weighted.values())
+
+    def build(self):
+        """Compute postings, IDF and average document length"""
+        postings: Dict[str, List[str]] = {}
+        for doc_id, freqs in self._term_freqs.items():
+            for term in freqs:
+                postings.setdefault(term, []).append(doc_id)
+
+        total = len(self._term_freqs)
+        self._postings = postings
+        self._idf = {
+            term: math.log(1 + (total - len(ids) + 0.5) / (len(ids) + 0.5))
+            for term, ids in postings.items()
+        }
+        self._avg_length = (sum(self._doc_lengths.values()) / total) if total else 0.0
+        return self
+
+    def search(self, query: str, limit: int = 5, source_file: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Rank documents for the query.
+
+        Returns:
+            List of (doc_id, score), best first
+        """
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc_id in self._postings[term]:
+                if source_file and self.documents[doc_id].get('source_file') != source_file:
+                    continue
+                tf = self._term_freqs[doc_id][term]
+                norm = 1 - self.b + self.b * self._doc_lengths[doc_id] / (self._avg_length or 1.0)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+    def coverage(self, query: str, doc_id: str) -> float:
+        """Fraction of the (known) query terms present in the document"""
+        terms = set(tokenize(query))
+        if not terms:
+            return 0.0
+        freqs = self._term_freqs.get(str(doc_id), {})
+        return sum(1 for term in terms if term in freqs) / len(terms)
+
+    def to_dict(self) -> Dict:
+        return {
+            'k1': self.k1,
+            'b': self.b,
+            'documents': self.documents,
+            'term_freqs': self._term_freqs,
+            'doc_lengths': self._doc_lengths
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BM25Index":
+        index = cls(k1=data.get('k1', 1.5), b=data.get('b', 0.75))
+        index.documents = data['documents']
+        index._term_freqs = data['term_freqs']
+        index._doc_lengths = data['doc_lengths']
+        return index.build()
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Tuple[str, Dict]]) -> "BM25Index":
+        """Build an index from (doc_id, document) pairs"""
+        index = cls()
+        for doc_id, document in documents:
+            index.add(doc_id, document)
+        return index.build()
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)  # Atomic: readers never see a partial file
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def load_or_build_lexical_index(collection, collection_name: str, fields: List[str]) -> BM25Index:
+    """
+    Load the BM25 index written by the indexer for a collection version or, when this
+    host doesn't have the file, rebuild it from the collection contents.
+    """
+    path = lexical_index_path(collection_name)
+    if path.exists():
+        return BM25Index.load(path)
+
+    rows = collection.query(
+        expr="id >= 0",
+        output_fields=["id"] + fields,
+        limit=16384
+    )
+    return BM25Index.from_documents(
+        (str(row["id"]), {field: row.get(field, '') for field in fields})
+        for row in rows
+    )
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several rankings of doc ids with reciprocal rank fusion.
+
+    Returns:
+        List of (doc_id, fused_score), best first
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import re
+from typing import Dict, List
+from knowledge.lexical_index import tokenize
+
+# Answers longer than this are split into passages at sentence boundaries. A safeguard
+# for long answers added later: the shipped FAQs never reach it (median answer 143
+# chars, p99 263, longest 351), so today every entry is indexed as a single passage
+FAQ_PASSAGE_MAX_CHARS = int(os.getenv('FAQ_PASSAGE_MAX_CHARS', 500))
+
+_SENTENCE_END = re.compile(r'(?<=[.!?;])\s+')
+
+
+def _split_long_sentence(sentence: str, max_chars: int) -> List[str]:
+    """Split a sentence longer than max_chars at word boundaries"""
+    parts, current = [], ''
+    for word in sentence.split():
+        if current and len(current) + 1 + len(word) > max_chars:
+            parts.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_passages(text: str, max_chars: int = FAQ_PASSAGE_MAX_CHARS) -> List[str]:
+    """Pack whole sentences into passages of at most max_chars (a short text is one passage)"""
+    text = (text or '').strip()
+    if len(text) <= max_chars:
+        return [text]
+
+    passages, current = [], ''
+    for sentence in _SENTENCE_END.split(text):
+        pieces = [sentence] if len(sentence) <= max_chars else _split_long_sentence(sentence, max_chars)
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > max_chars:
+                passages.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    if current:
+        passages.append(current)
+    return passages
+
+
+def parent_id_for(entry: Dict) -> str:
+    """Stable id of an FAQ entry, shared by all of its passages"""
+    return hashlib.sha1(f"{entry['source_file']}\x1f{entry['q']}".encode('utf-8')).hexdigest()[:16]
+
+
+def expand_passages(entries: List[Dict], max_chars: int = FAQ_PASSAGE_MAX_CHARS) -> List[Dict]:
+    """
+    One document per answer passage. Each passage keeps the entry's other fields,
+    `a` holds the passage text and parent_id/passage_index/passage_count point back
+    to the entry.
+    """
+    documents = []
+    for entry in entries:
+        passages = split_passages(entry['a'], max_chars)
+        parent_id = parent_id_for(entry)
+        for index, passage in enumerate(passages):
+            documents.append({
+                **entry,
+                'a': passage,
+                'parent_id': parent_id,
+                'passage_index': index,
+                'passage_count': len(passages),
+            })
+    return documents
+
+
+def embedding_text(document: Dict) -> str:
+    """
+    Text embedded for a document. Single-passage entries embed the question and its
+    paraphrases as before; passages of a split answer also embed their own text, so
+    the passages of one entry can be told apart.
+    """
+    if document.get('passage_count', 1) > 1:
+        return f"{document['q']} {document['sq']} {document['a']}"
+    return f"{document['q']} {document['sq']}"
+
+
+def best_snippet(query: str, text: str, max_chars: int) -> str:
+    """
+    The passage of `text` that shares most terms with the query, when the whole
+    text doesn't fit in max_chars (answers indexed before passage splitting).
+    """
+    if len(text) <= max_chars:
+        return text
+
+    query_terms = set(tokenize(query))
+    passages = split_passages(text, max_chars)
+    # Earliest passage wins ties: answers usually lead with the essential part
+    best = max(
+        enumerate(passages),
+        key=lambda item: (len(query_terms & set(tokenize(item[1]))), -item[0])
+    )
+    return best[1]
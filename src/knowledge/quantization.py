@@ -0,0 +1,118 @@
+import json
+import math
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from knowledge.lexical_index import FAQ_LEXICAL_INDEX_DIR
+
+# How vectors are stored in Milvus:
+# - float:  FLOAT_VECTOR + IVF_FLAT (4 bytes/dim)
+# - sq8:    FLOAT_VECTOR + IVF_SQ8 (1 byte/dim in the index)
+# - binary: BINARY_VECTOR (sign bits) + BIN_IVF_FLAT (1 bit/dim)
+VECTOR_STORAGES = ('float', 'sq8', 'binary')
+FAQ_VECTOR_STORAGE = os.getenv('FAQ_VECTOR_STORAGE', 'float').lower()
+
+FAQ_INDEX_NLIST = int(os.getenv('FAQ_INDEX_NLIST', 128))
+
+
+def index_params_for(storage: str, nlist: int = FAQ_INDEX_NLIST) -> Dict:
+    """Milvus index parameters for a storage mode"""
+    if storage == 'binary':
+        return {"metric_type": "HAMMING", "index_type": "BIN_IVF_FLAT", "params": {"nlist": nlist}}
+    if storage == 'sq8':
+        return {"metric_type": "COSINE", "index_type": "IVF_SQ8", "params": {"nlist": nlist}}
+    return {"metric_type": "COSINE", "index_type": "IVF_FLAT", "params": {"nlist": nlist}}
+
+
+def metric_for(storage: str) -> str:
+    return "HAMMING" if storage == 'binary' else "COSINE"
+
+
+def bytes_per_vector(dim: int, storage: str) -> int:
+    """Size of one stored vector under a storage mode (excluding index overhead)"""
+    if storage == 'binary':
+        return dim // 8
+    if storage == 'sq8':
+        return dim
+    return dim * 4
+
+
+def binarize(vector: Sequence[float]) -> bytes:
+    """Sign-bit quantization: 1 bit per dimension, packed (dimension must be a multiple of 8)"""
+    return np.packbits(np.asarray(vector) > 0).tobytes()
+
+
+def hamming_to_cosine(distance: float, dim: int) -> float:
+    """
+    Approximate cosine similarity from the Hamming distance between sign bits
+    (angle ~= pi * distance / dim), so binary hits stay comparable to the
+    cosine-based relevance thresholds.
+    """
+    return math.cos(math.pi * distance / dim)
+
+
+def scalar_quantize(matrix: np.ndarray) -> np.ndarray:
+    """Simulate IVF_SQ8: per-dimension min/max quantization to 8 bits and back"""
+    low = matrix.min(axis=0)
+    scale = (matrix.max(axis=0) - low) / 255.0
+    scale[scale == 0] = 1.0
+    codes = np.round((matrix - low) / scale)
+    return (codes * scale + low).astype(np.float32)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def rerank_vectors_path(collection_name: str) -> Path:
+    """Full-precision vectors kept next to the collection for exact reranking"""
+    return FAQ_LEXICAL_INDEX_DIR / f"{collection_name}.vectors.npz"
+
+
+class RerankVectors:
+    """
+    Full-precision (float16) copies of the indexed vectors, used to re-score the
+    candidates returned by a quantized index with exact cosine similarity.
+    """
+
+    def __init__(self, ids: List[str], matrix: np.ndarray):
+        self._positions = {doc_id: i for i, doc_id in enumerate(ids)}
+        self._matrix = normalize_rows(matrix.astype(np.float32))
+
+    def exact_scores(self, query_vector: Sequence[float], doc_ids: List[str]) -> Dict[str, float]:
+        """Cosine similarity between the query and each known candidate"""
+        known = [doc_id for doc_id in doc_ids if doc_id in self._positions]
+        if not known:
+            return {}
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self._matrix[[self._positions[doc_id] for doc_id in known]] @ query
+        return dict(zip(known, scores.tolist()))
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        ids = sorted(self._positions, key=self._positions.get)
+        tmp_path = path.with_name(path.name + '.tmp.npz')
+        np.savez_compressed(tmp_path, ids=np.array(json.dumps(ids)), matrix=self._matrix.astype(np.float16))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "RerankVectors":
+        with np.load(path) as data:
+            return cls(json.loads(str(data['ids'])), data['matrix'])
+
+    @classmethod
+    def load_if_exists(cls, path: Path) -> Optional["RerankVectors"]:
+        return cls.load(path) if path.exists() else None
+
+
+def exact_rerank(results: List[Dict], query_vector: Sequence[float],
+                 rerank_vectors: RerankVectors) -> List[Dict]:
+    """Replace approximate scores with exact cosine similarity and sort (best first)"""
+    exact = rerank_vectors.exact_scores(query_vector, [r['doc_id'] for r in results])
+    reranked = [{**r, 'relevance_score': exact.get(r['doc_id'], r['relevance_score'])} for r in results]
+    reranked.sort(key=lambda r: r['relevance_score'] or 0.0, reverse=True)
+    return reranked
@@ -0,0 +1,104 @@
+import os
+import re
+from typing import List, Optional
+from pymilvus import MilvusClient
+
+# The alias is the stable name searched by the workers; each indexing run creates
+# a new physical collection (faq_collection_vN) and only switches the alias once
+# the new version is fully indexed and loaded.
+FAQ_COLLECTION_ALIAS = os.getenv('FAQ_COLLECTION_ALIAS', 'faq_collection')
+
+# How many physical versions to keep around (active + previous, for rollback and
+# for workers that have not yet noticed the switch)
+FAQ_KEEP_VERSIONS = max(1, int(os.getenv('FAQ_KEEP_VERSIONS', 2)))
+
+_VERSION_PATTERN = re.compile(rf"^{re.escape(FAQ_COLLECTION_ALIAS)}_v(\d+)$")
+
+
+def versioned_collection_name(version: int) -> str:
+    """Return the physical collection name for a given index version"""
+    return f"{FAQ_COLLECTION_ALIAS}_v{version}"
+
+
+def parse_collection_version(collection_name: Optional[str]) -> Optional[int]:
+    """Extract the version number from a physical collection name"""
+    if not collection_name:
+        return None
+    match = _VERSION_PATTERN.match(collection_name)
+    return int(match.group(1)) if match else None
+
+
+def list_collection_versions(client: MilvusClient) -> List[int]:
+    """List the versions of the FAQ collection present in Milvus (ascending)"""
+    versions = []
+    for name in client.list_collections():
+        version = parse_collection_version(name)
+        if version is not None:
+            versions.append(version)
+    return sorted(versions)
+
+
+def next_collection_version(client: MilvusClient) -> int:
+    """Return the version number to use for a new indexing run"""
+    versions = list_collection_versions(client)
+    return versions[-1] + 1 if versions else 1
+
+
+def resolve_active_collection(client: MilvusClient) -> Optional[str]:
+    """Return the physical collection currently behind the alias, if any"""
+    try:
+        info = client.describe_alias(alias=FAQ_COLLECTION_ALIAS)
+    except Exception:
+        return None
+    return info.get('collection_name') if info else None
+
+
+def switch_alias(client: MilvusClient, collection_name: str):
+    """
+    Atomically point the alias to the given collection.
+
+    Milvus does not allow an alias and a collection to share the same name, so a
+    legacy (unversioned) collection using the alias name is renamed out of the way,
+    the alias is created, and only then the legacy collection is dropped. Searches
+    only miss during the rename -> create_alias gap, not while the legacy data is dropped.
+    """
+    if resolve_active_collection(client):
+        client.alter_alias(collection_name=collection_name, alias=FAQ_COLLECTION_ALIAS)
+        return
+
+    legacy_name = None
+    if FAQ_COLLECTION_ALIAS in client.list_collections():
+        legacy_name = f"{FAQ_COLLECTION_ALIAS}_legacy"
+        print(f"Renaming legacy unversioned collection '{FAQ_COLLECTION_ALIAS}' to '{legacy_name}' to create the alias")
+        client.rename_collection(old_name=FAQ_COLLECTION_ALIAS, new_name=legacy_name)
+
+    client.create_alias(collection_name=collection_name, alias=FAQ_COLLECTION_ALIAS)
+
+    if legacy_name:
+        print(f"Dropping legacy collection '{legacy_name}'")
+        client.drop_collection(collection_name=legacy_name)
+
+
+def garbage_collect_versions(client: MilvusClient, keep: int = FAQ_KEEP_VERSIONS) -> List[str]:
+    """
+    Drop old FAQ collection versions, keeping the newest `keep` ones.
+    The collection behind the alias is never dropped.
+
+    Returns:
+        Names of the dropped collections
+    """
+    active = resolve_active_collection(client)
+    versions = list_collection_versions(client)
+    dropped = []
+
+    for version in versions[:-keep] if keep > 0 else versions:
+        name = versioned_collection_name(version)
+        if name == active:
+            continue
+        try:
+            client.drop_collection(collection_name=name)
+            dropped.append(name)
+        except Exception as e:
+            print(f"Error dropping old collection {name}: {e}")
+
+    return dropped
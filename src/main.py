@@ -1,12 +1,21 @@
 import uvicorn
+from dataclasses import asdict
 from fastapi import FastAPI
 from whatsapp.webhook import app as webhook_app
-from database.config import engine
+from database.config import engine, pool_metrics
+from database.history_partitions import create_partitions, history_partitions
+from database.history_writer import history_writer
+from database.lead_writer import lead_writer
 from database.models import Base
+from resources.resource_manager import resource_manager, RESOURCE_WARM_UP
+from cache.redis_chat_session_manager import redis_session_manager
 import os
 
 # Cria tabelas do banco
 Base.metadata.create_all(bind=engine)
+# Partições mensais de conversation_history (a atual e as próximas)
+with engine.begin() as connection:
+    create_partitions(connection)
 
 # Aplicação principal
 app = FastAPI(title="Consórcio na Rede - Line Chatbot")
@@ -14,6 +23,42 @@ app = FastAPI(title="Consórcio na Rede - Line Chatbot")
 # Inclui rotas do WhatsApp
 app.mount("/whatsapp", webhook_app)
 
+@app.on_event("startup")
+async def on_startup():
+    # Clientes (Milvus, OpenAI, Redis) são criados sob demanda em cada worker;
+    # o warm-up opcional roda em background, fora do caminho de boot
+    resource_manager.mark_ready()
+    if RESOURCE_WARM_UP:
+        resource_manager.warm_up()
+    history_partitions.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Grava o que ainda está em memória: alterações de lead e fila do histórico
+    await lead_writer.drain()
+    await history_writer.drain()
+    await history_partitions.stop()
+
+@app.get("/metrics/resources")
+async def resource_metrics():
+    """Tempo de boot do worker, tempo até a primeira busca e clientes criados"""
+    return resource_manager.get_metrics()
+
+@app.get("/metrics/sessions")
+async def session_metrics():
+    """Sessões ativas, ativos do dia e bytes gravados por turno (contadores O(1), sem KEYS)"""
+    return asdict(await redis_session_manager.get_session_stats())
+
+@app.get("/metrics/database")
+async def database_metrics():
+    """Pool assíncrono do PostgreSQL, escritas de lead por turno, fila e partições do histórico"""
+    return {
+        **pool_metrics.get_stats(),
+        'lead_writes': lead_writer.get_stats(),
+        'history_writes': history_writer.get_stats(),
+        'history_partitions': history_partitions.get_stats()
+    }
+
 @app.get("/")
 async def root():
     return {
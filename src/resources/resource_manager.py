@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Warm up the registered resources in a background thread when a worker starts
+RESOURCE_WARM_UP = os.getenv('RESOURCE_WARM_UP', 'true').lower() in ('1', 'true', 'yes')
+
+
+class ResourceManager:
+    """
+    Per-process registry of network clients (Milvus, OpenAI, Redis...).
+
+    Nothing is created at import time: each client is built by its factory on the
+    first get(). Clients belong to the process that created them; after a fork
+    (gunicorn workers with preload_app) the inherited ones are dropped without being
+    closed, since their sockets are shared with the parent, and the worker creates
+    its own on the next get().
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._factories = {}
+            cls._instance._warm_ups = {}
+            cls._instance._fork_handlers = []
+            cls._instance._reset_process_state(forked=False)
+        return cls._instance
+
+    def _reset_process_state(self, forked: bool):
+        """Fresh state for the current process (all inherited clients are forgotten)"""
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+        self._resources: Dict[str, Any] = {}
+        self._started_at = time.monotonic()
+        self._metrics: Dict[str, Any] = {
+            'pid': self._pid,
+            'forked': forked,
+            'worker_boot_seconds': None,
+            'time_to_first_search_seconds': None,
+            'warm_up_seconds': None,
+            'resources_created': 0,
+            'creation_seconds': {},
+        }
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """Register how to build a client; it is only created on the first get()"""
+        self._factories[name] = factory
+
+    def register_warm_up(self, name: str, callback: Callable[[], None]):
+        """Register a callback run by warm_up() (e.g. connect and load an index)"""
+        self._warm_ups[name] = callback
+
+    def register_fork_handler(self, callback: Callable[[], None]):
+        """Register a callback run in the child process right after a fork"""
+        self._fork_handlers.append(callback)
+
+    def get(self, name: str) -> Any:
+        """Return the client of this process, creating it on first use"""
+        if self._pid != os.getpid():
+            self.after_fork()
+
+        resource = self._resources.get(name)
+        if resource is not None:
+            return resource
+
+        with self._lock:
+            if name not in self._resources:
+                if name not in self._factories:
+                    raise ValueError(f"Unknown resource: {name}")
+                started = time.perf_counter()
+                self._resources[name] = self._factories[name]()
+                elapsed = time.perf_counter() - started
+                self._metrics['resources_created'] += 1
+                self._metrics['creation_seconds'][name] = round(elapsed, 3)
+                logger.info(f"Resource '{name}' created in {elapsed:.2f}s (pid {self._pid})")
+            return self._resources[name]
+
+    def has(self, name: str) -> bool:
+        return self._pid == os.getpid() and name in self._resources
+
+    def discard(self, name: str) -> Optional[Any]:
+        """Forget a client of this process and return it so the caller can close it"""
+        with self._lock:
+            return self._resources.pop(name, None)
+
+    def after_fork(self):
+        """
+        Drop the clients inherited from the parent process. Called automatically in
+        the child (os.register_at_fork) and from gunicorn's post_fork; idempotent.
+        """
+        if self._pid == os.getpid():
+            return
+        self._reset_process_state(forked=True)
+        for handler in self._fork_handlers:
+            try:
+                handler()
+            except Exception as e:
+                logger.error(f"Error in fork handler {handler}: {e}")
+
+    def warm_up(self, background: bool = True):
+        """Run the registered warm-ups, by default in a daemon thread off the boot path"""
+        if not self._warm_ups:
+            return
+
+        def run():
+            started = time.monotonic()
+            for name, callback in list(self._warm_ups.items()):
+                try:
+                    callback()
+                except Exception as e:
+                    # Warm-up is best effort: the first request creates what is missing
+                    logger.error(f"Warm-up of '{name}' failed: {e}")
+            self._metrics['warm_up_seconds'] = round(time.monotonic() - started, 3)
+            logger.info(f"Warm-up finished in {self._metrics['warm_up_seconds']}s (pid {os.getpid()})")
+
+        if background:
+            threading.Thread(target=run, name="resource-warm-up", daemon=True).start()
+        else:
+            run()
+
+    def mark_ready(self):
+        """Record the worker boot time (fork or process start until the app is serving)"""
+        if self._metrics['worker_boot_seconds'] is None:
+            self._metrics['worker_boot_seconds'] = round(time.monotonic() - self._started_at, 3)
+            logger.info(f"Worker {os.getpid()} ready in {self._metrics['worker_boot_seconds']}s")
+
+    def record_search_success(self):
+        """Record the time until the first successful search of this process"""
+        if self._metrics['time_to_first_search_seconds'] is None:
+            self._metrics['time_to_first_search_seconds'] = round(time.monotonic() - self._started_at, 3)
+            logger.info(f"First successful search after {self._metrics['time_to_first_search_seconds']}s "
+                        f"(pid {os.getpid()})")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        metrics = dict(self._metrics)
+        metrics['creation_seconds'] = dict(self._metrics['creation_seconds'])
+        metrics['resources'] = sorted(self._resources) if self._pid == os.getpid() else []
+        return metrics
+
+
+# Instância global
+resource_manager = ResourceManager()
+
+# Fork safety even outside gunicorn (multiprocessing, uvicorn --workers...)
+os.register_at_fork(after_in_child=resource_manager.after_fork)
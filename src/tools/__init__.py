@@ -1,4 +1,5 @@
 from .knowledge_search_tool import KnowledgeSearchTool, get_knowledge_search_tool, knowledge_search_tool
+from .async_knowledge_search_tool import AsyncKnowledgeSearchTool, get_async_knowledge_search_tool
 from .simulation_tool import VehicleSimulationTool, vehicle_simulation_tool
 from .lead_qualification_tool import LeadQualificationTool, lead_qualification_tool
 
@@ -6,6 +7,8 @@ __all__ = [
     "KnowledgeSearchTool",
     "get_knowledge_search_tool",
     "knowledge_search_tool",
+    "AsyncKnowledgeSearchTool",
+    "get_async_knowledge_search_tool",
     "VehicleSimulationTool",
     "vehicle_simulation_tool",
     "LeadQualificationTool",
@@ -0,0 +1,262 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import ClassVar, Dict, List, Optional
+from pymilvus import AsyncMilvusClient
+from tools.knowledge_search_tool import (
+    FAQ_GROUP_LIMIT,
+    FAQ_HYBRID_CANDIDATES,
+    FAQ_VERSION_CHECK_INTERVAL,
+    KnowledgeSearchTool,
+)
+from cache.search_result_cache import search_result_cache
+from resources.resource_manager import resource_manager
+
+logger = logging.getLogger(__name__)
+
+# Use the async variant for the crew's knowledge_search tool
+FAQ_ASYNC_SEARCH = os.getenv('FAQ_ASYNC_SEARCH', 'false').lower() in ('1', 'true', 'yes')
+
+# Maximum searches in flight per worker (embedding + Milvus); the rest wait for a slot
+FAQ_SEARCH_CONCURRENCY = int(os.getenv('FAQ_SEARCH_CONCURRENCY', 16))
+
+# Per-call timeouts (seconds)
+FAQ_EMBEDDING_TIMEOUT = float(os.getenv('FAQ_EMBEDDING_TIMEOUT', 5))
+FAQ_MILVUS_TIMEOUT = float(os.getenv('FAQ_MILVUS_TIMEOUT', 3))
+FAQ_TOOL_TIMEOUT = float(os.getenv('FAQ_TOOL_TIMEOUT', 10))
+
+
+def _create_async_milvus_client() -> AsyncMilvusClient:
+    """Async Milvus client; must be created on the loop that will use it"""
+    milvus_uri = os.getenv('MILVUS_URI')
+    milvus_token = os.getenv('MILVUS_TOKEN')
+
+    if not milvus_uri:
+        raise ValueError("MILVUS_URI environment variable is required")
+    if not milvus_token:
+        raise ValueError("MILVUS_TOKEN environment variable is required")
+
+    return AsyncMilvusClient(uri=milvus_uri, token=milvus_token)
+
+resource_manager.register('milvus_async', _create_async_milvus_client)
+
+
+class _SearchLoop:
+    """
+    Event loop running in a daemon thread, where every async search of the process runs.
+
+    Async clients (gRPC channels, httpx pools) are bound to the loop that created
+    them, so they all live on this one loop; callers on other threads or loops
+    submit coroutines to it. Recreated in each worker after a fork.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="knowledge-search-loop", daemon=True).start()
+                self.semaphore = asyncio.Semaphore(FAQ_SEARCH_CONCURRENCY)
+                self._loop = loop
+                self._pid = os.getpid()
+        return self._loop
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def after_fork(self):
+        # The loop thread doesn't exist in the child; a new one is started on first use
+        self._lock = threading.Lock()
+        self._loop = None
+
+
+_search_loop = _SearchLoop()
+resource_manager.register_fork_handler(_search_loop.after_fork)
+
+
+class AsyncKnowledgeSearchTool(KnowledgeSearchTool):
+    """
+    knowledge_search with async embedding and Milvus calls.
+
+    Searches from many conversations overlap on a shared event loop instead of each
+    holding a worker thread for the whole embedding + search round trip; in-flight
+    searches are capped by FAQ_SEARCH_CONCURRENCY and each call has its own timeout.
+    """
+
+    # Own warm-up entry: the sync tool's one stays registered next to it
+    warm_up_key: ClassVar[str] = "knowledge_search_async"
+
+    def __init__(self):
+        super().__init__()
+        self._metrics['timeouts'] = 0
+
+    def _run(self, query: str, source_file: Optional[str] = None) -> str:
+        """Sync entry point used by CrewAI: waits for the search on the shared loop"""
+        future = _search_loop.submit(self._arun(query, source_file))
+        try:
+            return future.result(timeout=FAQ_TOOL_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self._metrics['timeouts'] += 1
+            logger.error(f"Knowledge search timed out after {FAQ_TOOL_TIMEOUT}s")
+            return "Error searching knowledge base: timed out"
+
+    async def arun(self, query: str, source_file: Optional[str] = None) -> str:
+        """Await the search from any event loop without blocking it"""
+        future = _search_loop.submit(self._arun(query, source_file))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), FAQ_TOOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._metrics['timeouts'] += 1
+            logger.error(f"Knowledge search timed out after {FAQ_TOOL_TIMEOUT}s")
+            return "Error searching knowledge base: timed out"
+
+    async def _arun(self, query: str, source_file: Optional[str] = None) -> str:
+        try:
+            normalized_query = self._normalize_query_input(query)
+
+            # Same question, same priority file, same index version -> same output
+            cache_version = await self._aresult_cache_version()
+            if cache_version:
+                # The result cache uses the sync Redis client: keep it off the shared loop
+                cached_output = await asyncio.to_thread(
+                    search_result_cache.get, normalized_query, source_file, cache_version
+                )
+                if cached_output is not None:
+                    self._metrics['result_cache_hits'] += 1
+                    logger.info("Answered from the result cache")
+                    return self._record_output(cached_output)
+
+            logger.info(f"Searching knowledge base for query: {normalized_query}")
+            results = await self._asearch_knowledge_base(normalized_query, source_file)
+
+            if not results:
+                if source_file:
+                    return f"No relevant information found in priority file '{source_file}' or other files."
+                else:
+                    return "No relevant information found in the knowledge base."
+
+            resource_manager.record_search_success()
+
+            output = self._format_output(results, source_file)
+            if cache_version:
+                await asyncio.to_thread(
+                    search_result_cache.set, normalized_query, source_file, cache_version, output
+                )
+            return self._record_output(output)
+
+        except Exception as e:
+            logger.error(f"Error searching knowledge base: {str(e)}")
+            return f"Error searching knowledge base: {str(e)}"
+
+    async def _aresult_cache_version(self) -> Optional[str]:
+        # Connecting and re-resolving the alias use the sync client: keep them off the loop
+        if self._ready_pid != os.getpid() or \
+                time.monotonic() - self._version_checked_at >= FAQ_VERSION_CHECK_INTERVAL:
+            return await asyncio.to_thread(self._result_cache_version)
+        return self._collection_name
+
+    async def _asearch_knowledge_base(self, query: str, source_file: Optional[str] = None) -> List[Dict]:
+        """Same strategy as _search_knowledge_base, with async embedding and vector search"""
+        self._metrics['tool_calls'] += 1
+        try:
+            if 'lexical_index' not in self._version_cache:
+                # First use of this version may rebuild the index from Milvus
+                await asyncio.to_thread(self._get_lexical_index)
+
+            lexical_index, lexical_ranking, early_results = self._lexical_stage(query, source_file)
+            if early_results is not None:
+                return early_results
+
+            async with _search_loop.semaphore:
+                search_embedding = await asyncio.wait_for(self.aget_embedding(query), FAQ_EMBEDDING_TIMEOUT)
+
+                if source_file:
+                    # Best hit per source file in a single grouped request
+                    vector_results = await self._aperform_search(
+                        search_embedding,
+                        self._search_params(),
+                        limit=FAQ_GROUP_LIMIT,
+                        group_by_field="source_file"
+                    )
+                else:
+                    vector_results = await self._aperform_search(
+                        search_embedding, self._search_params(), limit=FAQ_HYBRID_CANDIDATES
+                    )
+
+            return self._select_results(query, vector_results, lexical_ranking, lexical_index, source_file)
+
+        except asyncio.TimeoutError:
+            self._metrics['timeouts'] += 1
+            logger.error(f"Knowledge search timed out (embedding {FAQ_EMBEDDING_TIMEOUT}s / Milvus {FAQ_MILVUS_TIMEOUT}s)")
+            return []
+        except Exception as e:
+            print(f"Error searching knowledge base: {e}")
+            return []
+
+    async def aget_embedding(self, text: str) -> List[float]:
+        self._metrics['embedding_requests'] += 1
+        return await self._embedding_backend.aembed(text)
+
+    async def _aperform_search(self, search_embedding: List[float], search_params: Dict,
+                               source_file: Optional[str] = None, limit: int = 1,
+                               group_by_field: Optional[str] = None) -> List[Dict]:
+        """Vector search with the async Milvus client (see _perform_search)"""
+        try:
+            request = self._search_request(search_embedding, source_file, limit, group_by_field)
+
+            self._metrics['backend_requests'] += 1
+            search_results = await asyncio.wait_for(
+                resource_manager.get('milvus_async').search(
+                    collection_name=self._collection_name,
+                    data=[request['data']],
+                    anns_field="embedding",
+                    search_params=search_params,
+                    limit=request['limit'],
+                    filter=request['expr'] or "",
+                    output_fields=request['output_fields'],
+                    timeout=FAQ_MILVUS_TIMEOUT,
+                    **request['kwargs']
+                ),
+                FAQ_MILVUS_TIMEOUT
+            )
+
+            hits = [(hit['id'], hit['entity'], hit['distance']) for batch in search_results for hit in batch]
+            return self._format_hits(hits, search_embedding, limit)
+
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            print(f"Error performing search: {e}")
+            return []
+
+    def warm_up(self):
+        """Also create the async clients, on the loop that will use them"""
+        super().warm_up()
+        _search_loop.submit(self._awarm_up()).result(timeout=FAQ_TOOL_TIMEOUT)
+
+    async def _awarm_up(self):
+        resource_manager.get('milvus_async')
+        if self._embedding_backend.name == 'openai':
+            resource_manager.get('openai_async')
+
+
+_async_knowledge_search_tool: Optional[AsyncKnowledgeSearchTool] = None
+
+
+def get_async_knowledge_search_tool() -> AsyncKnowledgeSearchTool:
+    """Shared async tool instance (created on first call)"""
+    global _async_knowledge_search_tool
+    if _async_knowledge_search_tool is None:
+        _async_knowledge_search_tool = AsyncKnowledgeSearchTool()
+    return _async_knowledge_search_tool
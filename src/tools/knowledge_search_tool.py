@@ -1,11 +1,27 @@
 import os
-from typing import List, Dict, Optional
-from pymilvus import connections, Collection
-from openai import OpenAI
+import threading
+import time
+from typing import ClassVar, List, Dict, Optional
+from pymilvus import connections, Collection, MilvusClient
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 import logging
 from pathlib import Path
+from knowledge.versioning import FAQ_COLLECTION_ALIAS, parse_collection_version, resolve_active_collection
+from knowledge.embeddings import FAQ_EMBEDDING_PRELOAD, get_embedding_backend, is_index_compatible, parse_index_tag
+from knowledge.quantization import (
+    RerankVectors,
+    binarize,
+    exact_rerank,
+    hamming_to_cosine,
+    metric_for,
+    rerank_vectors_path,
+)
+from knowledge.lexical_index import BM25Index, fold_accents, load_or_build_lexical_index, reciprocal_rank_fusion, tokenize
+from knowledge.collection_schema import FAQ_STORED_FIELDS, stored_fields
+from knowledge.passages import best_snippet
+from resources.resource_manager import resource_manager
+from cache.search_result_cache import search_result_cache
 
 # Carregar variáveis de ambiente do .env
 try:
@@ -19,6 +35,58 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# How often (seconds) each worker checks whether the alias points to a new index version
+FAQ_VERSION_CHECK_INTERVAL = float(os.getenv('FAQ_VERSION_CHECK_INTERVAL', 30))
+
+# Minimum relevance for a priority-file hit to win over the best hit overall
+FAQ_PRIORITY_THRESHOLD = float(os.getenv('FAQ_PRIORITY_THRESHOLD', 0.7))
+
+# Maximum number of source files returned by a grouped search (must be >= number of FAQ files)
+FAQ_GROUP_LIMIT = int(os.getenv('FAQ_GROUP_LIMIT', 32))
+
+# Hybrid retrieval: candidates taken from each retriever and reciprocal rank fusion constant
+FAQ_HYBRID_CANDIDATES = int(os.getenv('FAQ_HYBRID_CANDIDATES', 5))
+FAQ_RRF_K = int(os.getenv('FAQ_RRF_K', 60))
+
+# Answer from the lexical index alone (no embedding call) when its top hit is unambiguous
+FAQ_LEXICAL_ONLY = os.getenv('FAQ_LEXICAL_ONLY', 'true').lower() in ('1', 'true', 'yes')
+FAQ_LEXICAL_MARGIN = float(os.getenv('FAQ_LEXICAL_MARGIN', 1.5))
+FAQ_LEXICAL_MIN_TERMS = int(os.getenv('FAQ_LEXICAL_MIN_TERMS', 2))
+
+# Quantized indexes (sq8/binary): re-score this many candidates with exact cosine similarity
+FAQ_EXACT_RERANK = os.getenv('FAQ_EXACT_RERANK', 'true').lower() in ('1', 'true', 'yes')
+FAQ_RERANK_CANDIDATES = int(os.getenv('FAQ_RERANK_CANDIDATES', 20))
+
+# Fields stored for every FAQ passage (versions indexed before passages lack the passage fields)
+FAQ_OUTPUT_FIELDS = FAQ_STORED_FIELDS
+
+# Answer size budget per result given to the LLM (characters, ~4 per token): the best
+# passage plus other matching passages of the same entry while they fit. Like the
+# passage split it only bounds long answers; the shipped FAQs (longest 351) never hit it
+FAQ_ANSWER_MAX_CHARS = int(os.getenv('FAQ_ANSWER_MAX_CHARS', 800))
+
+# IVF search breadth (clusters probed per query); see knowledge.benchmark to tune it
+FAQ_SEARCH_NPROBE = int(os.getenv('FAQ_SEARCH_NPROBE', 10))
+
+def milvus_connection_alias() -> str:
+    """ORM connection alias of the current process (never the one inherited from a parent)"""
+    return f"faq-{os.getpid()}"
+
+def _create_milvus_client() -> MilvusClient:
+    """Connect to Milvus (ORM connection for collections + MilvusClient for aliases)"""
+    milvus_uri = os.getenv('MILVUS_URI')
+    milvus_token = os.getenv('MILVUS_TOKEN')
+
+    if not milvus_uri:
+        raise ValueError("MILVUS_URI environment variable is required")
+    if not milvus_token:
+        raise ValueError("MILVUS_TOKEN environment variable is required")
+
+    connections.connect(alias=milvus_connection_alias(), uri=milvus_uri, token=milvus_token)
+    return MilvusClient(uri=milvus_uri, token=milvus_token)
+
+resource_manager.register('milvus', _create_milvus_client)
+
 class KnowledgeSearchInput(BaseModel):
     """Input schema for knowledge search tool"""
     query: str = Field(..., description="Mensagem de entrada do usuário")
@@ -30,6 +98,8 @@ class KnowledgeSearchTool(BaseTool):
     name: str = "knowledge_search"
     description: str = "Search FAQ knowledge base for consortium information."
     args_schema: type[BaseModel] = KnowledgeSearchInput
+    # Key of this tool's warm-up in the resource manager (one per tool class)
+    warm_up_key: ClassVar[str] = "knowledge_search"
 
     def __init__(self):
         super().__init__(
@@ -37,51 +107,163 @@ class KnowledgeSearchTool(BaseTool):
             description="Search FAQ knowledge base for consortium information. Uses semantic search to find relevant entries for consortium, financing, and related questions.",
             args_schema=KnowledgeSearchInput
         )
-        self._setup_connections()
-
-    def _setup_connections(self):
-        """Setup connections to OpenAI and Milvus"""
-        # Load environment variables
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required")
-
+        # Nothing is connected here: the tool is created at import time (in the gunicorn
+        # master with preload_app), so connections are opened on first use in each worker
         # Store as private attributes (not Pydantic fields)
-        object.__setattr__(self, '_api_key', api_key)
-        object.__setattr__(self, '_client', OpenAI(api_key=api_key))
-
-        # Connect to Milvus
-        milvus_uri = os.getenv('MILVUS_URI')
-        milvus_token = os.getenv('MILVUS_TOKEN')
+        object.__setattr__(self, '_ready_pid', None)
+        object.__setattr__(self, '_setup_lock', threading.Lock())
+        object.__setattr__(self, '_collection', None)
+        object.__setattr__(self, '_collection_name', None)
+        object.__setattr__(self, '_index_version', None)
+
+        # Counters exposed through get_metrics()
+        object.__setattr__(self, '_metrics', {
+            'tool_calls': 0,
+            'backend_requests': 0,
+            'embedding_requests': 0,
+            'lexical_only_answers': 0,
+            'priority_hits': 0,
+            'priority_fallbacks': 0,
+            'result_cache_hits': 0,
+            'output_calls': 0,
+            'output_chars': 0,
+            'answer_chars_omitted': 0
+        })
+
+        resource_manager.register_fork_handler(self._after_fork)
+        resource_manager.register_warm_up(self.warm_up_key, self.warm_up)
+
+    def _after_fork(self):
+        # A lock held by another thread at fork time would never be released in the child
+        object.__setattr__(self, '_setup_lock', threading.Lock())
+        object.__setattr__(self, '_ready_pid', None)
+
+    def _ensure_ready(self):
+        """Set up the connections on first use in this process (again after a fork)"""
+        if self._ready_pid == os.getpid():
+            return
+        with self._setup_lock:
+            if self._ready_pid != os.getpid():
+                self._setup_connections()
+                object.__setattr__(self, '_ready_pid', os.getpid())
+
+    def warm_up(self):
+        """Connect, load the embedding model, the active index version and its lexical index"""
+        self._ensure_ready()
+        if FAQ_EMBEDDING_PRELOAD:
+            # Local model: loaded in this worker's warm-up thread, never in the gunicorn master
+            self._embedding_backend.preload()
+        self._get_lexical_index()
 
-        if not milvus_uri:
-            raise ValueError("MILVUS_URI environment variable is required")
-        if not milvus_token:
-            raise ValueError("MILVUS_TOKEN environment variable is required")
+    def _setup_connections(self):
+        """Setup the embedding backend and the connection to Milvus"""
+        # Backend selected by FAQ_EMBEDDING_BACKEND (OpenAI API or local model)
+        object.__setattr__(self, '_embedding_backend', get_embedding_backend())
 
         try:
-            # Establish connection using connections module
-            connections.connect(
-                uri=milvus_uri,
-                token=milvus_token
-            )
+            # MilvusClient is only used to resolve which version the alias points to;
+            # created once per process by the resource manager
+            object.__setattr__(self, '_milvus_client', resource_manager.get('milvus'))
 
-            # Get the collection
-            collection = Collection(name="faq_collection")
-            collection.load()  # Load collection into memory for search
-            object.__setattr__(self, '_collection', collection)
+            object.__setattr__(self, '_collection', None)
+            object.__setattr__(self, '_collection_name', None)
+            object.__setattr__(self, '_index_version', None)
+            object.__setattr__(self, '_version_checked_at', 0.0)
+            object.__setattr__(self, '_version_lock', threading.Lock())
+            # Data derived from a specific index version; dropped whenever the version changes
+            object.__setattr__(self, '_version_cache', {})
+
+            self._refresh_index_version(force=True)
 
         except Exception as e:
             print(f"Error connecting to Milvus: {e}")
             raise
 
-    def get_embedding(self, text: str) -> List[float]:
-        """Generate embedding for given text using OpenAI API"""
-        response = self._client.embeddings.create(  # type: ignore
-            model="text-embedding-3-small",
-            input=text
+    def _refresh_index_version(self, force: bool = False):
+        """
+        Re-resolve the FAQ alias and switch to the new collection version if it changed.
+
+        Checked at most every FAQ_VERSION_CHECK_INTERVAL seconds, so a re-index is
+        picked up by running workers without a restart.
+        """
+        now = time.monotonic()
+        if not force and now - self._version_checked_at < FAQ_VERSION_CHECK_INTERVAL:
+            return
+
+        with self._version_lock:
+            if not force and now - self._version_checked_at < FAQ_VERSION_CHECK_INTERVAL:
+                return
+            object.__setattr__(self, '_version_checked_at', now)
+
+            # Fall back to the alias itself (e.g. legacy unversioned collection)
+            collection_name = resolve_active_collection(self._milvus_client) or FAQ_COLLECTION_ALIAS
+            if collection_name == self._collection_name and self._collection is not None:
+                return
+
+            try:
+                collection = Collection(name=collection_name, using=milvus_connection_alias())
+                collection.load()  # No-op if the indexer already loaded it
+            except Exception as e:
+                # Keep serving from the current version if the new one is not usable
+                logger.error(f"Error loading FAQ collection {collection_name}: {e}")
+                if self._collection is None:
+                    raise
+                return
+
+            previous_name = self._collection_name
+            object.__setattr__(self, '_collection', collection)
+            object.__setattr__(self, '_collection_name', collection_name)
+            object.__setattr__(self, '_index_version', parse_collection_version(collection_name))
+            self._on_index_version_change(previous_name, collection_name)
+
+    def _on_index_version_change(self, previous_name: Optional[str], collection_name: str):
+        """Drop everything derived from the previous index version"""
+        self._version_cache.clear()
+        search_result_cache.clear_local()
+
+        # Vectors from a different embedding backend/model are not comparable
+        index_tag = parse_index_tag(self._collection.description)
+        compatible = is_index_compatible(index_tag, self._embedding_backend.tag)
+        self._version_cache['embedding_compatible'] = compatible
+        # Storage mode decides the search metric and how the query vector is encoded
+        self._version_cache['storage'] = index_tag.get('storage', 'float')
+        self._version_cache['vector_dim'] = next(
+            (field.params.get('dim') for field in self._collection.schema.fields if field.name == 'embedding'),
+            None
         )
-        return response.data[0].embedding
+        self._version_cache['output_fields'] = stored_fields(self._collection)
+        if not compatible:
+            logger.error(
+                f"FAQ collection {collection_name} was indexed with {index_tag} but queries use "
+                f"{self._embedding_backend.tag}; vector search disabled until the index is rebuilt"
+            )
+        if previous_name:
+            logger.info(f"FAQ index switched from {previous_name} to {collection_name}")
+        else:
+            logger.info(f"Using FAQ collection {collection_name}")
+
+    def get_metrics(self) -> Dict[str, float]:
+        """Return search counters, including the average number of backend requests per tool call"""
+        metrics: Dict[str, float] = dict(self._metrics)
+        calls = metrics['tool_calls']
+        metrics['backend_requests_per_call'] = round(metrics['backend_requests'] / calls, 3) if calls else 0.0
+        outputs = metrics['output_calls']
+        metrics['output_chars_per_call'] = round(metrics['output_chars'] / outputs, 1) if outputs else 0.0
+        return metrics
+
+    def get_result_cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """Result cache hits/misses per priority (profile) file"""
+        return search_result_cache.get_stats()
+
+    @property
+    def index_version(self) -> Optional[int]:
+        """Version of the FAQ index currently used for searches (None if unversioned)"""
+        return self._index_version
+
+    def get_embedding(self, text: str) -> List[float]:
+        """Generate embedding for given text using the configured backend"""
+        self._metrics['embedding_requests'] += 1
+        return self._embedding_backend.embed(text)
 
     def _run(self, query: str, source_file: Optional[str] = None) -> str:
         """
@@ -98,6 +280,15 @@ class KnowledgeSearchTool(BaseTool):
             # ✅ ROBUSTA: Normalize query input (handle both string and dict inputs)
             normalized_query = self._normalize_query_input(query)
 
+            # Same question, same priority file, same index version -> same output
+            cache_version = self._result_cache_version()
+            if cache_version:
+                cached_output = search_result_cache.get(normalized_query, source_file, cache_version)
+                if cached_output is not None:
+                    self._metrics['result_cache_hits'] += 1
+                    logger.info("Answered from the result cache")
+                    return self._record_output(cached_output)
+
             logger.info(f"Searching knowledge base for query: {normalized_query}")
             if source_file:
                 logger.info(f"Using priority search strategy for file: {source_file}")
@@ -113,24 +304,48 @@ class KnowledgeSearchTool(BaseTool):
                 else:
                     return "No relevant information found in the knowledge base."
 
-            # Format the results
-            formatted_results = []
-            for i, result in enumerate(results):
-                priority_indicator = ""
-                if source_file and result['source_file'] == source_file:
-                    priority_indicator = " (PRIORITY FILE)"
-
-                result_text = f"""
-                    Resposta: {result['answer']}
-                    ---"""
-                formatted_results.append(result_text)
+            resource_manager.record_search_success()
 
-            return "\n".join(formatted_results)
+            output = self._format_output(results, source_file)
+            if cache_version:
+                search_result_cache.set(normalized_query, source_file, cache_version, output)
+            return self._record_output(output)
 
         except Exception as e:
             logger.error(f"Error searching knowledge base: {str(e)}")
             return f"Error searching knowledge base: {str(e)}"
 
+    def _format_output(self, results: List[Dict], source_file: Optional[str]) -> str:
+        """Format the search results as the tool output given to the LLM"""
+        formatted_results = []
+        for i, result in enumerate(results):
+            priority_indicator = ""
+            if source_file and result['source_file'] == source_file:
+                priority_indicator = " (PRIORITY FILE)"
+
+            result_text = f"""
+                Resposta: {result['answer']}
+                ---"""
+            formatted_results.append(result_text)
+
+        return "\n".join(formatted_results)
+
+    def _record_output(self, output: str) -> str:
+        """Count the size of the tool output that goes into the prompt"""
+        self._metrics['output_calls'] += 1
+        self._metrics['output_chars'] += len(output)
+        return output
+
+    def _result_cache_version(self) -> Optional[str]:
+        """Active collection version for the result cache key (None disables caching for this call)"""
+        try:
+            self._ensure_ready()
+            self._refresh_index_version()
+            return self._collection_name
+        except Exception as e:
+            logger.error(f"Result cache disabled for this call: {e}")
+            return None
+
     def _normalize_query_input(self, query) -> str:
         """
         Normalize query input to handle various formats from CrewAI.
@@ -173,117 +388,341 @@ class KnowledgeSearchTool(BaseTool):
         Internal method to search knowledge base and return structured results
 
         Strategy:
-        1. If source_file is provided, search first with high priority in that file
-        2. If no good results (score < threshold), expand search to all files
-        3. If source_file not provided, search all files normally
+        1. Rank candidates with the local BM25 index; if its top hit is unambiguous, answer
+           from it directly without any embedding call or Milvus request
+        2. Otherwise run the vector search and fuse both rankings (reciprocal rank fusion)
+        3. If source_file is provided, the vector search is a single request grouped by
+           source_file, which returns the best hit of every file (priority file included)
+        4. If the priority file's best hit is good enough (score > threshold), return it;
+           otherwise return the best fused hit overall - decided locally, without a second request
 
         Args:
             query: The search query
             source_file: Optional filename to prioritize in search (e.g., "lance embutido.txt")
         """
+        self._metrics['tool_calls'] += 1
         try:
+            # Connect on first use in this worker
+            self._ensure_ready()
+
+            # Pick up a new index version if the alias was switched
+            self._refresh_index_version()
+
+            lexical_index, lexical_ranking, early_results = self._lexical_stage(query, source_file)
+            if early_results is not None:
+                return early_results
+
             # Generate embedding for the user query
             search_embedding = self.get_embedding(query)
 
-            # Define search parameters
-            search_params = {
-                "metric_type": "COSINE",
-                "params": {"nprobe": 10}
-            }
-
             # Strategy: Priority search if source_file is specified
             if source_file:
-                # Step 1: Search with high priority in the specified file
-                priority_results = self._perform_search(
+                # Best hit per source file, sorted by relevance (descending)
+                vector_results = self._perform_search(
                     search_embedding,
-                    search_params,
-                    source_file,
-                    limit=1  # Get more results from priority file
+                    self._search_params(),
+                    None,
+                    limit=FAQ_GROUP_LIMIT,
+                    group_by_field="source_file"
                 )
+            else:
+                # No source_file specified, normal search across all files
+                vector_results = self._perform_search(search_embedding, self._search_params(), None, limit=FAQ_HYBRID_CANDIDATES)
+
+            return self._select_results(query, vector_results, lexical_ranking, lexical_index, source_file)
 
-                # Check if we have good quality results from priority file
-                # Consider score > 0.7 as good quality (adjust threshold as needed)
-                good_priority_results = [r for r in priority_results if r['relevance_score'] > 0.7]
+        except Exception as e:
+            print(f"Error searching knowledge base: {e}")
+            return []
 
-                if good_priority_results:
-                    logger.info(f"Found {len(good_priority_results)} good results in priority file: {source_file}")
-                    return good_priority_results[:1]  # Return best result from priority file
+    def _lexical_stage(self, query: str, source_file: Optional[str]):
+        """
+        Rank candidates with the local BM25 index.
 
-                # Step 2: If no good results in priority file, search all files
-                logger.info(f"No good results in priority file {source_file}, expanding search to all files")
-                all_results = self._perform_search(search_embedding, search_params, None, limit=1)
+        Returns:
+            (lexical_index, lexical_ranking, early_results): early_results is set when the
+            search can be answered without the vector search (unambiguous lexical hit, or
+            index built with another embedding backend)
+        """
+        # Lexical retrieval (local, no network)
+        lexical_index = self._get_lexical_index()
+        lexical_ranking = lexical_index.search(query, limit=FAQ_HYBRID_CANDIDATES) if lexical_index else []
+
+        lexical_answer = self._lexical_only_answer(lexical_index, query, lexical_ranking, source_file)
+        if lexical_answer:
+            self._metrics['lexical_only_answers'] += 1
+            logger.info("Answered from the lexical index without embedding the query")
+            return lexical_index, lexical_ranking, [self._assemble_answer(query, lexical_answer, [])]
+
+        if not self._version_cache.get('embedding_compatible', True):
+            # Index built with another embedding backend: lexical results only
+            return lexical_index, lexical_ranking, [
+                self._assemble_answer(query, self._result_from_document(doc_id, lexical_index.documents[doc_id], None), [])
+                for doc_id, _ in lexical_ranking[:1]
+            ] if lexical_index else []
+
+        return lexical_index, lexical_ranking, None
+
+    def _search_params(self) -> Dict:
+        """Milvus search parameters for the storage mode of the active version"""
+        return {
+            "metric_type": metric_for(self._version_cache.get('storage', 'float')),
+            "params": {"nprobe": FAQ_SEARCH_NPROBE}
+        }
+
+    def _select_results(self, query: str, vector_results: List[Dict], lexical_ranking: List,
+                        lexical_index: Optional[BM25Index], source_file: Optional[str]) -> List[Dict]:
+        """Fuse both rankings and pick the answer, preferring a good hit from the priority file"""
+        results = self._fuse_results(vector_results, lexical_ranking, lexical_index)
+
+        if source_file:
+            # Check if we have good quality results from priority file
+            priority_results = [r for r in results if r['source_file'] == source_file]
+            good_priority_results = [
+                r for r in priority_results
+                if (r['relevance_score'] or 0.0) > FAQ_PRIORITY_THRESHOLD
+            ]
+
+            if good_priority_results:
+                self._metrics['priority_hits'] += 1
+                logger.info(f"Found {len(good_priority_results)} good results in priority file: {source_file}")
+                # Return best result from priority file
+                return [self._assemble_answer(query, good_priority_results[0], results)]
+
+            # No good results in priority file: fall back to the best result overall
+            self._metrics['priority_fallbacks'] += 1
+            logger.info(f"No good results in priority file {source_file}, using best result across all files")
+
+        return [self._assemble_answer(query, result, results) for result in results[:1]]
+
+    def _assemble_answer(self, query: str, best: Dict, candidates: List[Dict]) -> Dict:
+        """
+        Answer text for the chosen hit within FAQ_ANSWER_MAX_CHARS: its passage plus the
+        other passages of the same entry found among the candidates (best first, while
+        they fit), in their original order.
+        """
+        chosen = [best]
+        used = len(best['answer'])
+        for candidate in candidates:
+            if candidate['parent_id'] != best['parent_id'] or candidate['doc_id'] == best['doc_id']:
+                continue
+            if any(c['passage_index'] == candidate['passage_index'] for c in chosen):
+                continue
+            if used + len(candidate['answer']) + 1 > FAQ_ANSWER_MAX_CHARS:
+                continue
+            chosen.append(candidate)
+            used += len(candidate['answer']) + 1
+
+        chosen.sort(key=lambda c: c['passage_index'])
+        # Answers indexed whole (before passage splitting) are cut to their best passage
+        answer = best_snippet(query, ' '.join(c['answer'] for c in chosen), FAQ_ANSWER_MAX_CHARS)
+
+        full_chars = self._parent_answer_chars().get(best['parent_id'], len(best['answer']))
+        self._metrics['answer_chars_omitted'] += max(full_chars - len(answer), 0)
+        return {**best, 'answer': answer}
+
+    def _parent_answer_chars(self) -> Dict[str, int]:
+        """Full answer length of every entry (sum of its passages), cached per version"""
+        if 'parent_answer_chars' not in self._version_cache:
+            totals: Dict[str, int] = {}
+            lexical_index = self._get_lexical_index()
+            if lexical_index:
+                for doc_id, document in lexical_index.documents.items():
+                    parent_id = document.get('parent_id') or doc_id
+                    totals[parent_id] = totals.get(parent_id, 0) + len(document.get('a', ''))
+            self._version_cache['parent_answer_chars'] = totals
+        return self._version_cache['parent_answer_chars']
+
+    def _get_lexical_index(self) -> Optional[BM25Index]:
+        """
+        Return the BM25 index of the active collection version.
 
-                # Combine and sort results: priority file results first, then others
-                combined_results = priority_results + [r for r in all_results if r['source_file'] != source_file]
+        Loaded from the file written by the indexer or, when this host doesn't have it,
+        rebuilt once from the collection contents. Cached until the version changes.
+        """
+        if 'lexical_index' in self._version_cache:
+            return self._version_cache['lexical_index']
+
+        with self._version_lock:
+            if 'lexical_index' in self._version_cache:
+                return self._version_cache['lexical_index']
+
+            lexical_index = None
+            try:
+                lexical_index = load_or_build_lexical_index(
+                    self._collection,
+                    self._collection_name,
+                    self._version_cache.get('output_fields', FAQ_OUTPUT_FIELDS)
+                )
+                logger.info(f"Lexical index ready for {self._collection_name} ({len(lexical_index.documents)} documents)")
+            except Exception as e:
+                # Hybrid retrieval degrades to vector-only for this version
+                logger.error(f"Error loading lexical index for {self._collection_name}: {e}")
 
-                # Sort by relevance score (descending) and return top result
-                combined_results.sort(key=lambda x: x['relevance_score'], reverse=True)
-                return combined_results[:1] if combined_results else []
+            self._version_cache['lexical_index'] = lexical_index
+            return lexical_index
 
-            else:
-                # No source_file specified, normal search across all files
-                return self._perform_search(search_embedding, search_params, None, limit=1)
+    def _lexical_only_answer(self, lexical_index: Optional[BM25Index], query: str,
+                             lexical_ranking: List, source_file: Optional[str]) -> Optional[Dict]:
+        """
+        Return the top lexical hit if it can be trusted without the vector search:
+        it contains every query term and clearly beats the best hit for a different question.
+        """
+        if not FAQ_LEXICAL_ONLY or not lexical_index or not lexical_ranking:
+            return None
+        if len(set(tokenize(query))) < FAQ_LEXICAL_MIN_TERMS:
+            return None
+
+        top_id, top_score = lexical_ranking[0]
+        top_document = lexical_index.documents[top_id]
+        if source_file and top_document.get('source_file') != source_file:
+            return None
+        if lexical_index.coverage(query, top_id) < 1.0:
+            return None
+
+        # The same question often appears in several files; compare against a different one
+        top_question = fold_accents(top_document.get('q', ''))
+        for doc_id, score in lexical_ranking[1:]:
+            if fold_accents(lexical_index.documents[doc_id].get('q', '')) != top_question:
+                if top_score < FAQ_LEXICAL_MARGIN * score:
+                    return None
+                break
+
+        return self._result_from_document(top_id, top_document, None)
+
+    def _fuse_results(self, vector_results: List[Dict], lexical_ranking: List,
+                      lexical_index: Optional[BM25Index]) -> List[Dict]:
+        """Merge vector and lexical rankings with reciprocal rank fusion (best first)"""
+        if not lexical_index or not lexical_ranking:
+            return vector_results
+
+        results_by_id = {result['doc_id']: result for result in vector_results}
+        fused = reciprocal_rank_fusion(
+            [[result['doc_id'] for result in vector_results], [doc_id for doc_id, _ in lexical_ranking]],
+            k=FAQ_RRF_K
+        )
 
-        except Exception as e:
-            print(f"Error searching knowledge base: {e}")
-            return []
+        fused_results = []
+        for doc_id, fused_score in fused:
+            result = results_by_id.get(doc_id)
+            if result is None:
+                # Only found lexically: no cosine score available
+                result = self._result_from_document(doc_id, lexical_index.documents[doc_id], None)
+            fused_results.append({**result, "fused_score": fused_score})
+        return fused_results
+
+    def _get_rerank_vectors(self) -> Optional[RerankVectors]:
+        """Full-precision vectors of the active version (only for quantized storage), cached per version"""
+        if 'rerank_vectors' not in self._version_cache:
+            rerank_vectors = None
+            if FAQ_EXACT_RERANK and self._version_cache.get('storage', 'float') != 'float':
+                try:
+                    rerank_vectors = RerankVectors.load_if_exists(rerank_vectors_path(self._collection_name))
+                    if rerank_vectors is None:
+                        logger.warning(f"No rerank vectors for {self._collection_name}; using approximate scores")
+                except Exception as e:
+                    logger.error(f"Error loading rerank vectors for {self._collection_name}: {e}")
+            self._version_cache['rerank_vectors'] = rerank_vectors
+        return self._version_cache['rerank_vectors']
+
+    def _result_from_document(self, doc_id, document, relevance_score: Optional[float]) -> Dict:
+        """Format a stored FAQ entry (Milvus entity or lexical document) as a search result"""
+        return {
+            "doc_id": str(doc_id),
+            "question": document.get('q', ''),
+            "sub_questions": document.get('sq', ''),
+            "answer": document.get('a', ''),
+            "text_reference": document.get('t', ''),
+            "tags": document.get('tags', ''),
+            "source_file": document.get('source_file', ''),
+            # Rows indexed before passage splitting are a whole answer: their own parent
+            "parent_id": document.get('parent_id') or str(doc_id),
+            "passage_index": document.get('passage_index') or 0,
+            "passage_count": document.get('passage_count') or 1,
+            "relevance_score": relevance_score
+        }
 
     def _perform_search(self, search_embedding: List[float], search_params: Dict,
-                       source_file: Optional[str] = None, limit: int = 1) -> List[Dict]:
+                       source_file: Optional[str] = None, limit: int = 1,
+                       group_by_field: Optional[str] = None) -> List[Dict]:
         """
         Perform actual search operation with optional file filtering
 
         Args:
-            search_embedding: The query embedding vector
+            search_embedding: The query embedding vector (full precision; encoded here for binary storage)
             search_params: Milvus search parameters
             source_file: Optional file to filter by
-            limit: Number of results to return
+            limit: Number of results to return (number of groups when grouping)
+            group_by_field: Optional scalar field to group by (one best hit per value)
 
         Returns:
             List of formatted search results
         """
         try:
-            # Build expression filter for source_file if provided
-            expr = None
-            if source_file:
-                # Escape single quotes in filename if any
-                escaped_filename = source_file.replace("'", "\\'")
-                expr = f"source_file == '{escaped_filename}'"
+            request = self._search_request(search_embedding, source_file, limit, group_by_field)
 
             # Perform the search
+            self._metrics['backend_requests'] += 1
             search_results = self._collection.search(  # type: ignore
-                data=[search_embedding],
+                data=[request['data']],
                 anns_field="embedding",
                 param=search_params,
-                limit=1,
-                expr=expr,  # Add the filter expression
-                output_fields=["q", "sq", "a", "t", "tags", "source_file"]
+                limit=request['limit'],
+                expr=request['expr'],  # Add the filter expression
+                output_fields=request['output_fields'],
+                **request['kwargs']
             )
 
-            # Format results as list of dictionaries
-            formatted_results = []
-
             # Process results - search_results is iterable and contains batches
-            for batch in search_results:  # type: ignore
-                for hit in batch:
-                    entity = hit.entity
-                    result = {
-                        "question": entity.get('q', ''),
-                        "sub_questions": entity.get('sq', ''),
-                        "answer": entity.get('a', ''),
-                        "text_reference": entity.get('t', ''),
-                        "tags": entity.get('tags', ''),
-                        "source_file": entity.get('source_file', ''),
-                        "relevance_score": hit.score
-                    }
-                    formatted_results.append(result)
-
-            return formatted_results
+            hits = [(hit.id, hit.entity, hit.score) for batch in search_results for hit in batch]  # type: ignore
+            return self._format_hits(hits, search_embedding, limit)
 
         except Exception as e:
             print(f"Error performing search: {e}")
             return []
 
+    def _search_request(self, search_embedding: List[float], source_file: Optional[str],
+                        limit: int, group_by_field: Optional[str]) -> Dict:
+        """Query vector, filter and limit of a vector search against the active version"""
+        # Build expression filter for source_file if provided
+        expr = None
+        if source_file:
+            # Escape single quotes in filename if any
+            escaped_filename = source_file.replace("'", "\\'")
+            expr = f"source_file == '{escaped_filename}'"
+
+        kwargs = {}
+        if group_by_field:
+            kwargs["group_by_field"] = group_by_field
+
+        storage = self._version_cache.get('storage', 'float')
+        # Over-fetch from the quantized index so the exact rerank can fix its ordering
+        search_limit = max(limit, FAQ_RERANK_CANDIDATES) if self._get_rerank_vectors() and not group_by_field else limit
+
+        return {
+            'data': binarize(search_embedding) if storage == 'binary' else search_embedding,
+            'expr': expr,
+            'limit': search_limit,
+            'output_fields': self._version_cache.get('output_fields', FAQ_OUTPUT_FIELDS),
+            'kwargs': kwargs
+        }
+
+    def _format_hits(self, hits: List, search_embedding: List[float], limit: int) -> List[Dict]:
+        """Format (id, entity, score) hits as search results, rescoring them for quantized storage"""
+        storage = self._version_cache.get('storage', 'float')
+        formatted_results = []
+        for doc_id, entity, score in hits:
+            if storage == 'binary':
+                # Hamming distance -> approximate cosine, comparable to the thresholds
+                score = hamming_to_cosine(score, self._version_cache.get('vector_dim') or 1)
+            formatted_results.append(self._result_from_document(doc_id, entity, score))
+
+        rerank_vectors = self._get_rerank_vectors()
+        if rerank_vectors:
+            formatted_results = exact_rerank(formatted_results, search_embedding, rerank_vectors)[:limit]
+
+        return formatted_results
+
 
 # Function to get the tool for CrewAI
 def get_knowledge_search_tool() -> KnowledgeSearchTool:
@@ -1,13 +1,12 @@
 # Importa configurações globais (inclui desabilitação do OpenTelemetry)
-from typing import Any, Optional, Dict
+from typing import Optional
 from cache.redis_chat_session_manager import RedisChatSessionManager
 from crews.chat_crew.chat_crew import ChatCrew
 from human_handoff.human_handoff import HumanHandoffManager
 from scoring.consorcio_scoring import ConsorcioLeadScoring
 from whatsapp.client import WhatsAppClient
 from datetime import datetime
-from database.config import SessionLocal
-from database.models import ConversationHistory
+from database.history_writer import history_writer
 from crews.chat_crew.chat_flow import ChatFlow
 from fastapi import FastAPI, Request, HTTPException
 from database.database_client import DatabaseClient
@@ -27,14 +26,12 @@ class WhatsAppWebhookHandler:
         self.whatsapp_client = WhatsAppClient()
         self.session_manager = RedisChatSessionManager()
         self.database_client = DatabaseClient()
-        self._db_write_queue = asyncio.Queue()
         # ✅ Uma única instância do ChatCrew para todos os usuários
         self.chat_crew = ChatCrew()
         self.human_handoff = HumanHandoffManager()
         self.consorcio_lead_scoring = ConsorcioLeadScoring()
         # ✅ Inicializa crews pré-criados para máxima performance
         self._initialized = False
-        self._db_worker_started = False
 
     async def _process_message(self, message: str, from_number: str):
         """
@@ -45,25 +42,20 @@ class WhatsAppWebhookHandler:
             await self.session_manager.initialize()
             self._initialized = True
 
-        # Inicia DB worker se necessário
-        if not self._db_worker_started:
-            asyncio.create_task(self._db_write_worker())
-            self._db_worker_started = True
+        # Sessão, histórico e lead em uma única ida ao Redis
+        context = await self.session_manager.load_context(from_number)
 
-        chat_flow = await self.session_manager.get_or_create_session(from_number)
+        # Mensagens do turno ficam em memória e vão ao Redis de uma vez no fim
+        turn_messages = [self.session_manager.turn_message("user", message)]
 
-        await self.session_manager.add_message_to_history(from_number, "user", message)
-
-        lead = self.database_client.get_lead({"whatsapp_number": from_number})
-
-        # Processa com o crew
-        response = await self._process_with_crew(chat_flow, from_number, message, lead)
-
-        # Adiciona resposta do bot ao histórico do Redis
-        await self.session_manager.add_message_to_history(from_number, "assistant", response)
-
-        # Atualiza sessão no Redis
-        await self.session_manager.update_session(chat_flow)
+        try:
+            # Processa com o crew
+            response = await self._process_with_crew(context, from_number, message)
+            turn_messages.append(self.session_manager.turn_message("assistant", response))
+        finally:
+            # Histórico (usuário + bot), trim, TTLs e sessão em uma única ida ao Redis;
+            # se o crew falhar a mensagem do usuário continua registrada
+            await self.session_manager.commit_turn(context, turn_messages)
 
         # Envia mensagem (descomente quando pronto)
         self.whatsapp_client.send_message(from_number, response)
@@ -76,87 +68,25 @@ class WhatsAppWebhookHandler:
 
     async def _queue_db_save(self, whatsapp_number: str, message_type: str, content: str):
         """
-        Agenda salvamento no banco para processamento assíncrono
+        Agenda salvamento no banco (gravado em lote pelo history_writer, fora do turno)
         """
-        await self._db_write_queue.put({
-            "whatsapp_number": whatsapp_number,
-            "message_type": message_type,
-            "content": content,
-            "timestamp": datetime.now()
-        })
+        await history_writer.enqueue(whatsapp_number, message_type, content, datetime.now())
 
-    async def _db_write_worker(self):
-        """
-        Worker assíncrono para escrever no banco sem bloquear o processamento
-        """
-        batch_size = 10
-        batch_timeout = 5  # segundos
-
-        while True:
-            try:
-                batch = []
-
-                # Coleta batch de mensagens
-                try:
-                    # Primeiro item (bloqueia até ter pelo menos um)
-                    item = await self._db_write_queue.get()
-                    batch.append(item)
-
-                    # Itens adicionais (não bloqueia)
-                    for _ in range(batch_size - 1):
-                        try:
-                            item = await asyncio.wait_for(
-                                self._db_write_queue.get(),
-                                timeout=batch_timeout
-                            )
-                            batch.append(item)
-                        except asyncio.TimeoutError:
-                            break
-
-                except Exception as e:
-                    logger.error(f"Erro ao coletar batch: {e}")
-                    continue
-
-                # Salva batch no banco
-                if batch:
-                    await self._save_batch_to_db(batch)
-
-            except Exception as e:
-                logger.error(f"Erro no DB worker: {e}")
-                await asyncio.sleep(1)
-
-    async def _save_batch_to_db(self, batch: list):
-        """
-        Salva batch de mensagens no banco
-        """
-        db = SessionLocal()
-        try:
-            for item in batch:
-                conversation = ConversationHistory(
-                    whatsapp_number=item["whatsapp_number"],
-                    message_type=item["message_type"],
-                    content=item["content"],
-                    timestamp=item["timestamp"]
-                )
-                db.add(conversation)
-
-            db.commit()
-            logger.info(f"Batch salvo: {len(batch)} mensagens")
-
-        except Exception as e:
-            logger.error(f"Erro ao salvar batch: {e}")
-            db.rollback()
-        finally:
-            db.close()
-
-    async def _process_with_crew(self, chat_flow, whatsapp_number: str, message: str, lead: Dict[str, Any]) -> str:
-        """Processa mensagem com o ChatCrew usando histórico do Redis"""
+    async def _process_with_crew(self, context, whatsapp_number: str, message: str) -> str:
+        """Processa mensagem com o ChatCrew usando o contexto carregado do Redis"""
 
         # ✅ Usa a instância única do ChatCrew
         crew = self.chat_crew
 
-        # Obtém histórico atualizado do Redis
-        conversation_history = await self.session_manager.get_conversation_history(whatsapp_number)
+        chat_flow = context.chat_flow
+        # Lead como estava no PostgreSQL antes deste turno
+        lead = context.lead
+
+        # Histórico já carregado; a mensagem atual só é gravada no fim do turno
+        conversation_history = context.history_text(self.session_manager.history_limit - 1)
+        conversation_history = "\n".join(filter(None, [conversation_history, f"user: {message}"]))
+        # Mesmas mensagens estruturadas para o handoff (sem reparsear o texto)
+        recent_messages = context.history + [self.session_manager.turn_message("user", message)]
 
         # ✅ Cria crew condicional baseado no estado atual
         qualification_crew = crew.get_crew(message, chat_flow.state.model_dump())
@@ -187,13 +117,15 @@ class WhatsAppWebhookHandler:
         scoring = self.consorcio_lead_scoring.calculate_score(new_state)
         chat_flow.state.lead_score = scoring.get("score", 0)
 
-        self.database_client.upsert_lead(chat_flow.state.model_dump())
+        # Só as colunas que mudaram em relação ao lead da sessão (nenhuma instrução se nada mudou);
+        # o snapshot só recebe o que foi gravado, o resto volta no diff do próximo turno
+        persisted = await self.database_client.upsert_lead(chat_flow.state.model_dump(), lead)
+        context.lead = {**lead, **persisted}
 
         if chat_flow.state.requires_human_handoff or (chat_flow.state.is_complete == True and lead.get("is_complete") == False):
             if chat_flow.state.is_complete == True and lead.get("is_complete") == False:
                 new_state["mensagem"] = new_state.get("mensagem") + "\nSeus dados estão completos! Já vou te passar para um especialista que vai te ajudar com todos os detalhes. Obrigado por falar comigo 😊"
-            await self.session_manager.add_message_to_history(whatsapp_number, "assistant", new_state.get("mensagem"))
-            self.human_handoff.send_lead_to_zenvia(new_state, scoring, new_state.get("mensagem"), conversation_history)
+            self.human_handoff.send_lead_to_zenvia(new_state, scoring, new_state.get("mensagem"), recent_messages)
 
         return new_state.get("mensagem")
 
@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import pytest
+
+from cache.codec import CODECS, RedisCodec, zstandard
+
+SESSION = {'state': {'nome': 'Ana', 'renda': 5200.5, 'is_complete': False}, 'stage': 'qualificacao', 'score': 42}
+HISTORY = [
+    {'type': 'user', 'content': 'Olá, quero simular um consórcio', 'timestamp': '2025-03-01T10:00:00'},
+    {'type': 'assistant', 'content': 'Claro! Qual o valor do bem?', 'timestamp': '2025-03-01T10:00:05'},
+]
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+def test_round_trip(codec):
+    redis_codec = RedisCodec(codec=codec, compression='none')
+    assert redis_codec.decode(redis_codec.encode(SESSION)) == SESSION
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+def test_non_str_keys_become_strings(codec):
+    redis_codec = RedisCodec(codec=codec, compression='none')
+    assert redis_codec.decode(redis_codec.encode({1: 'a', 'b': {2: 'c'}})) == {'1': 'a', 'b': {'2': 'c'}}
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+def test_unknown_types_use_str(codec):
+    redis_codec = RedisCodec(codec=codec, compression='none')
+    assert isinstance(redis_codec.decode(redis_codec.encode({'value': object()}))['value'], str)
+
+
+def test_plain_json_is_readable():
+    # Valores gravados antes do codec (JSON puro, também como str)
+    assert RedisCodec(codec='json', compression='none').decode('{"a": [1, 2]}') == {'a': [1, 2]}
+    assert RedisCodec(codec='json', compression='none').decode(None) is None
+
+
+def test_unknown_header_is_rejected():
+    with pytest.raises(ValueError):
+        RedisCodec(codec='json', compression='none').decode(b'\xffx{}')
+
+
+@pytest.mark.skipif(zstandard is None, reason="zstandard não instalado")
+class TestZstd:
+    def test_large_value_is_compressed_with_header(self):
+        redis_codec = RedisCodec(codec='json', compression='zstd', threshold=64)
+        value = {'content': 'consórcio ' * 200}
+        data = redis_codec.encode(value)
+        assert data[:2] == b'\xffz'
+        assert len(data) < len(RedisCodec(codec='json', compression='none').encode(value))
+        assert redis_codec.decode(data) == value
+
+    def test_small_value_stays_plain_json(self):
+        redis_codec = RedisCodec(codec='json', compression='zstd', threshold=512)
+        data = redis_codec.encode(SESSION)
+        assert data[:1] == b'{'
+        assert redis_codec.decode(data) == SESSION
+
+    def test_uncompressed_reader_decodes_compressed_value(self):
+        data = RedisCodec(codec='json', compression='zstd', threshold=0).encode({'content': 'x' * 1000})
+        assert RedisCodec(codec='json', compression='none').decode(data) == {'content': 'x' * 1000}
+
+    def test_incompressible_value_is_not_compressed(self):
+        redis_codec = RedisCodec(codec='json', compression='zstd', threshold=0)
+        assert redis_codec.encode('a')[:1] != b'\xff'
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        RedisCodec(codec='msgpack')
+
+
+class TestHistory:
+    codec = RedisCodec(codec='json', compression='none')
+
+    def test_item_is_compact(self):
+        assert self.codec.decode(self.codec.encode_history_item(HISTORY[0]))[0] == 'u'
+
+    def test_item_round_trip(self):
+        for item in HISTORY:
+            assert self.codec.decode_history_item(self.codec.encode_history_item(item)) == item
+
+    def test_datetime_timestamp(self):
+        item = {'type': 'assistant', 'content': 'oi', 'timestamp': datetime(2025, 3, 1, 10, 0, 5)}
+        decoded = self.codec.decode_history_item(self.codec.encode_history_item(item))
+        assert decoded == {'type': 'assistant', 'content': 'oi', 'timestamp': '2025-03-01T10:00:05'}
+
+    def test_legacy_object_item(self):
+        assert self.codec.decode_history_item(self.codec._dumps(HISTORY[1])) == HISTORY[1]
+
+    def test_whole_history_round_trip(self):
+        assert self.codec.decode_history(self.codec.encode_history(HISTORY)) == HISTORY
+        assert self.codec.decode_history(self.codec.encode([])) == []
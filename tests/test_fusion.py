@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import pytest
+
+from knowledge.lexical_index import reciprocal_rank_fusion
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['c', 'a']], k=60)
+    assert [doc_id for doc_id, _ in fused] == ['a', 'c', 'b']
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[2][1] == pytest.approx(1 / 62)
+
+
+def test_reciprocal_rank_fusion_single_ranking_keeps_order():
+    assert [doc_id for doc_id, _ in reciprocal_rank_fusion([['x', 'y', 'z']])] == ['x', 'y', 'z']
+
+
+def test_reciprocal_rank_fusion_empty():
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+class TestFuseResults:
+    """KnowledgeSearchTool._fuse_results (needs the search tool's dependencies)"""
+
+    @pytest.fixture(autouse=True)
+    def tool(self):
+        pytest.importorskip('pymilvus')
+        pytest.importorskip('crewai')
+        from tools.knowledge_search_tool import KnowledgeSearchTool
+        self.fuse = KnowledgeSearchTool._fuse_results
+        self.tool = SimpleNamespace(
+            _result_from_document=lambda doc_id, document, score:
+                KnowledgeSearchTool._result_from_document(None, doc_id, document, score)
+        )
+
+    def vector(self, doc_id, score):
+        return {'doc_id': doc_id, 'question': f"q{doc_id}", 'relevance_score': score}
+
+    def test_without_lexical_ranking_returns_vector_results(self):
+        vector_results = [self.vector('1', 0.9)]
+        assert self.fuse(self.tool, vector_results, [], None) is vector_results
+        assert self.fuse(self.tool, vector_results, [('1', 3.0)], None) is vector_results
+
+    def test_fuses_and_adds_lexical_only_documents(self):
+        lexical_index = SimpleNamespace(documents={'2': {'q': 'q2', 'a': 'resposta'}, '1': {'q': 'q1'}})
+        results = self.fuse(
+            self.tool, [self.vector('1', 0.9), self.vector('3', 0.8)], [('2', 5.0), ('1', 4.0)], lexical_index
+        )
+        assert [result['doc_id'] for result in results] == ['1', '2', '3']
+        assert results[0]['relevance_score'] == 0.9
+        # Só encontrado pelo BM25: sem score de cosseno
+        assert results[1]['relevance_score'] is None and results[1]['answer'] == 'resposta'
+        assert all('fused_score' in result for result in results)
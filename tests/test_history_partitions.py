@@ -0,0 +1,40 @@
+from datetime import date
+
+import pytest
+
+from database.history_partitions import _add_months, _partition_month, partition_name
+
+
+@pytest.mark.parametrize('month, months, expected', [
+    (date(2025, 1, 1), 0, date(2025, 1, 1)),
+    (date(2025, 1, 1), 1, date(2025, 2, 1)),
+    (date(2025, 11, 1), 2, date(2026, 1, 1)),
+    (date(2025, 12, 1), 1, date(2026, 1, 1)),
+    (date(2025, 1, 1), -1, date(2024, 12, 1)),
+    (date(2025, 3, 1), -12, date(2024, 3, 1)),
+    (date(2025, 3, 1), -27, date(2022, 12, 1)),
+    (date(2025, 3, 1), 25, date(2027, 4, 1)),
+])
+def test_add_months(month, months, expected):
+    assert _add_months(month, months) == expected
+
+
+def test_partition_name():
+    assert partition_name(date(2025, 3, 1)) == 'conversation_history_p2025_03'
+    assert partition_name(date(2025, 12, 1)) == 'conversation_history_p2025_12'
+
+
+def test_partition_month_round_trip():
+    for month in (date(2024, 1, 1), date(2025, 9, 1), date(2025, 12, 1)):
+        assert _partition_month(partition_name(month)) == month
+
+
+@pytest.mark.parametrize('name', [
+    'conversation_history_default',
+    'conversation_history',
+    'conversation_history_p2025_3',
+    'conversation_history_p2025_03_old',
+    'other_table_p2025_03',
+])
+def test_partition_month_ignores_other_tables(name):
+    assert _partition_month(name) is None
@@ -0,0 +1,48 @@
+from datetime import date, datetime
+
+from sqlalchemy.dialects import postgresql
+
+from database.history_writer import _transcript_statement
+
+ROWS = [
+    ('5522', 'user', 'oi', datetime(2025, 3, 31, 23, 59, 50)),
+    ('5511', 'user', 'quero um consórcio', datetime(2025, 3, 31, 23, 59, 58)),
+    ('5511', 'assistant', 'claro', datetime(2025, 4, 1, 0, 0, 3)),
+    ('5511', 'user', 'de carro', datetime(2025, 4, 1, 0, 0, 9)),
+]
+
+
+def compiled(rows):
+    return _transcript_statement(rows).compile(dialect=postgresql.dialect())
+
+
+def segments(rows):
+    params = compiled(rows).params
+    count = sum(1 for name in params if name.startswith('month_m'))
+    return [
+        {name: params[f"{name}_m{index}"] for name in ('whatsapp_number', 'month', 'messages', 'message_count', 'started_at', 'updated_at')}
+        for index in range(count)
+    ]
+
+
+def test_one_segment_per_number_and_month_in_key_order():
+    keys = [(segment['whatsapp_number'], segment['month']) for segment in segments(ROWS)]
+    assert keys == [('5511', date(2025, 3, 1)), ('5511', date(2025, 4, 1)), ('5522', date(2025, 3, 1))]
+
+
+def test_segment_messages_and_bounds():
+    april = segments(ROWS)[1]
+    assert april['messages'] == [
+        {'type': 'assistant', 'content': 'claro', 'timestamp': '2025-04-01T00:00:03'},
+        {'type': 'user', 'content': 'de carro', 'timestamp': '2025-04-01T00:00:09'},
+    ]
+    assert april['message_count'] == 2
+    assert april['started_at'] == datetime(2025, 4, 1, 0, 0, 3)
+    assert april['updated_at'] == datetime(2025, 4, 1, 0, 0, 9)
+
+
+def test_appends_to_the_segment():
+    sql = str(compiled(ROWS))
+    assert 'ON CONFLICT (whatsapp_number, month) DO UPDATE' in sql
+    assert 'conversation_transcripts.messages || excluded.messages' in sql
+    assert 'started_at' not in sql.split('DO UPDATE')[1]
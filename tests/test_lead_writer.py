@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from database import lead_writer as writer_module
+from database.lead_writer import LeadWriter, lead_changes
+
+STATE = {'whatsapp_number': '5511', 'nome': 'Ana', 'cpf': None, 'renda': 5200.0, 'conversation_stage': 'dados'}
+LEAD = {'nome': 'Ana', 'renda': 4000.0, 'conversation_stage': 'dados'}
+
+
+class TestLeadChanges:
+    def test_only_changed_columns(self):
+        assert lead_changes(STATE, LEAD) == {'renda': 5200.0}
+
+    def test_without_snapshot_every_column(self):
+        assert lead_changes(STATE, None) == {'nome': 'Ana', 'renda': 5200.0, 'conversation_stage': 'dados'}
+
+    def test_new_lead(self):
+        assert lead_changes(STATE, {}) == lead_changes(STATE, None)
+
+    def test_none_does_not_clear_column(self):
+        assert 'cpf' not in lead_changes(STATE, {'cpf': '123'})
+
+    def test_ignores_non_lead_keys(self):
+        assert lead_changes({**STATE, 'mensagem': 'oi', 'requires_human_handoff': True}, {**LEAD, 'renda': 5200.0}) == {}
+
+    def test_unchanged(self):
+        assert lead_changes(STATE, {**LEAD, 'renda': 5200.0}) == {}
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    writer = LeadWriter()
+    writer._reset()
+    writer.written = []
+    writer.fail = False
+
+    async def write(leads):
+        if writer.fail:
+            raise RuntimeError('banco fora')
+        writer.written.append(leads)
+
+    monkeypatch.setattr(writer, '_write', write)
+    monkeypatch.setattr(writer, '_schedule_flush', lambda: None)
+    yield writer
+    writer._reset()
+
+
+def save(writer, data, previous):
+    return asyncio.run(writer.save(data, previous))
+
+
+class TestSave:
+    def test_writes_changes(self, writer):
+        assert save(writer, STATE, LEAD) == {'renda': 5200.0}
+        assert writer.written == [{'5511': {'renda': 5200.0}}]
+
+    def test_unchanged_turn_writes_nothing(self, writer):
+        assert save(writer, STATE, {**LEAD, 'renda': 5200.0}) == {}
+        assert writer.written == []
+        assert writer.get_stats()['unchanged'] == 1
+
+    def test_failed_write_persists_nothing(self, writer):
+        writer.fail = True
+        assert save(writer, STATE, LEAD) == {}
+        assert writer.get_stats()['errors'] == 1
+
+    def test_missing_number(self, writer):
+        assert save(writer, {**STATE, 'whatsapp_number': None}, LEAD) == {}
+
+
+@pytest.fixture
+def write_behind(monkeypatch, writer):
+    monkeypatch.setattr(writer_module, 'LEAD_WRITE_BEHIND', True)
+    return writer
+
+
+class TestWriteBehind:
+    def test_deferred_change_is_not_reported(self, write_behind):
+        assert save(write_behind, STATE, LEAD) == {}
+        assert write_behind.written == []
+        assert write_behind._pending == {'5511': {'renda': 5200.0}}
+
+    def test_pending_follows_state(self, write_behind):
+        save(write_behind, STATE, LEAD)
+        save(write_behind, {**STATE, 'renda': 6000.0}, LEAD)
+        assert write_behind._pending == {'5511': {'renda': 6000.0}}
+        # Voltou ao valor gravado: nada a gravar
+        save(write_behind, {**STATE, 'renda': 4000.0}, LEAD)
+        assert write_behind._pending == {}
+
+    def test_flush_now_column_writes_pending(self, write_behind):
+        save(write_behind, STATE, LEAD)
+        persisted = save(write_behind, {**STATE, 'conversation_stage': 'proposta'}, LEAD)
+        assert persisted == {'renda': 5200.0, 'conversation_stage': 'proposta'}
+        assert write_behind.written == [{'5511': persisted}]
+        assert write_behind._pending == {}
+
+    def test_new_lead_is_written_immediately(self, write_behind):
+        assert save(write_behind, STATE, {}) == {'nome': 'Ana', 'renda': 5200.0, 'conversation_stage': 'dados'}
+
+    def test_flushed_columns_are_reported_on_next_save(self, write_behind):
+        save(write_behind, STATE, LEAD)
+        asyncio.run(write_behind.flush())
+        assert write_behind.written == [{'5511': {'renda': 5200.0}}]
+        # O snapshot ainda não tem a renda: o save seguinte a devolve sem regravar
+        assert save(write_behind, STATE, LEAD) == {'renda': 5200.0}
+        assert write_behind.written == [{'5511': {'renda': 5200.0}}]
+        assert save(write_behind, STATE, {**LEAD, 'renda': 5200.0}) == {}
+
+    def test_failed_flush_keeps_pending(self, write_behind):
+        save(write_behind, STATE, LEAD)
+        write_behind.fail = True
+        asyncio.run(write_behind.flush())
+        assert write_behind._pending == {'5511': {'renda': 5200.0}}
+
+    def test_failed_immediate_write_goes_back_to_pending(self, write_behind):
+        write_behind.fail = True
+        assert save(write_behind, {**STATE, 'conversation_stage': 'proposta'}, LEAD) == {}
+        assert write_behind._pending == {'5511': {'renda': 5200.0, 'conversation_stage': 'proposta'}}
@@ -0,0 +1,61 @@
+from knowledge.passages import best_snippet, embedding_text, expand_passages, parent_id_for, split_passages
+
+ANSWER = (
+    "O consórcio é uma modalidade de compra coletiva. "
+    "Os participantes pagam parcelas mensais para um fundo comum. "
+    "Todo mês há contemplações por sorteio ou lance! "
+    "Quem é contemplado recebe a carta de crédito?"
+)
+
+
+def test_short_text_is_one_passage():
+    assert split_passages('  Resposta curta.  ', 100) == ['Resposta curta.']
+    assert split_passages('', 100) == ['']
+    assert split_passages(None, 100) == ['']
+
+
+def test_passages_keep_whole_sentences_within_limit():
+    passages = split_passages(ANSWER, 120)
+    assert len(passages) > 1
+    assert all(len(passage) <= 120 for passage in passages)
+    assert all(passage.endswith(('.', '!', '?')) for passage in passages)
+    assert ' '.join(passages) == ANSWER
+
+
+def test_sentences_are_packed_together():
+    passages = split_passages(ANSWER, 110)
+    assert passages[0] == "O consórcio é uma modalidade de compra coletiva. Os participantes pagam parcelas mensais para um fundo comum."
+
+
+def test_long_sentence_is_split_at_words():
+    sentence = ' '.join(['palavra'] * 40)
+    passages = split_passages(sentence, 50)
+    assert all(len(passage) <= 50 for passage in passages)
+    assert ' '.join(passages) == sentence
+
+
+def test_expand_passages():
+    entry = {'q': 'O que é consórcio?', 'sq': 'como funciona', 'a': ANSWER, 'source_file': 'faq.txt'}
+    documents = expand_passages([entry, {**entry, 'q': 'Outra', 'a': 'Curta.'}], max_chars=120)
+    split, single = documents[:-1], documents[-1]
+    assert [document['passage_index'] for document in split] == list(range(len(split)))
+    assert {document['passage_count'] for document in split} == {len(split)}
+    assert {document['parent_id'] for document in split} == {parent_id_for(entry)}
+    assert single['passage_count'] == 1 and single['parent_id'] != parent_id_for(entry)
+
+
+def test_parent_id_is_stable_per_file_and_question():
+    entry = {'q': 'O que é consórcio?', 'source_file': 'faq.txt'}
+    assert parent_id_for(entry) == parent_id_for(dict(entry))
+    assert parent_id_for(entry) != parent_id_for({**entry, 'source_file': 'outro.txt'})
+
+
+def test_embedding_text_includes_answer_only_for_split_entries():
+    document = {'q': 'Q', 'sq': 'SQ', 'a': 'A'}
+    assert embedding_text(document) == 'Q SQ'
+    assert embedding_text({**document, 'passage_count': 2}) == 'Q SQ A'
+
+
+def test_best_snippet():
+    assert best_snippet('sorteio', 'Curta.', 100) == 'Curta.'
+    assert 'sorteio' in best_snippet('sorteio ou lance', ANSWER, 60)
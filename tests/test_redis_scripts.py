@@ -0,0 +1,253 @@
+import asyncio
+
+import pytest
+from redis.exceptions import NoScriptError
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')
+
+from cache import redis_session_manager as manager  # noqa: E402
+from cache.keys import history_key, lead_key, legacy_history_key, legacy_session_key, session_key  # noqa: E402
+from cache.redis_session_manager import RedisClient, redis_client  # noqa: E402
+
+NUMBER = '5511999990000'
+
+
+def message(content, message_type='user'):
+    return redis_client.history_item(message_type, content)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(manager, 'REDIS_CLUSTER', False)
+    monkeypatch.setattr(manager, 'REDIS_LEGACY_KEYS', True)
+    monkeypatch.setattr(redis_client, '_cluster_scripts', set())
+    # Um cliente por event loop (cada teste roda no seu asyncio.run)
+    clients = {}
+
+    def pool(self):
+        loop = asyncio.get_running_loop()
+        if loop not in clients:
+            clients[loop] = fakeredis.FakeAsyncRedis(server=server)
+        return clients[loop]
+
+    monkeypatch.setattr(RedisClient, '_pool', property(pool))
+    return redis_client
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestCommitTurn:
+    def test_first_turn(self, redis):
+        async def scenario():
+            record = await redis.commit_turn(NUMBER, [message('oi'), message('olá', 'assistant')], {'stage': 'inicio'})
+            context = await redis.get_turn_context(NUMBER, 10)
+            return record, context
+
+        record, (session, history) = run(scenario())
+        assert record.version == 1 and record.data == {'stage': 'inicio'}
+        assert session.data == {'stage': 'inicio'} and session.version == 1
+        assert [item['content'] for item in history] == ['oi', 'olá']
+
+    def test_writes_only_changed_fields(self, redis):
+        async def scenario():
+            base = await redis.commit_turn(NUMBER, [], {'stage': 'inicio', 'nome': 'Ana'})
+            # Marca no campo que o turno não muda: continua lá se só 'stage' for gravado
+            await redis._pool.hset(session_key(NUMBER), 'nome', '"marcado"')
+            record = await redis.commit_turn(NUMBER, [], {'stage': 'dados', 'nome': 'Ana'}, base=base)
+            session, _ = await redis.get_turn_context(NUMBER, 10)
+            return record, session
+
+        record, session = run(scenario())
+        assert record.version == 2 and record.data == {'stage': 'dados', 'nome': 'Ana'}
+        assert session.data == {'stage': 'dados', 'nome': 'marcado'}
+
+    def test_conflict_rebases_on_the_other_write(self, redis):
+        async def scenario():
+            base = await redis.commit_turn(NUMBER, [], {'stage': 'inicio', 'nome': 'Ana'})
+            # Outro writer grava no meio do turno
+            await redis.commit_turn(NUMBER, [], {'stage': 'inicio', 'nome': 'Ana Maria'}, base=base)
+            record = await redis.commit_turn(NUMBER, [message('oi')], {'stage': 'dados', 'nome': 'Ana'}, base=base)
+            session, history = await redis.get_turn_context(NUMBER, 10)
+            return record, session, history
+
+        record, session, history = run(scenario())
+        assert record.version == 3
+        # O campo que este turno não mudou fica com o valor do outro writer
+        assert session.data == {'stage': 'dados', 'nome': 'Ana Maria'}
+        assert [item['content'] for item in history] == ['oi']
+
+    def test_history_is_trimmed(self, redis, monkeypatch):
+        monkeypatch.setattr(manager, 'HISTORY_MAX_MESSAGES', 3)
+
+        async def scenario():
+            await redis.commit_turn(NUMBER, [message(str(index)) for index in range(5)], {'stage': 'inicio'})
+            return await redis.get_turn_context(NUMBER, 10)
+
+        _, history = run(scenario())
+        assert [item['content'] for item in history] == ['2', '3', '4']
+
+    def test_legacy_json_session_becomes_hash(self, redis):
+        async def scenario():
+            await redis._pool.set(session_key(NUMBER), '{"stage": "antigo"}')
+            legacy, _ = await redis.get_turn_context(NUMBER, 10)
+            record = await redis.commit_turn(NUMBER, [], {'stage': 'novo'}, base=legacy)
+            return legacy, record, await redis._pool.type(session_key(NUMBER))
+
+        legacy, record, key_type = run(scenario())
+        assert legacy.data == {'stage': 'antigo'} and legacy.version == 0
+        assert record is not None and key_type == b'hash'
+
+
+class TestHydrateAndSpill:
+    def test_hydrate_does_not_overwrite_live_session(self, redis):
+        async def scenario():
+            await redis.commit_turn(NUMBER, [message('ao vivo')], {'stage': 'ao vivo'})
+            results = await redis.hydrate([
+                (NUMBER, {'stage': 'banco'}, [message('banco')]),
+                ('5522', {'stage': 'banco'}, [message('a'), message('b')]),
+            ])
+            return results, await redis.get_turn_context(NUMBER, 10), await redis.get_turn_context('5522', 10)
+
+        results, (live, _), (hydrated, history) = run(scenario())
+        assert results[0] is None and results[1].version == 1
+        assert live.data == {'stage': 'ao vivo'}
+        assert hydrated.data == {'stage': 'banco'}
+        assert [item['content'] for item in history] == ['a', 'b']
+
+    def test_spill_keeps_conversation_with_new_turn(self, redis):
+        async def scenario():
+            record = await redis.commit_turn(NUMBER, [message('oi')], {'stage': 'inicio'})
+            await redis.commit_turn('5522', [message('oi')], {'stage': 'inicio'})
+            await redis.commit_turn(NUMBER, [message('de novo')], {'stage': 'dados'}, base=record)
+            results = await redis.spill([(NUMBER, record.version), ('5522', 1)])
+            return results, await redis._pool.exists(session_key(NUMBER), session_key('5522'))
+
+        results, remaining = run(scenario())
+        assert results == [False, True]
+        assert remaining == 1
+
+
+class TestLeadProjection:
+    def test_older_version_is_discarded(self, redis):
+        async def scenario():
+            written = await redis.set_leads([(NUMBER, {'nome': 'Ana'}, 200), (NUMBER, {'nome': 'Antiga'}, 100)], 60)
+            return written, await redis.get_lead(NUMBER)
+
+        written, lead = run(scenario())
+        assert written == [True, False]
+        assert lead == ({'nome': 'Ana'}, 200)
+
+    def test_negative_entry_and_ttl(self, redis):
+        async def scenario():
+            await redis.set_leads([(NUMBER, {}, 0)], 60)
+            return await redis.get_lead(NUMBER), await redis._pool.ttl(lead_key(NUMBER))
+
+        lead, ttl = run(scenario())
+        assert lead == ({}, 0)
+        assert 0 < ttl <= 60
+
+    def test_missing_lead(self, redis):
+        assert run(redis.get_lead(NUMBER)) is None
+
+
+class TestLegacyKeys:
+    def test_legacy_conversation_is_adopted(self, redis):
+        async def scenario():
+            await redis._pool.hset(legacy_session_key(NUMBER), mapping={'stage': '"antigo"'})
+            await redis._pool.expire(legacy_session_key(NUMBER), 500)
+            await redis._pool.rpush(legacy_history_key(NUMBER), '{"type": "user", "content": "oi", "timestamp": "2025-03-01T10:00:00"}')
+            context = await redis.get_turn_context(NUMBER, 10)
+            keys = sorted(await redis._pool.keys('*'))
+            return context, keys, await redis._pool.ttl(session_key(NUMBER))
+
+        (session, history), keys, ttl = run(scenario())
+        assert session.data == {'stage': 'antigo'}
+        assert [item['content'] for item in history] == ['oi']
+        assert keys == sorted([history_key(NUMBER).encode(), session_key(NUMBER).encode()])
+        assert 0 < ttl <= 500
+
+    def test_new_session_is_not_overwritten(self, redis):
+        async def scenario():
+            await redis.commit_turn(NUMBER, [], {'stage': 'novo'})
+            await redis._pool.hset(legacy_session_key(NUMBER), mapping={'stage': '"antigo"'})
+            session, _ = await redis.get_turn_context(NUMBER, 10)
+            return session, await redis._pool.exists(legacy_session_key(NUMBER))
+
+        session, legacy_exists = run(scenario())
+        assert session.data == {'stage': 'novo'}
+        assert legacy_exists == 1
+
+    def test_disabled(self, redis, monkeypatch):
+        monkeypatch.setattr(manager, 'REDIS_LEGACY_KEYS', False)
+
+        async def scenario():
+            await redis._pool.hset(legacy_session_key(NUMBER), mapping={'stage': '"antigo"'})
+            return await redis.get_turn_context(NUMBER, 10)
+
+        assert run(scenario()) == (None, [])
+
+
+class ClusterLikePipeline:
+    """
+    Pipeline que, como o ClusterPipeline, não é um redis.asyncio.client.Pipeline: o
+    Script não o registra e o execute manda EVALSHA sem carregar o script antes
+    """
+
+    def __init__(self, pipe):
+        self._pipe = pipe
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._pipe.reset()
+
+    def __getattr__(self, name):
+        return getattr(self._pipe, name)
+
+
+@pytest.fixture
+def cluster(redis, monkeypatch):
+    monkeypatch.setattr(manager, 'REDIS_CLUSTER', True)
+    monkeypatch.setattr(RedisClient, '_pipeline', lambda self, transaction=False: ClusterLikePipeline(self._pool.pipeline(transaction=False)))
+    return redis
+
+
+class TestClusterPipeline:
+    def test_unloaded_script_fails_without_load(self, cluster):
+        async def scenario():
+            script = cluster._pool.register_script(manager._SET_LEAD_SCRIPT)
+            async with cluster._pipeline() as pipe:
+                await script(keys=[lead_key(NUMBER)], args=[1, 60, b'{}'], client=pipe)
+                await pipe.execute()
+
+        with pytest.raises(NoScriptError):
+            run(scenario())
+
+    def test_scripts_are_loaded_before_the_pipeline(self, cluster):
+        async def scenario():
+            written = await cluster.set_leads([(NUMBER, {'nome': 'Ana'}, 200)], 60)
+            hydrated = await cluster.hydrate([('5522', {'stage': 'banco'}, [message('a')])])
+            spilled = await cluster.spill([('5522', hydrated[0].version)])
+            return written, await cluster.get_lead(NUMBER), spilled
+
+        written, lead, spilled = run(scenario())
+        assert written == [True]
+        assert lead == ({'nome': 'Ana'}, 200)
+        assert spilled == [True]
+
+    def test_flushed_script_is_reloaded(self, cluster):
+        async def scenario():
+            await cluster.set_leads([(NUMBER, {'nome': 'Ana'}, 100)], 60)
+            # Failover / SCRIPT FLUSH: o processo ainda acha que o script está carregado
+            await cluster._pool.script_flush()
+            written = await cluster.set_leads([(NUMBER, {'nome': 'Ana Maria'}, 200)], 60)
+            return written, await cluster.get_lead(NUMBER)
+
+        written, lead = run(scenario())
+        assert written == [True]
+        assert lead == ({'nome': 'Ana Maria'}, 200)
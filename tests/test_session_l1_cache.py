@@ -0,0 +1,132 @@
+import pytest
+
+from cache import session_l1_cache as l1
+from cache.keys import history_key, session_key
+from cache.redis_session_manager import SessionRecord
+
+HISTORY = [{'type': 'user', 'content': 'oi', 'timestamp': '2025-03-01T10:00:00'}]
+
+
+def record(stage: str = 'inicio') -> SessionRecord:
+    return SessionRecord(data={'stage': stage}, version=1, fields={'stage': stage.encode('utf-8')})
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(l1, 'REDIS_L1_CACHE', True)
+    monkeypatch.setattr(l1, 'REDIS_CLUSTER', False)
+    cache = l1.SessionL1Cache()
+    cache._reset()
+    cache._connected = True
+    yield cache
+    cache._reset()
+
+
+def test_disconnected_cache_is_disabled(cache):
+    cache._connected = False
+    cache.put('5511', record(), HISTORY, cache.begin_read())
+    assert cache.get('5511') is None
+
+
+def test_put_and_get(cache):
+    cache.put('5511', record(), HISTORY, cache.begin_read())
+    session, history = cache.get('5511')
+    assert session.data == {'stage': 'inicio'}
+    assert history == HISTORY
+    # Cópia: alterar o histórico devolvido não altera o cache
+    history.append({'type': 'assistant', 'content': 'olá'})
+    assert cache.get('5511')[1] == HISTORY
+
+
+def test_put_after_invalidation_is_ignored(cache):
+    token = cache.begin_read()
+    cache._handle_invalidation([session_key('5511').encode('utf-8')])
+    cache.put('5511', record(), HISTORY, token)
+    assert cache.get('5511') is None
+    # Uma leitura iniciada depois da invalidação entra normalmente
+    cache.put('5511', record(), HISTORY, cache.begin_read())
+    assert cache.get('5511') is not None
+
+
+def test_invalidation_of_other_number_keeps_entry(cache):
+    token = cache.begin_read()
+    cache._handle_invalidation([history_key('5522').encode('utf-8')])
+    cache.put('5511', record(), HISTORY, token)
+    assert cache.get('5511') is not None
+
+
+def test_invalidation_drops_entry(cache):
+    cache.put('5511', record(), HISTORY, cache.begin_read())
+    cache._handle_invalidation([history_key('5511').encode('utf-8')])
+    assert cache.get('5511') is None
+    assert cache.get_stats()['invalidations'] == 1
+
+
+def test_legacy_key_invalidation_drops_entry(cache):
+    cache.put('5511', record(), HISTORY, cache.begin_read())
+    cache._handle_invalidation([b'session:5511'])
+    assert cache.get('5511') is None
+
+
+def test_flush_clears_everything(cache):
+    token = cache.begin_read()
+    cache.put('5511', record(), HISTORY, token)
+    cache._handle_invalidation(None)
+    assert cache.get('5511') is None
+    cache.put('5522', record(), HISTORY, token)
+    assert cache.get('5522') is None
+
+
+def test_own_write_invalidation_keeps_rewritten_entry(cache):
+    cache.put('5511', record(), HISTORY, cache.begin_read())
+    token = cache.expect_write('5511')
+    assert cache.get('5511') is None
+    cache.put('5511', record('proposta'), HISTORY, token)
+    cache._handle_invalidation([session_key('5511').encode('utf-8'), history_key('5511').encode('utf-8')])
+    assert cache.get('5511')[0].data == {'stage': 'proposta'}
+    stats = cache.get_stats()
+    assert stats['self_invalidations'] == 2
+    assert stats['invalidations'] == 0
+
+
+def test_failed_write_is_not_expected(cache):
+    token = cache.expect_write('5511')
+    cache.write_failed('5511')
+    cache.put('5511', record(), HISTORY, cache.begin_read())
+    cache._handle_invalidation([session_key('5511').encode('utf-8')])
+    assert cache.get('5511') is None
+    assert token < cache.begin_read()
+
+
+def test_lru_eviction_by_entries(cache, monkeypatch):
+    monkeypatch.setattr(l1, 'REDIS_L1_MAX_ENTRIES', 2)
+    for number in ('1', '2'):
+        cache.put(number, record(), HISTORY, cache.begin_read())
+    cache.get('1')
+    cache.put('3', record(), HISTORY, cache.begin_read())
+    assert cache.get('2') is None
+    assert cache.get('1') is not None and cache.get('3') is not None
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_eviction_by_bytes(cache, monkeypatch):
+    size = l1._entry_size(record(), HISTORY)
+    monkeypatch.setattr(l1, 'REDIS_L1_MAX_BYTES', size * 2)
+    for number in ('1', '2', '3'):
+        cache.put(number, record(), HISTORY, cache.begin_read())
+    stats = cache.get_stats()
+    assert stats['entries'] == 2
+    assert stats['bytes'] == size * 2
+
+
+def test_entry_larger_than_limit_is_not_cached(cache, monkeypatch):
+    monkeypatch.setattr(l1, 'REDIS_L1_MAX_BYTES', 10)
+    cache.put('5511', record(), HISTORY, cache.begin_read())
+    assert cache.get('5511') is None
+    assert cache.get_stats()['bytes'] == 0
+
+
+def test_put_replaces_entry_size(cache):
+    cache.put('5511', record(), HISTORY, cache.begin_read())
+    cache.put('5511', record(), HISTORY * 3, cache.begin_read())
+    assert cache.get_stats()['bytes'] == l1._entry_size(record(), HISTORY * 3)